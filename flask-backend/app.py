@@ -1,25 +1,50 @@
 import os
+import io
+import csv
 import uuid
 import re
-import traceback
-import psycopg2
-from flask import Flask, jsonify, request
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from psycopg2.extras import Json
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-from flask_jwt_extended import (
-    JWTManager, 
-    create_access_token, 
-    jwt_required, 
-    get_jwt_identity,
-    verify_jwt_in_request,
-    decode_token # <-- Added this import
-)
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_jwt_extended import JWTManager
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
-from google.cloud import storage
+from werkzeug.exceptions import HTTPException
+
+import bulk_import
+import compression
+import conditional
+import db_pool
+import logs
+import metrics
+import uploads
+from auth import auth_required, ops_required, current_username, current_user_id, issue_token, token_cache
+from cache import TTLCache
+from compression import CompressedBody, choose_encoding
+from derivatives import build_derivatives
+from hashing import HashingOverloaded, hash_password, verify_password, rehash_if_needed, hashing_stats
+from jobs import JobWorkerPool, enqueue_poster_job, get_job, set_progress, complete_job
+from pagination import parse_page_args, parse_ids, cursor_id, cursor_rank, encode_cursor
+from serialization import JSONEncoder, dumps, json_page, json_response
+from storage_client import (
+    get_storage_client, upload_stream, storage_stats, generate_upload_url, get_blob_metadata,
+    hash_stream, content_blob_name, upload_if_missing,
+)
+from user_cache import user_cache
+
+log = logs.get_logger(__name__)
 
 # Initialize Flask app and enable CORS
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+app.json_encoder = JSONEncoder
+logs.init_app(app)
+compression.init_app(app)
+uploads.init_app(app)
+conditional.init_app(app)
 
 # Configure JWT settings; ensure token lookup is only from headers
 app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "your-secret-key")
@@ -32,45 +57,103 @@ serializer = URLSafeTimedSerializer(app.config["JWT_SECRET_KEY"])
 # Cloud Storage bucket name (default to your bucket)
 BUCKET_NAME = os.environ.get("POSTER_BUCKET_NAME", "poster-app-photos-137340833578")
 
-def get_db_connection():
-    dbname = os.environ["DB_NAME"]
-    user = os.environ["DB_USER"]
-    password = os.environ["DB_PASSWORD"]
-    socket_path = os.environ["DB_HOST"]
-    try:
-        conn = psycopg2.connect(
-            dbname=dbname,
-            user=user,
-            password=password,
-            host=socket_path
-        )
-        return conn
-    except Exception as e:
-        print("‼️ Database connection failed:", e)
-        return None
+# Largest accepted photo (see uploads.py) and signed URL lifetime for direct uploads
+MAX_PHOTO_BYTES = uploads.MAX_PHOTO_BYTES
+SIGNED_URL_TTL = int(os.environ.get("SIGNED_URL_TTL", 900))
+
+# Rows fetched per round trip when streaming /admin/users/export
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 2000))
+
+# (validators, serialized page) for /posters, keyed by (last_seen_id, limit).
+# Writes drop the cached first pages only in the process that made them, so a
+# plain GET elsewhere can get a page up to POSTER_CACHE_TTL seconds old.
+# Revalidations always check the watermark instead (see list_posters()).
+poster_page_cache = TTLCache(
+    maxsize=int(os.environ.get("POSTER_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("POSTER_CACHE_TTL", 30)),
+    name="poster_pages",
+)
+
+# Single posters as JSON text keyed by id, for /posters/<id> and /posters/batch.
+# Posters don't change once created except for variants added by
+# `derivatives.py backfill`, which show up within the TTL.
+poster_cache = TTLCache(
+    maxsize=int(os.environ.get("POSTER_ITEM_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("POSTER_ITEM_CACHE_TTL", 60)),
+    name="posters",
+)
 
-def upload_file_to_bucket(file_obj, bucket_name, destination_blob_name):
+@contextmanager
+def db_connection():
     """
-    Uploads a file to Google Cloud Storage and returns its public URL.
+    ConnectionPool.connection() for the duration of a request, which also
+    discards the connection if the block raised a database error. Yields None
+    if no connection could be obtained.
+    """
+    with ExitStack() as stack:
+        try:
+            conn = stack.enter_context(db_pool.get_pool().connection())
+        except Exception as e:
+            log.error("Database connection failed: %s", e)
+            conn = None
+        yield conn
+
+def upload_file_to_bucket(file_obj, bucket_name, destination_blob_name, content_type=None):
+    """
+    Uploads a file (an uploaded FileStorage or any seekable stream) to Google
+    Cloud Storage and returns its public URL.
     """
     safe_blob_name = re.sub(r'[^a-z0-9\-_.]', '', destination_blob_name.lower())
+    content_type = content_type or getattr(file_obj, "content_type", None)
     try:
-        print(f"upload_file_to_bucket: Uploading file with blob name: {safe_blob_name}")
-        print("File content type:", file_obj.content_type)
-        file_obj.seek(0)  # Ensure file pointer is reset
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(safe_blob_name)
-        blob.upload_from_file(file_obj, content_type=file_obj.content_type)
-        blob.make_public()
-        return blob.public_url
-    except Exception as e:
-        print("Error in upload_file_to_bucket:", e)
-        print(traceback.format_exc())
+        log.debug("Uploading file", extra={"blob_name": safe_blob_name, "content_type": content_type})
+        public_url, timings = upload_stream(
+            getattr(file_obj, "stream", file_obj), bucket_name, safe_blob_name, content_type=content_type
+        )
+        log.debug("Upload finished", extra={"blob_name": safe_blob_name, "timings": timings})
+        return public_url
+    except Exception:
+        log.exception("Upload failed", extra={"blob_name": safe_blob_name})
         raise
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by URL rule, not path, to keep one series per endpoint.
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    started = g.get("request_started")
+    if started is not None:
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route, request.method)
+    metrics.HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+    return response
+
+@app.errorhandler(HashingOverloaded)
+def hashing_overloaded(e):
+    response = jsonify({"error": "Server is busy, please retry shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
 # ---------------- User Endpoints -----------------
 
+# User queries, shared with asgi.py. Lookups by username use the unique index
+# from migrations/010, which register()'s ON CONFLICT also depends on.
+REGISTER_USER_SQL = metrics.name_statement("register_user", (
+    "INSERT INTO users (username, password_hash, email) VALUES (%s, %s, %s) "
+    "ON CONFLICT (username) DO NOTHING RETURNING id"
+))
+LOGIN_USER_SQL = db_pool.prepared(
+    "get_login", "SELECT id, password_hash FROM users WHERE username = %s"
+)
+GET_USER_SQL = db_pool.prepared(
+    "get_user", "SELECT id, username, email, is_verified, created_at FROM users WHERE id = %s"
+)
+GET_USER_BY_NAME_SQL = db_pool.prepared(
+    "get_user_by_name", "SELECT id, username, email, is_verified, created_at FROM users WHERE username = %s"
+)
+
 @app.route("/register", methods=["POST"])
 def register():
     data = request.get_json()
@@ -80,27 +163,26 @@ def register():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
-    password_hash = generate_password_hash(password)
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
-        if cur.fetchone():
-            return jsonify({"error": "Username already exists"}), 409
-        cur.execute(
-            "INSERT INTO users (username, password_hash, email) VALUES (%s, %s, %s) RETURNING id",
-            (username, password_hash, email)
-        )
-        user_id = cur.fetchone()[0]
-        conn.commit()
-    except Exception as e:
-        print("Error during registration:", e)
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+    password_hash = hash_password(password)
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            # One statement, so two registrations of a name can't both pass a check.
+            cur.execute(REGISTER_USER_SQL, (username, password_hash, email))
+            row = cur.fetchone()
+            conn.commit()
+            if not row:
+                return jsonify({"error": "Username already exists"}), 409
+            user_id = row[0]
+        except Exception as e:
+            log.error("Error during registration: %s", e)
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+    # Drops a cached "not found" for this id.
+    user_cache.invalidate(user_id)
     return jsonify({"id": user_id, "username": username, "email": email}), 201
 
 @app.route("/login", methods=["POST"])
@@ -111,53 +193,78 @@ def login():
     if not username or not password:
         return jsonify({"msg": "Username and password required"}), 400
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"msg": "Database connection failed"}), 500
-    cur = conn.cursor()
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"msg": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            cur.execute(LOGIN_USER_SQL, (username,))
+            row = cur.fetchone()
+        except Exception as e:
+            log.error("Error during login: %s", e)
+            return jsonify({"msg": str(e)}), 500
+        finally:
+            cur.close()
+    # Verify the hash after the connection is back in the pool; PBKDF2 is slow.
+    if not row:
+        return jsonify({"msg": "Bad username or password"}), 401
+    user_id, password_hash = row
+    if not verify_password(password_hash, password):
+        return jsonify({"msg": "Bad username or password"}), 401
+
+    # Move hashes made with older parameters onto the configured ones.
     try:
-        cur.execute("SELECT id, password_hash FROM users WHERE username = %s", (username,))
-        row = cur.fetchone()
-        if not row:
-            return jsonify({"msg": "Bad username or password"}), 401
-        user_id, password_hash = row
-        if not check_password_hash(password_hash, password):
-            return jsonify({"msg": "Bad username or password"}), 401
-    except Exception as e:
-        print("Error during login:", e)
-        return jsonify({"msg": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
-    access_token = create_access_token(identity=username)
+        upgraded_hash = rehash_if_needed(password_hash, password)
+    except HashingOverloaded:
+        upgraded_hash = None
+    if upgraded_hash:
+        with db_connection() as conn:
+            if conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(
+                        "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                        (upgraded_hash, user_id, password_hash)
+                    )
+                    conn.commit()
+                except Exception as e:
+                    log.error("Error upgrading password hash: %s", e)
+                finally:
+                    cur.close()
+    access_token = issue_token(username, user_id)
     return jsonify(access_token=access_token), 200
 
+def load_user(user_id=None, username=None):
+    """Fetches one user's profile record by id (or username), or None."""
+    with db_connection() as conn:
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cur = conn.cursor()
+        try:
+            if user_id is not None:
+                cur.execute(GET_USER_SQL, (user_id,))
+            else:
+                cur.execute(GET_USER_BY_NAME_SQL, (username,))
+            row = cur.fetchone()
+        finally:
+            cur.close()
+    return user_from_row(row) if row else None
+
 @app.route("/profile", methods=["GET"])
-@jwt_required()
+@auth_required
 def profile():
-    current_user = get_jwt_identity()
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cur = conn.cursor()
+    user_id = current_user_id()
     try:
-        cur.execute("SELECT id, username, email, is_verified, created_at FROM users WHERE username = %s", (current_user,))
-        row = cur.fetchone()
-        if not row:
-            return jsonify({"error": "User not found"}), 404
-        user = {
-            "id": row[0],
-            "username": row[1],
-            "email": row[2],
-            "is_verified": row[3],
-            "created_at": row[4].isoformat() if row[4] else None
-        }
+        if user_id is not None:
+            user = user_cache.get_or_load(user_id, lambda: load_user(user_id=user_id))
+        else:
+            # Tokens issued before the uid claim existed only carry the username.
+            user = load_user(username=current_username())
     except Exception as e:
-        print("Error fetching profile:", e)
+        log.error("Error fetching profile: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
     return jsonify(user), 200
 
 @app.route("/forgot-password", methods=["POST"])
@@ -167,20 +274,19 @@ def forgot_password():
     if not username:
         return jsonify({"error": "Username is required"}), 400
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
-        user = cur.fetchone()
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+            user = cur.fetchone()
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
 
     token = serializer.dumps(username, salt="password-reset-salt")
     return jsonify({"reset_token": token, "message": "Use this token with /reset-password within 15 minutes"}), 200
@@ -199,30 +305,30 @@ def reset_password():
     except BadSignature:
         return jsonify({"error": "Invalid reset token"}), 400
 
-    new_password_hash = generate_password_hash(new_password)
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cur = conn.cursor()
-    try:
-        cur.execute("UPDATE users SET password_hash = %s WHERE username = %s RETURNING id, username, email", 
-                    (new_password_hash, username))
-        row = cur.fetchone()
-        if not row:
-            return jsonify({"error": "User not found"}), 404
-        conn.commit()
-    except Exception as e:
-        print("Error resetting password:", e)
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+    new_password_hash = hash_password(new_password)
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            cur.execute("UPDATE users SET password_hash = %s WHERE username = %s RETURNING id, username, email", 
+                        (new_password_hash, username))
+            row = cur.fetchone()
+            if not row:
+                return jsonify({"error": "User not found"}), 404
+            conn.commit()
+        except Exception as e:
+            log.error("Error resetting password: %s", e)
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+    user_cache.invalidate(row[0])
     return jsonify({"message": f"Password updated for user '{username}'"}), 200
 
 @app.route("/request-verification", methods=["POST"])
-@jwt_required()
+@auth_required
 def request_verification():
-    username = get_jwt_identity()
+    username = current_username()
     token = serializer.dumps(username, salt="email-verification-salt")
     return jsonify({"verification_token": token, "message": "Use this token with /verify-email within one hour"}), 200
 
@@ -239,166 +345,867 @@ def verify_email():
     except BadSignature:
         return jsonify({"error": "Invalid verification token"}), 400
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cur = conn.cursor()
-    try:
-        cur.execute("UPDATE users SET is_verified = TRUE WHERE username = %s RETURNING id, username, email, is_verified", (username,))
-        row = cur.fetchone()
-        if not row:
-            return jsonify({"error": "User not found"}), 404
-        conn.commit()
-    except Exception as e:
-        print("Error during email verification:", e)
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            cur.execute("UPDATE users SET is_verified = TRUE WHERE username = %s RETURNING id, username, email, is_verified", (username,))
+            row = cur.fetchone()
+            if not row:
+                return jsonify({"error": "User not found"}), 404
+            conn.commit()
+        except Exception as e:
+            log.error("Error during email verification: %s", e)
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+    user_cache.invalidate(row[0])
     return jsonify({"message": f"Email verified for user '{username}'", "user": {"id": row[0], "username": row[1], "email": row[2], "is_verified": row[3]}}), 200
 
+def user_filters(args):
+    """
+    Builds the WHERE clauses shared by the admin user listing and export from
+    ?is_verified=true|false, ?created_after= and ?created_before= (ISO 8601).
+    """
+    clauses, params = [], []
+    is_verified = args.get("is_verified")
+    if is_verified not in (None, ""):
+        if is_verified.lower() not in ("true", "false"):
+            raise ValueError("is_verified must be true or false")
+        clauses.append("is_verified = %s")
+        params.append(is_verified.lower() == "true")
+    for arg, op in (("created_after", ">="), ("created_before", "<")):
+        value = args.get(arg)
+        if value:
+            try:
+                params.append(datetime.fromisoformat(value))
+            except ValueError:
+                raise ValueError(f"{arg} must be an ISO 8601 timestamp")
+            clauses.append(f"created_at {op} %s")
+    return clauses, params
+
+def user_from_row(row):
+    return {
+        "id": row[0],
+        "username": row[1],
+        "email": row[2],
+        "is_verified": row[3],
+        "created_at": row[4]
+    }
+
+# One user as JSON text, rendered by Postgres so listings skip Python dicts.
+# Keys and formats match user_from_row() serialized. Postgres's json trims
+# trailing zeros from fractional seconds, where isoformat() writes all six
+# digits (and none for a whole second), so created_at is spelled out.
+USER_JSON = (
+    "json_build_object('id', id, 'username', username, 'email', email, "
+    "'is_verified', is_verified, 'created_at', "
+    "to_char(created_at, 'YYYY-MM-DD\"T\"HH24:MI:SS') || CASE "
+    "WHEN date_trunc('second', created_at) = created_at THEN '' ELSE to_char(created_at, '.US') END)::text"
+)
+
 @app.route("/admin/users", methods=["GET"])
-@jwt_required()
+@auth_required
 def get_all_users():
-    current_user = get_jwt_identity()
+    current_user = current_username()
     if current_user != "admin":
         return jsonify({"error": "Unauthorized"}), 403
 
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
+    try:
+        limit, position = parse_page_args(request.args)
+        last_id = cursor_id(position)
+        clauses, params = user_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if last_id is not None:
+        clauses.append("id > %s::bigint")
+        params.append(last_id)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                f"SELECT id, {USER_JSON} FROM users {where} ORDER BY id LIMIT %s",
+                params + [limit + 1]
+            )
+            rows = cur.fetchall()
+        except Exception as e:
+            log.error("Error fetching users: %s", e)
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor({"id": rows[-1][0]}) if has_more else None
+    return json_response(json_page("users", [row[1] for row in rows], next_cursor))
 
-    cur = conn.cursor()
+@app.route("/admin/users/export", methods=["GET"])
+@auth_required
+def export_users():
+    """
+    Streams every matching user as NDJSON (default) or CSV. Rows are read
+    through a server-side cursor, so memory use does not grow with the table.
+    """
+    current_user = current_username()
+    if current_user != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
     try:
-        cur.execute("SELECT id, username, email, is_verified, created_at FROM users")
-        users = [
-            {
-                "id": row[0],
-                "username": row[1],
-                "email": row[2],
-                "is_verified": row[3],
-                "created_at": row[4].isoformat() if row[4] else None
-            }
-            for row in cur.fetchall()
-        ]
-    except Exception as e:
-        print("Error fetching users:", e)
-        return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
+        clauses, params = user_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    def generate():
+        with db_connection() as conn:
+            if not conn:
+                raise RuntimeError("Database connection failed")
+            # A named cursor lives on the server; rows arrive EXPORT_BATCH_SIZE at a time.
+            cur = conn.cursor(name="admin_users_export")
+            cur.itersize = EXPORT_BATCH_SIZE
+            try:
+                if export_format == "csv":
+                    cur.execute(
+                        f"SELECT id, username, email, is_verified, created_at FROM users {where} ORDER BY id",
+                        params
+                    )
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    writer.writerow(["id", "username", "email", "is_verified", "created_at"])
+                    for row in cur:
+                        writer.writerow([row[0], row[1], row[2], row[3], row[4].isoformat() if row[4] else ""])
+                        if buf.tell() >= 65536:
+                            yield buf.getvalue()
+                            buf.seek(0)
+                            buf.truncate()
+                    yield buf.getvalue()
+                else:
+                    cur.execute(f"SELECT {USER_JSON} FROM users {where} ORDER BY id", params)
+                    for row in cur:
+                        yield row[0] + "\n"
+            finally:
+                cur.close()
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = Response(generate(), mimetype=mimetype)
+    response.headers["Content-Disposition"] = f"attachment; filename=users.{export_format}"
+    return response
+
+@app.route("/admin/posters/import", methods=["POST"])
+@auth_required
+def bulk_import_posters():
+    """
+    Imports posters from a `metadata` file (NDJSON or CSV, or set `format`)
+    and an optional `images` zip archive; see bulk_import.py. Streams an
+    NDJSON report, one line per row as its batch commits, then a summary
+    line, preceded by an error line if the import stopped early. Rows
+    reported before a disconnect stay imported.
+    """
+    current_user = current_username()
+    if current_user != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    metadata = request.files.get("metadata")
+    if not metadata:
+        return jsonify({"error": "A metadata file is required"}), 400
+    try:
+        import_format = bulk_import.detect_format(metadata.filename, request.form.get("format"))
+        rows = bulk_import.read_rows(metadata.stream, import_format)
+        images_file = request.files.get("images")
+        images = bulk_import.open_images(images_file.stream) if images_file else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    return jsonify(users), 200
+    def generate():
+        counts = {"created": 0, "failed": 0}
+        try:
+            for report in bulk_import.import_posters(rows, images, BUCKET_NAME, db_connection):
+                counts[report["status"]] += 1
+                yield dumps(report) + b"\n"
+        except Exception as e:
+            # Batches already reported stay imported; say why the rest weren't.
+            log.exception("Bulk import stopped")
+            yield dumps({"error": f"Import stopped: {e}"}) + b"\n"
+        finally:
+            if counts["created"]:
+                poster_page_cache.invalidate_where(lambda key: key[0] is None)
+        yield dumps({"summary": counts}) + b"\n"
+
+    # The uploaded files belong to the request, so keep its context open while streaming.
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 # ---------------- Poster Endpoints -----------------
 
+# Poster queries, shared with the ASGI variant in asgi.py. The ones read on
+# every page view are prepared statements (see db_pool.prepared()).
+INSERT_POSTER_SQL = metrics.name_statement("insert_poster", (
+    "INSERT INTO posters (title, description, artist, photo_url, photo_variants, content_hash) "
+    "VALUES (%s, %s, %s, %s, %s, %s) RETURNING id"
+))
+# Step two of a direct upload in one statement: claims the pending row unless
+# it was finalized already, inserts the poster and links it. The row lock
+# makes a concurrent finalize wait and then insert nothing; it (and any
+# repeat call) reads the poster with FINALIZED_POSTER_SQL instead.
+FINALIZE_PENDING_SQL = metrics.name_statement("finalize_pending", (
+    "WITH claimed AS ("
+    "  SELECT id FROM pending_posters WHERE id = %s AND poster_id IS NULL FOR UPDATE"
+    "), inserted AS ("
+    "  INSERT INTO posters (title, description, artist, photo_url)"
+    "  SELECT %s, %s, %s, %s FROM claimed"
+    "  RETURNING id, title, description, artist, photo_url"
+    "), linked AS ("
+    "  UPDATE pending_posters SET poster_id = inserted.id FROM inserted, claimed"
+    "  WHERE pending_posters.id = claimed.id"
+    ") "
+    "SELECT id, title, description, artist, photo_url FROM inserted"
+))
+FINALIZED_POSTER_SQL = metrics.name_statement("get_finalized_poster", (
+    "SELECT p.id, p.title, p.description, p.artist, p.photo_url "
+    "FROM pending_posters pp JOIN posters p ON p.id = pp.poster_id WHERE pp.id = %s"
+))
+# Derivative names follow the original's, so an image stored before has its
+# variants already; any poster showing it can lend them.
+FIND_VARIANTS_SQL = metrics.name_statement("find_variants", (
+    "SELECT photo_variants FROM posters "
+    "WHERE content_hash = %s AND photo_variants IS NOT NULL LIMIT 1"
+))
+# One poster as JSON text, rendered by Postgres. srcset is built the same way
+# as derivatives.srcset_from_variants(): per type, "url width" pairs by width.
+POSTER_JSON = (
+    "json_build_object('id', id, 'title', title, 'description', description, 'artist', artist, "
+    "'photo_url', photo_url, 'srcset', ("
+    "  SELECT json_object_agg(v.content_type, ("
+    "    SELECT string_agg((e->>1) || ' ' || (e->>0) || 'w', ', ' ORDER BY (e->>0)::int, e->>1)"
+    "    FROM jsonb_array_elements(v.entries) e))"
+    "  FROM jsonb_each(photo_variants) v(content_type, entries)))::text"
+)
+LIST_POSTERS_SQL = db_pool.prepared(
+    "list_posters", f"SELECT id, {POSTER_JSON} FROM posters ORDER BY id DESC LIMIT %s"
+)
+# Keyset parameters are cast to bigint: a prepared statement would otherwise
+# type them from the int4 column, and any cursor id past 2^31 would fail.
+LIST_POSTERS_AFTER_SQL = db_pool.prepared(
+    "list_posters_after", f"SELECT id, {POSTER_JSON} FROM posters WHERE id < %s::bigint ORDER BY id DESC LIMIT %s"
+)
+# Validators for every /posters page: every insert, update or delete on
+# posters bumps this row (see migrations/011).
+POSTERS_WATERMARK_SQL = db_pool.prepared(
+    "posters_watermark", "SELECT version, changed_at FROM posters_version"
+)
+GET_POSTERS_SQL = db_pool.prepared(
+    "get_posters", f"SELECT id, {POSTER_JSON} FROM posters WHERE id = ANY(%s::bigint[])"
+)
+# Ranks are stored as float4 (real), so the cursor is compared against a real
+# to get exactly the value the previous page returned.
+_SEARCH_MATCHES = (
+    f"SELECT id, {POSTER_JSON}, rank FROM ("
+    "  SELECT p.id, p.title, p.description, p.artist, p.photo_url, p.photo_variants, "
+    "         ts_rank(p.search_vector, q) AS rank"
+    "  FROM posters p, websearch_to_tsquery('english', %s) q"
+    "  WHERE p.search_vector @@ q"
+    ") matches "
+)
+SEARCH_POSTERS_SQL = db_pool.prepared(
+    "search_posters", _SEARCH_MATCHES + "ORDER BY rank DESC, id DESC LIMIT %s"
+)
+SEARCH_POSTERS_AFTER_SQL = db_pool.prepared(
+    "search_posters_after",
+    _SEARCH_MATCHES + "WHERE (rank, id) < (%s::real, %s::bigint) ORDER BY rank DESC, id DESC LIMIT %s"
+)
+
+def find_variants(content_hash):
+    """photo_variants of an existing poster with the same image, or None."""
+    with db_connection() as conn:
+        if not conn:
+            return None
+        cur = conn.cursor()
+        try:
+            cur.execute(FIND_VARIANTS_SQL, (content_hash,))
+            row = cur.fetchone()
+        finally:
+            cur.close()
+    return row[0] if row else None
+
+def process_poster_job(job):
+    """
+    Worker side of /posters/upload: pushes the spooled image to the bucket,
+    then inserts the poster and completes the job in one transaction.
+    """
+    photo_url = variants = None
+    if job["payload"] is not None:
+        with db_connection() as conn:
+            if conn:
+                set_progress(conn, job["id"], "uploading")
+        if job["content_hash"]:
+            photo_url, uploaded = upload_if_missing(
+                job["payload"], BUCKET_NAME, job["blob_name"], job["content_type"], job["content_crc32c"]
+            )
+        else:
+            # Queued before uploads were content-addressed.
+            photo_url = upload_file_to_bucket(
+                io.BytesIO(job["payload"]), BUCKET_NAME, job["blob_name"], content_type=job["content_type"]
+            )
+            uploaded = True
+        if not uploaded:
+            variants = find_variants(job["content_hash"])
+        if variants is None:
+            with db_connection() as conn:
+                if conn:
+                    set_progress(conn, job["id"], "resizing")
+            # Derivatives are best effort: the backfill command picks up posters without them.
+            try:
+                variants = build_derivatives(job["payload"], BUCKET_NAME, job["blob_name"])
+            except Exception as e:
+                log.warning("Derivative rendering failed: %s", e, extra={"job_id": job["id"]})
+
+    with db_connection() as conn:
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                INSERT_POSTER_SQL,
+                (job["title"], job["description"], job["artist"], photo_url,
+                 Json(variants) if variants else None, job["content_hash"])
+            )
+            poster_id = cur.fetchone()[0]
+            complete_job(cur, job["id"], poster_id)
+            conn.commit()
+        finally:
+            cur.close()
+    log.info("Poster job created poster", extra={"job_id": job["id"], "poster_id": poster_id})
+    # Keyset pages after a cursor are unaffected by a new (higher) id;
+    # only first pages need to be dropped.
+    poster_page_cache.invalidate_where(lambda key: key[0] is None)
+
+job_workers = JobWorkerPool(process_poster_job)
+
+@app.before_first_request
+def start_job_workers():
+    job_workers.start()
+
 @app.route("/posters/upload", methods=["POST"])
+@auth_required
 def create_poster_with_photo():
     try:
-        # Manually extract and decode the JWT token from the Authorization header
-        auth_header = request.headers.get("Authorization", None)
-        if not auth_header:
-            return jsonify({"msg": "Missing Authorization header"}), 401
-        try:
-            token = auth_header.split()[1]
-        except IndexError:
-            return jsonify({"msg": "Invalid Authorization header format"}), 401
-        
-        try:
-            decoded = decode_token(token)
-            current_user = decoded.get("sub")
-        except Exception as e:
-            return jsonify({"msg": "Token decoding failed", "error": str(e)}), 401
+        current_user = current_username()
 
         # Log the received form keys for debugging
-        print("Request form keys:", list(request.form.keys()))
+        log.debug("Upload form received", extra={"form_keys": list(request.form.keys())})
         title = request.form.get("title")
         description = request.form.get("description")
         artist = request.form.get("artist")  # New field
-        print("Extracted title:", title)
-        print("Extracted description:", description)
 
         if not title:
-            print("Title is missing!")
+            log.debug("Upload rejected: title is missing")
             return jsonify({"error": "Title is required"}), 400
 
+        # The form parser has spooled the photo and refused non-image parts
+        # (see uploads.py). It's hashed in one pass over the spool, then copied
+        # from it into the job row a chunk at a time, and a worker does the
+        # bucket upload. It's stored under a name derived from the hash, so
+        # re-uploads of the same image share one object.
         file_obj = request.files.get("photo")
-        photo_url = None
+        blob_name = content_type = photo = content_hash = crc32c = None
         if file_obj:
-            raw_filename = file_obj.filename or "upload"
-            safe_filename = re.sub(r'[^a-z0-9\-_.]', '', raw_filename.lower())
-            filename = f"{uuid.uuid4()}_{safe_filename}"
-            print(f"Uploading file with filename: {filename}")
+            content_type = file_obj.content_type
             try:
-                photo_url = upload_file_to_bucket(file_obj, BUCKET_NAME, filename)
-                print("File successfully uploaded. Public URL:", photo_url)
-            except Exception as upload_e:
-                print("Error during file upload:", upload_e)
-                return jsonify({"error": "Failed to upload image", "details": str(upload_e)}), 500
+                _, content_hash, crc32c = hash_stream(file_obj.stream, max_bytes=MAX_PHOTO_BYTES)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 413
+            photo = file_obj.stream
+            blob_name = content_blob_name(content_hash, content_type, file_obj.filename)
+            log.debug("Queueing upload", extra={"blob_name": blob_name, "content_type": content_type})
+
+        with db_connection() as conn:
+            if not conn:
+                return jsonify({"error": "Database connection failed"}), 500
+            try:
+                job_id = enqueue_poster_job(
+                    conn, current_user, title, description, artist, blob_name, content_type, photo,
+                    content_hash, crc32c
+                )
+                conn.commit()
+                log.info("Queued poster job", extra={"job_id": job_id})
+            except Exception as db_e:
+                log.error("Error queueing poster: %s", db_e)
+                return jsonify({"error": "Error creating poster", "details": str(db_e)}), 500
+
+        job_workers.start()
+        job_workers.notify()
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/posters/jobs/{job_id}"
+        }), 202
 
-        conn = get_db_connection()
+    except HTTPException:
+        # Oversized or unaccepted bodies; uploads.init_app() answers these.
+        raise
+    except Exception as e:
+        log.exception("Unhandled exception in /posters/upload")
+        return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
+
+@app.route("/posters/jobs/<int:job_id>", methods=["GET"])
+@auth_required
+def get_poster_job(job_id):
+    current_user = current_username()
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        try:
+            job = get_job(conn, job_id)
+        except Exception as e:
+            log.error("Error fetching poster job: %s", e)
+            return jsonify({"error": str(e)}), 500
+    if not job or (job.pop("username") != current_user and current_user != "admin"):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
+@app.route("/posters/upload-url", methods=["POST"])
+@auth_required
+def create_poster_upload_url():
+    """
+    Step one of a direct upload: records a pending poster and returns a signed
+    PUT URL so the browser can send the photo straight to the bucket.
+    """
+    current_user = current_username()
+    data = request.get_json() or {}
+    title = data.get("title")
+    content_type = data.get("content_type") or ""
+    size = data.get("size")
+    if not title:
+        return jsonify({"error": "Title is required"}), 400
+    if not content_type.startswith("image/"):
+        return jsonify({"error": "content_type must be an image type"}), 400
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return jsonify({"error": "size must be a positive integer"}), 400
+    if size > MAX_PHOTO_BYTES:
+        return jsonify({"error": f"Photo exceeds the {MAX_PHOTO_BYTES} byte limit"}), 413
+
+    raw_filename = data.get("filename") or "upload"
+    safe_filename = re.sub(r'[^a-z0-9\-_.]', '', raw_filename.lower())
+    blob_name = f"{uuid.uuid4()}_{safe_filename}"
+    try:
+        upload_url, upload_headers = generate_upload_url(
+            BUCKET_NAME, blob_name, content_type, size, expires_in=SIGNED_URL_TTL
+        )
+    except Exception as e:
+        log.error("Error signing upload URL: %s", e)
+        return jsonify({"error": "Direct uploads are unavailable", "details": str(e)}), 503
+
+    with db_connection() as conn:
         if not conn:
             return jsonify({"error": "Database connection failed"}), 500
         cur = conn.cursor()
         try:
             cur.execute(
-                "INSERT INTO posters (title, description, artist, photo_url) VALUES (%s, %s, %s, %s) RETURNING id",
-                (title, description, artist, photo_url)
+                "INSERT INTO pending_posters (username, title, description, artist, blob_name, content_type, "
+                "expected_size, expires_at) VALUES (%s, %s, %s, %s, %s, %s, %s, now() + %s * interval '1 second') "
+                "RETURNING id, expires_at",
+                (current_user, title, data.get("description"), data.get("artist"), blob_name,
+                 content_type, size, SIGNED_URL_TTL)
             )
-            poster_id = cur.fetchone()[0]
+            pending_id, expires_at = cur.fetchone()
             conn.commit()
-            print(f"Created poster with id: {poster_id}")
-        except Exception as db_e:
-            print("Error creating poster:", db_e)
-            return jsonify({"error": "Error creating poster", "details": str(db_e)}), 500
+        except Exception as e:
+            log.error("Error creating pending poster: %s", e)
+            return jsonify({"error": str(e)}), 500
         finally:
             cur.close()
-            conn.close()
 
-        return jsonify({
-            "id": poster_id,
-            "title": title,
-            "description": description,
-            "artist": artist,
-            "photo_url": photo_url
-        }), 201
+    return jsonify({
+        "pending_id": pending_id,
+        "upload_url": upload_url,
+        "upload_method": "PUT",
+        "upload_headers": upload_headers,
+        "expires_at": expires_at,
+        "finalize_url": f"/posters/pending/{pending_id}/finalize"
+    }), 201
 
-    except Exception as e:
-        print("Unhandled exception in /posters/upload:", e)
-        print(traceback.format_exc())
-        return jsonify({"error": "An unexpected error occurred", "details": str(e)}), 500
+@app.route("/posters/pending/<int:pending_id>/finalize", methods=["POST"])
+@auth_required
+def finalize_poster_upload(pending_id):
+    """
+    Step two of a direct upload: verifies the object landed in the bucket with
+    the announced size and type, then commits the posters row. Idempotent.
+    """
+    current_user = current_username()
+    select_pending = (
+        "SELECT username, title, description, artist, blob_name, content_type, expected_size, "
+        "poster_id, expires_at < now() FROM pending_posters WHERE id = %s"
+    )
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            cur.execute(select_pending, (pending_id,))
+            pending = cur.fetchone()
+        except Exception as e:
+            log.error("Error fetching pending poster: %s", e)
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+    if not pending or pending[0] != current_user:
+        return jsonify({"error": "Pending poster not found"}), 404
+    _, title, description, artist, blob_name, content_type, expected_size, poster_id, expired = pending
+    if poster_id is None and expired:
+        return jsonify({"error": "The upload URL has expired"}), 410
+
+    photo_url = None
+    if poster_id is None:
+        # Check the object outside of any DB checkout; this is a GCS round trip.
+        try:
+            meta = get_blob_metadata(BUCKET_NAME, blob_name)
+        except Exception as e:
+            log.error("Error checking uploaded object: %s", e)
+            return jsonify({"error": "Failed to verify upload", "details": str(e)}), 502
+        if meta is None:
+            return jsonify({"error": "Photo has not been uploaded yet"}), 409
+        if meta["size"] != expected_size or meta["content_type"] != content_type:
+            return jsonify({
+                "error": "Uploaded photo does not match the announced size or type",
+                "expected": {"size": expected_size, "content_type": content_type},
+                "actual": {"size": meta["size"], "content_type": meta["content_type"]}
+            }), 422
+        photo_url = meta["public_url"]
+
+    status = 200
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            row = None
+            if poster_id is None:
+                cur.execute(FINALIZE_PENDING_SQL, (pending_id, title, description, artist, photo_url))
+                row = cur.fetchone()
+                conn.commit()
+                if row:
+                    status = 201
+            if row is None:
+                cur.execute(FINALIZED_POSTER_SQL, (pending_id,))
+                row = cur.fetchone()
+        except Exception as e:
+            log.error("Error finalizing poster: %s", e)
+            return jsonify({"error": "Error creating poster", "details": str(e)}), 500
+        finally:
+            cur.close()
+
+    if status == 201:
+        log.info("Created poster", extra={"poster_id": row[0]})
+        poster_page_cache.invalidate_where(lambda key: key[0] is None)
+    return jsonify({
+        "id": row[0],
+        "title": row[1],
+        "description": row[2],
+        "artist": row[3],
+        "photo_url": row[4]
+    }), status
+
+def load_posters_validators():
+    """(ETag, Last-Modified) of the posters table as it stands."""
+    with db_connection() as conn:
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cur = conn.cursor()
+        try:
+            cur.execute(POSTERS_WATERMARK_SQL)
+            return conditional.watermark_validators(*cur.fetchone())
+        finally:
+            cur.close()
+
+def load_posters_page(limit, last_id):
+    """
+    Runs the keyset query for one listing page and returns (validators, the
+    serialized JSON body as a CompressedBody).
+    """
+    with db_connection() as conn:
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cur = conn.cursor()
+        try:
+            # The watermark is read first: a write in between makes the
+            # validators older than the page, which only costs a refetch later.
+            cur.execute(POSTERS_WATERMARK_SQL)
+            validators = conditional.watermark_validators(*cur.fetchone())
+            # Fetch one extra row to know whether another page exists.
+            if last_id is None:
+                cur.execute(LIST_POSTERS_SQL, (limit + 1,))
+            else:
+                cur.execute(LIST_POSTERS_AFTER_SQL, (last_id, limit + 1))
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+    return validators, posters_page_body(rows, limit)
+
+def posters_page_body(rows, limit):
+    """Serializes up to `limit` (id, json) listing rows (fetched with limit + 1) as a page."""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor({"id": rows[-1][0]}) if has_more else None
+    return CompressedBody(json_page("posters", [row[1] for row in rows], next_cursor))
 
 @app.route("/posters", methods=["GET"])
 def list_posters():
-    conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    cur = conn.cursor()
     try:
-        cur.execute("SELECT id, title, description, artist, photo_url FROM posters ORDER BY id DESC LIMIT 10")
-        rows = cur.fetchall()
-        posters = [{
-            "id": row[0],
-            "title": row[1],
-            "description": row[2],
-            "artist": row[3],
-            "photo_url": row[4]
-        } for row in rows]
-        return jsonify(posters), 200
+        limit, position = parse_page_args(request.args)
+        last_id = cursor_id(position)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    key = (last_id, limit)
+    try:
+        page = None
+        if conditional.is_conditional(request.headers):
+            # Revalidations are answered from the watermark, before the page
+            # query runs. The cached page's own validators may be older: other
+            # workers' writes don't invalidate this one's cache.
+            validators = load_posters_validators()
+            if conditional.not_modified(request.headers, *validators):
+                response = Response(status=304, headers=conditional.validator_headers(*validators))
+                response.vary.add("Accept-Encoding")
+                return response
+            page = poster_page_cache.get(key)
+            if page is not None and page[0] != validators:
+                poster_page_cache.invalidate(key)
+                page = None
+        if page is None:
+            page = poster_page_cache.get_or_load(key, lambda: load_posters_page(limit, last_id))
+    except Exception as e:
+        log.error("Error fetching posters: %s", e)
+        return jsonify({"error": str(e)}), 500
+    # Cached pages keep their compressed forms, so hits don't recompress.
+    # conditional.init_app() answers 304 when the client has this page.
+    validators, body = page
+    data, encoding = body.encoded(choose_encoding(request.headers.get("Accept-Encoding")))
+    response = json_response(data)
+    response.headers.extend(conditional.validator_headers(*validators))
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+def cached_posters(ids):
+    """
+    Splits `ids` into ({id: json text} found in poster_cache, ids to load).
+    """
+    found = poster_cache.get_many(ids)
+    return found, [poster_id for poster_id in ids if poster_id not in found]
+
+def store_posters(found, rows):
+    """Adds (id, json text) rows from GET_POSTERS_SQL to `found` and poster_cache."""
+    for poster_id, poster in rows:
+        poster_cache.set(poster_id, poster)
+        found[poster_id] = poster
+
+def posters_batch_body(ids, found):
+    """
+    {"posters": [...], "missing": [...]}: one entry per requested id, in
+    request order, null where the poster doesn't exist.
+    """
+    return b"".join((
+        b'{"posters":[',
+        ",".join(found.get(poster_id, "null") for poster_id in ids).encode(),
+        b'],"missing":', dumps([poster_id for poster_id in ids if poster_id not in found]), b"}",
+    ))
+
+def load_posters(ids):
+    """Read-through lookup of posters by id; returns {id: json text} for those that exist."""
+    found, missing = cached_posters(ids)
+    if missing:
+        with db_connection() as conn:
+            if not conn:
+                raise RuntimeError("Database connection failed")
+            cur = conn.cursor()
+            try:
+                cur.execute(GET_POSTERS_SQL, (missing,))
+                store_posters(found, cur.fetchall())
+            finally:
+                cur.close()
+    return found
+
+@app.route("/posters/batch", methods=["GET"])
+def get_posters_batch():
+    """Up to MAX_BATCH_IDS posters by id (?ids=3,1,2) in one round trip."""
+    try:
+        ids = parse_ids(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        found = load_posters(ids)
+    except Exception as e:
+        log.error("Error fetching posters: %s", e)
+        return jsonify({"error": str(e)}), 500
+    return json_response(posters_batch_body(ids, found))
+
+@app.route("/posters/<int:poster_id>", methods=["GET"])
+def get_poster(poster_id):
+    try:
+        found = load_posters([poster_id])
     except Exception as e:
-        print("Error fetching posters:", e)
+        log.error("Error fetching poster: %s", e)
         return jsonify({"error": str(e)}), 500
-    finally:
-        cur.close()
-        conn.close()
-    
+    if poster_id not in found:
+        return jsonify({"error": "Poster not found"}), 404
+    return json_response(found[poster_id].encode())
+
+@app.route("/posters/search", methods=["GET"])
+def search_posters():
+    """
+    Full-text search over title, artist and description, best match first.
+    Uses the same ?limit= / ?cursor= contract as GET /posters; the cursor
+    holds the (rank, id) of the last result.
+    """
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit, position = parse_page_args(request.args)
+        after = cursor_rank(position)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    with db_connection() as conn:
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+        try:
+            if after is None:
+                cur.execute(SEARCH_POSTERS_SQL, (q, limit + 1))
+            else:
+                cur.execute(SEARCH_POSTERS_AFTER_SQL, (q, after[0], after[1], limit + 1))
+            rows = cur.fetchall()
+        except Exception as e:
+            log.error("Error searching posters: %s", e)
+            return jsonify({"error": str(e)}), 500
+        finally:
+            cur.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor({"rank": rows[-1][2], "id": rows[-1][0]}) if has_more else None
+    return json_response(json_page("posters", [row[1] for row in rows], next_cursor))
+
+# ---------------- Readiness -----------------
+
+# What to set up in the background once the server is listening: "db" (a
+# pooled connection), "storage" (imports the storage stack and builds the
+# client), both (default) or "none". Whatever is left out is created by the
+# first request that needs it, and /readyz doesn't wait for it.
+WARM_UP = [part for part in os.environ.get("WARM_UP", "db,storage").replace(" ", "").split(",") if part and part != "none"]
+if set(WARM_UP) - {"db", "storage"}:
+    raise ValueError(f"Unknown WARM_UP: {os.environ['WARM_UP']}")
+
+readiness = {"db": False, "storage": False, "error": None}
+
+def is_ready():
+    return all(readiness[part] for part in WARM_UP)
+
+def warm_up():
+    """
+    Opens a pooled DB connection and builds the storage client, as selected
+    by WARM_UP, so real requests don't pay for them. Returns True once done.
+    """
+    try:
+        if "db" in WARM_UP and not readiness["db"]:
+            with db_connection() as conn:
+                if not conn:
+                    raise RuntimeError("Database connection failed")
+                cur = conn.cursor()
+                try:
+                    cur.execute("SELECT 1")
+                finally:
+                    cur.close()
+            readiness["db"] = True
+        if "storage" in WARM_UP and not readiness["storage"]:
+            get_storage_client()
+            readiness["storage"] = True
+        readiness["error"] = None
+    except Exception as e:
+        readiness["error"] = str(e)
+    return is_ready()
+
+def start_warm_up():
+    """Warms up on a background thread, retrying with backoff until it succeeds."""
+    if not WARM_UP:
+        return
+    def run():
+        started = time.monotonic()
+        delay = 0.5
+        while not warm_up():
+            log.warning("Warm-up not complete, retrying: %s", readiness["error"])
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+        log.info("Warm-up complete", extra={"parts": WARM_UP, "seconds": round(time.monotonic() - started, 3)})
+    threading.Thread(target=run, name="warm-up", daemon=True).start()
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    ready = is_ready()
+    return jsonify({"ready": ready, **readiness}), 200 if ready else 503
+
+def pool_gauges():
+    stats = db_pool.pool_stats()
+    return [((name,), stats.get(name, 0)) for name in ("size", "in_use", "idle", "max")]
+
+def cache_stats():
+    stats = {cache.name: cache.stats() for cache in (poster_page_cache, poster_cache, token_cache)}
+    stats["users"] = user_cache.stats()
+    return stats
+
+def cache_field(field):
+    return lambda: [((name,), stats[field]) for name, stats in cache_stats().items()]
+
+metrics.gauge("db_pool_connections", "Pooled connections by state.", ("state",), pool_gauges)
+metrics.gauge("cache_hits_total", "Cache hits.", ("cache",), cache_field("hits"), kind="counter")
+metrics.gauge("cache_misses_total", "Cache misses.", ("cache",), cache_field("misses"), kind="counter")
+metrics.gauge("cache_entries", "Entries currently cached.", ("cache",), cache_field("size"))
+
+@app.route("/metrics", methods=["GET"])
+@ops_required
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route("/debug-multipart", methods=["POST"])
 def debug_multipart():
-    print("Request form keys:", list(request.form.keys()))
+    log.debug("Debug multipart form received", extra={"form_keys": list(request.form.keys())})
     form_data = {k: request.form.get(k) for k in request.form.keys()}
     return jsonify(form_data), 200
 
+@app.route("/debug-pool", methods=["GET"])
+@ops_required
+def debug_pool():
+    return jsonify(db_pool.get_pool().stats()), 200
+
+@app.route("/debug-cache", methods=["GET"])
+@ops_required
+def debug_cache():
+    return jsonify(cache_stats()), 200
+
+@app.route("/debug-storage", methods=["GET"])
+@ops_required
+def debug_storage():
+    return jsonify(storage_stats()), 200
+
+@app.route("/debug-hashing", methods=["GET"])
+@ops_required
+def debug_hashing():
+    return jsonify(hashing_stats()), 200
+
 if __name__ == "__main__":
+    # Development server; production runs under gunicorn (see gunicorn.conf.py).
+    start_warm_up()
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
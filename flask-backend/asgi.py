@@ -0,0 +1,1348 @@
+"""
+Async serving mode: the same routes and JSON contracts as app.py, served by
+an ASGI server on one event loop.
+
+Database access goes through an asyncpg pool and object storage through
+gcloud-aio-storage on a shared aiohttp session, so a slow query or upload
+holds a coroutine rather than a thread. CPU-bound work (password hashing,
+image resizing) still runs on the process pools in hashing.py and
+derivatives.py.
+
+Run with: uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import csv
+import importlib
+import io
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+import asyncpg
+from itsdangerous import BadSignature, SignatureExpired
+from starlette.applications import Starlette
+from starlette.formparsers import MultiPartParser
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.requests import ClientDisconnect
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import app as wsgi
+import auth
+import bulk_import
+import compression
+import conditional
+import db_pool
+import logs
+import metrics
+import uploads
+from derivatives import FORMATS, derivative_blob_name, get_executor, render_derivatives
+from hashing import HashingOverloaded, hash_password, verify_password, rehash_if_needed, hashing_stats
+from jobs import (
+    NEXT_JOB_ID_SQL, COPY_JOB_COLUMNS, GET_JOB_SQL, CLAIM_SQL, SET_PROGRESS_SQL, COMPLETE_SQL, RETRY_SQL,
+    FAIL_SQL, MAX_ATTEMPTS, LOCK_TIMEOUT, POLL_INTERVAL, POSTER_WORKERS,
+    copy_job_chunks, job_status_from_row, job_from_claim_row, retry_delay,
+)
+from pagination import parse_page_args, parse_ids, cursor_id, cursor_rank, encode_cursor
+from serialization import dumps, json_page
+from storage_client import (
+    checksums, content_blob_name, generate_upload_url, hash_stream, record_upload, record_upload_error,
+    record_upload_skipped, storage_stats,
+)
+from user_cache import user_cache
+
+log = logs.get_logger(__name__)
+
+BUCKET_NAME = wsgi.BUCKET_NAME
+MAX_PHOTO_BYTES = wsgi.MAX_PHOTO_BYTES
+SIGNED_URL_TTL = wsgi.SIGNED_URL_TTL
+EXPORT_BATCH_SIZE = wsgi.EXPORT_BATCH_SIZE
+poster_page_cache = wsgi.poster_page_cache
+serializer = wsgi.serializer
+
+# Starlette spools file parts past this size; it has no per-instance setting.
+MultiPartParser.max_file_size = uploads.SPOOL_THRESHOLD
+
+# One pool per process. Because requests don't hold a thread, the pool rather
+# than a thread count bounds how much work reaches Postgres at once.
+DB_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", 20))
+DB_POOL_MAX_USES = int(os.environ.get("DB_POOL_MAX_USES", 1000))
+DB_POOL_MAX_IDLE = float(os.environ.get("DB_POOL_MAX_IDLE", 300))
+DB_COMMAND_TIMEOUT = float(os.environ.get("DB_COMMAND_TIMEOUT", 30))
+# Open connections to the storage API shared by all in-flight uploads.
+GCS_CONNECTIONS = int(os.environ.get("GCS_ASYNC_CONNECTIONS", 100))
+
+_pg_cache = {}
+
+
+def _pg(sql):
+    """Rewrites the %s placeholders used with psycopg2 into asyncpg's $1..$n."""
+    converted = _pg_cache.get(sql)
+    if converted is None:
+        converted = db_pool.numbered_placeholders(sql)
+        metrics.name_statement(metrics.statement_name(sql), converted)
+        _pg_cache[sql] = converted
+    return converted
+
+
+class TimedConnection(asyncpg.Connection):
+    """asyncpg connection that records queries in db_query_duration_seconds."""
+
+    async def execute(self, query, *args, **kwargs):
+        with metrics.db_timer(metrics.statement_name(query)):
+            return await super().execute(query, *args, **kwargs)
+
+    async def fetch(self, query, *args, **kwargs):
+        with metrics.db_timer(metrics.statement_name(query)):
+            return await super().fetch(query, *args, **kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        with metrics.db_timer(metrics.statement_name(query)):
+            return await super().fetchrow(query, *args, **kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        with metrics.db_timer(metrics.statement_name(query)):
+            return await super().fetchval(query, *args, **kwargs)
+
+
+def public_url(bucket_name, blob_name):
+    """Same URL google-cloud-storage reports as blob.public_url."""
+    return f"https://storage.googleapis.com/{bucket_name}/{quote(blob_name, safe='/~')}"
+
+
+class State:
+    pool = None
+    session = None
+    storage = None
+    readiness = {"db": False, "storage": False, "error": None}
+    job_wake = None
+    tasks = []
+    loads = {}   # cache key -> asyncio.Future of the page being loaded
+
+
+state = State()
+
+
+class JSONResponse(StarletteJSONResponse):
+    """Serialized with serialization.dumps(), like jsonify() in the WSGI app."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def error(body, status):
+    return JSONResponse(body, status_code=status)
+
+
+async def read_json(request):
+    """Like Flask's request.get_json() for these routes: {} when the body isn't a JSON object."""
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def no_database():
+    return error({"error": "Database connection failed"}, 500)
+
+
+def cacheable(request, body, etag=None, last_modified=None, headers=None):
+    """
+    JSON `body` for an endpoint in conditional.CACHE_CONTROL, sent the way the
+    WSGI app's conditional.init_app() hook sends it: with Cache-Control and an
+    ETag (digested from the body unless given), or as a 304 when the client
+    already has it.
+    """
+    etag = etag or conditional.etag_for(body)
+    headers = {
+        **(headers or {}),
+        **conditional.validator_headers(etag, last_modified),
+        "Cache-Control": conditional.CACHE_CONTROL[request.scope["endpoint"].__name__],
+    }
+    if conditional.not_modified(request.headers, etag, last_modified):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# ---------------- Auth -----------------
+
+def issue_token(username, user_id):
+    with wsgi.app.app_context():
+        return auth.issue_token(username, user_id)
+
+
+def jwt_claims(request):
+    """
+    Returns (claims, None) for a valid bearer token, otherwise (None, response)
+    with the same status and body auth.auth_required gives the WSGI app.
+    """
+    try:
+        with wsgi.app.app_context():
+            return auth.verify_header(request.headers.get("Authorization")), None
+    except auth.AuthError as e:
+        return None, error({"msg": e.message}, e.status)
+
+
+def ops_denied(request):
+    """None if the request may read /metrics and /debug-* (see auth.verify_ops_header()), else the error response."""
+    try:
+        with wsgi.app.app_context():
+            auth.verify_ops_header(request.headers.get("Authorization"))
+    except auth.AuthError as e:
+        return error({"msg": e.message}, e.status)
+    return None
+
+
+def jwt_identity(request):
+    claims, denied = jwt_claims(request)
+    return (claims["sub"] if claims else None), denied
+
+
+# ---------------- Storage -----------------
+
+def storage():
+    """
+    The gcloud-aio-storage client, created on first use. It and aiohttp are
+    imported here rather than at startup: together they are most of this
+    module's import time, and only uploads need them.
+    """
+    if state.storage is None:
+        import aiohttp
+        from gcloud.aio.storage import Storage
+
+        state.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=GCS_CONNECTIONS))
+        # Storage() honours STORAGE_EMULATOR_HOST the same way storage_client.py does.
+        state.storage = Storage(session=state.session)
+        state.readiness["storage"] = True
+    return state.storage
+
+
+async def upload_bytes(data, blob_name, content_type, crc32c=None):
+    """
+    Uploads to the bucket without blocking the loop; returns the public URL.
+    With `crc32c`, GCS rejects the upload if the bytes don't match.
+    """
+    started = time.perf_counter()
+    metadata = {"crc32c": crc32c} if crc32c else None
+    try:
+        await storage().upload(BUCKET_NAME, blob_name, data, content_type=content_type, metadata=metadata, timeout=120)
+    except Exception:
+        record_upload_error()
+        metrics.GCS_UPLOAD_ERRORS.inc("async")
+        raise
+    elapsed = time.perf_counter() - started
+    metrics.GCS_UPLOAD_LATENCY.observe(elapsed, "async")
+    metrics.GCS_UPLOAD_BYTES.inc("async", amount=len(data))
+    record_upload(len(data), elapsed)
+    return public_url(BUCKET_NAME, blob_name)
+
+
+async def blob_metadata(blob_name):
+    """Async get_blob_metadata(): {"size", "content_type", "crc32c", "public_url"}, or None if missing."""
+    import aiohttp
+
+    try:
+        meta = await storage().download_metadata(BUCKET_NAME, blob_name)
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            return None
+        raise
+    return {
+        "size": int(meta["size"]),
+        "content_type": meta.get("contentType"),
+        "crc32c": meta.get("crc32c"),
+        "public_url": public_url(BUCKET_NAME, blob_name),
+    }
+
+
+async def upload_if_missing(data, blob_name, content_type, crc32c):
+    """Async storage_client.upload_if_missing(): returns (public_url, uploaded)."""
+    existing = await blob_metadata(blob_name)
+    if existing is not None and existing["crc32c"] == crc32c:
+        record_upload_skipped()
+        metrics.GCS_UPLOADS_SKIPPED.inc()
+        return existing["public_url"], False
+    return await upload_bytes(data, blob_name, content_type, crc32c), True
+
+
+async def build_derivatives_async(data, base_blob_name):
+    """build_derivatives() with rendering on the process pool and uploads in parallel."""
+    loop = asyncio.get_running_loop()
+    rendered = await loop.run_in_executor(get_executor(), render_derivatives, data)
+    names = [derivative_blob_name(base_blob_name, width, ext) for width, _, ext, _ in rendered]
+    urls = await asyncio.gather(*(
+        upload_bytes(body, name, content_type)
+        for name, (_, content_type, _, body) in zip(names, rendered)
+    ))
+    variants = {}
+    for (width, content_type, _, _), url in zip(rendered, urls):
+        variants.setdefault(content_type, []).append([width, url])
+    return {ct: variants[ct] for ct, _, _ in FORMATS if ct in variants}
+
+
+# ---------------- User Endpoints -----------------
+
+async def register(request):
+    data = await read_json(request)
+    username = data.get("username")
+    password = data.get("password")
+    email = data.get("email", None)
+    if not username or not password:
+        return error({"error": "Username and password are required"}, 400)
+
+    password_hash = await asyncio.to_thread(hash_password, password)
+    if state.pool is None:
+        return no_database()
+    try:
+        user_id = await state.pool.fetchval(_pg(wsgi.REGISTER_USER_SQL), username, password_hash, email)
+    except Exception as e:
+        log.error("Error during registration: %s", e)
+        return error({"error": str(e)}, 500)
+    if user_id is None:
+        return error({"error": "Username already exists"}, 409)
+    await asyncio.to_thread(user_cache.invalidate, user_id)
+    return JSONResponse({"id": user_id, "username": username, "email": email}, status_code=201)
+
+
+async def login(request):
+    data = await read_json(request)
+    username = data.get("username")
+    password = data.get("password")
+    if not username or not password:
+        return error({"msg": "Username and password required"}, 400)
+    if state.pool is None:
+        return error({"msg": "Database connection failed"}, 500)
+
+    try:
+        row = await state.pool.fetchrow(_pg(wsgi.LOGIN_USER_SQL), username)
+    except Exception as e:
+        log.error("Error during login: %s", e)
+        return error({"msg": str(e)}, 500)
+    if not row:
+        return error({"msg": "Bad username or password"}, 401)
+    user_id, password_hash = row
+    if not await asyncio.to_thread(verify_password, password_hash, password):
+        return error({"msg": "Bad username or password"}, 401)
+
+    try:
+        upgraded_hash = await asyncio.to_thread(rehash_if_needed, password_hash, password)
+    except HashingOverloaded:
+        upgraded_hash = None
+    if upgraded_hash:
+        try:
+            await state.pool.execute(
+                _pg("UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s"),
+                upgraded_hash, user_id, password_hash
+            )
+        except Exception as e:
+            log.error("Error upgrading password hash: %s", e)
+    return JSONResponse({"access_token": issue_token(username, user_id)})
+
+
+async def fetch_user(user_id=None, username=None):
+    if state.pool is None:
+        raise RuntimeError("Database connection failed")
+    if user_id is not None:
+        row = await state.pool.fetchrow(_pg(wsgi.GET_USER_SQL), user_id)
+    else:
+        row = await state.pool.fetchrow(_pg(wsgi.GET_USER_BY_NAME_SQL), username)
+    return wsgi.user_from_row(row) if row else None
+
+
+async def profile(request):
+    claims, denied = jwt_claims(request)
+    if denied:
+        return denied
+    user_id = claims.get("uid")
+    try:
+        if user_id is not None:
+            # user_cache is synchronous (and may call Redis), so consult it on a
+            # thread; a miss loads through the pool back on the event loop.
+            loop = asyncio.get_running_loop()
+            user = await asyncio.to_thread(
+                user_cache.get_or_load, user_id,
+                lambda: asyncio.run_coroutine_threadsafe(fetch_user(user_id=user_id), loop).result()
+            )
+        else:
+            user = await fetch_user(username=claims["sub"])
+    except Exception as e:
+        log.error("Error fetching profile: %s", e)
+        return error({"error": str(e)}, 500)
+    if not user:
+        return error({"error": "User not found"}, 404)
+    return cacheable(request, dumps(user))
+
+
+async def forgot_password(request):
+    data = await read_json(request)
+    username = data.get("username")
+    if not username:
+        return error({"error": "Username is required"}, 400)
+    if state.pool is None:
+        return no_database()
+    try:
+        user = await state.pool.fetchval(_pg("SELECT id FROM users WHERE username = %s"), username)
+    except Exception as e:
+        return error({"error": str(e)}, 500)
+    if not user:
+        return error({"error": "User not found"}, 404)
+    token = serializer.dumps(username, salt="password-reset-salt")
+    return JSONResponse({"reset_token": token, "message": "Use this token with /reset-password within 15 minutes"})
+
+
+async def reset_password(request):
+    data = await read_json(request)
+    token = data.get("token")
+    new_password = data.get("new_password")
+    if not token or not new_password:
+        return error({"error": "Token and new password are required"}, 400)
+    try:
+        username = serializer.loads(token, salt="password-reset-salt", max_age=900)
+    except SignatureExpired:
+        return error({"error": "The reset token has expired"}, 400)
+    except BadSignature:
+        return error({"error": "Invalid reset token"}, 400)
+
+    new_password_hash = await asyncio.to_thread(hash_password, new_password)
+    if state.pool is None:
+        return no_database()
+    try:
+        row = await state.pool.fetchrow(
+            _pg("UPDATE users SET password_hash = %s WHERE username = %s RETURNING id, username, email"),
+            new_password_hash, username
+        )
+    except Exception as e:
+        log.error("Error resetting password: %s", e)
+        return error({"error": str(e)}, 500)
+    if not row:
+        return error({"error": "User not found"}, 404)
+    await asyncio.to_thread(user_cache.invalidate, row[0])
+    return JSONResponse({"message": f"Password updated for user '{username}'"})
+
+
+async def request_verification(request):
+    username, denied = jwt_identity(request)
+    if denied:
+        return denied
+    token = serializer.dumps(username, salt="email-verification-salt")
+    return JSONResponse({"verification_token": token, "message": "Use this token with /verify-email within one hour"})
+
+
+async def verify_email(request):
+    data = await read_json(request)
+    token = data.get("token")
+    if not token:
+        return error({"error": "Token is required"}, 400)
+    try:
+        username = serializer.loads(token, salt="email-verification-salt", max_age=3600)
+    except SignatureExpired:
+        return error({"error": "The verification token has expired"}, 400)
+    except BadSignature:
+        return error({"error": "Invalid verification token"}, 400)
+
+    if state.pool is None:
+        return no_database()
+    try:
+        row = await state.pool.fetchrow(
+            _pg("UPDATE users SET is_verified = TRUE WHERE username = %s RETURNING id, username, email, is_verified"),
+            username
+        )
+    except Exception as e:
+        log.error("Error during email verification: %s", e)
+        return error({"error": str(e)}, 500)
+    if not row:
+        return error({"error": "User not found"}, 404)
+    await asyncio.to_thread(user_cache.invalidate, row[0])
+    return JSONResponse({
+        "message": f"Email verified for user '{username}'",
+        "user": {"id": row[0], "username": row[1], "email": row[2], "is_verified": row[3]}
+    })
+
+
+async def get_all_users(request):
+    current_user, denied = jwt_identity(request)
+    if denied:
+        return denied
+    if current_user != "admin":
+        return error({"error": "Unauthorized"}, 403)
+
+    try:
+        limit, position = parse_page_args(request.query_params)
+        last_id = cursor_id(position)
+        clauses, params = wsgi.user_filters(request.query_params)
+    except ValueError as e:
+        return error({"error": str(e)}, 400)
+    if last_id is not None:
+        clauses.append("id > %s::bigint")
+        params.append(last_id)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+
+    if state.pool is None:
+        return no_database()
+    try:
+        rows = await state.pool.fetch(
+            _pg(f"SELECT id, {wsgi.USER_JSON} FROM users {where} ORDER BY id LIMIT %s"),
+            *params, limit + 1
+        )
+    except Exception as e:
+        log.error("Error fetching users: %s", e)
+        return error({"error": str(e)}, 500)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor({"id": rows[-1][0]}) if has_more else None
+    return Response(json_page("users", [row[1] for row in rows], next_cursor), media_type="application/json")
+
+
+async def export_users(request):
+    """
+    Streams every matching user as NDJSON (default) or CSV from a server-side
+    cursor, EXPORT_BATCH_SIZE rows per round trip.
+    """
+    current_user, denied = jwt_identity(request)
+    if denied:
+        return denied
+    if current_user != "admin":
+        return error({"error": "Unauthorized"}, 403)
+
+    export_format = request.query_params.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return error({"error": "format must be ndjson or csv"}, 400)
+    try:
+        clauses, params = wsgi.user_filters(request.query_params)
+    except ValueError as e:
+        return error({"error": str(e)}, 400)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    if export_format == "csv":
+        query = _pg(f"SELECT id, username, email, is_verified, created_at FROM users {where} ORDER BY id")
+    else:
+        query = _pg(f"SELECT {wsgi.USER_JSON} FROM users {where} ORDER BY id")
+
+    async def generate():
+        if state.pool is None:
+            raise RuntimeError("Database connection failed")
+        async with state.pool.acquire() as conn:
+            # asyncpg cursors only exist inside a transaction.
+            async with conn.transaction():
+                rows = conn.cursor(query, *params, prefetch=EXPORT_BATCH_SIZE)
+                if export_format == "csv":
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+                    writer.writerow(["id", "username", "email", "is_verified", "created_at"])
+                    async for row in rows:
+                        writer.writerow([row[0], row[1], row[2], row[3], row[4].isoformat() if row[4] else ""])
+                        if buf.tell() >= 65536:
+                            yield buf.getvalue()
+                            buf.seek(0)
+                            buf.truncate()
+                    yield buf.getvalue()
+                else:
+                    async for row in rows:
+                        yield row[0] + "\n"
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        generate(), media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{export_format}"}
+    )
+
+
+async def copy_imported_rows(ready):
+    async with state.pool.acquire() as conn:
+        ids = [r[0] for r in await conn.fetch(_pg(bulk_import.ALLOCATE_IDS_SQL), len(ready))]
+        records = [bulk_import.record_for(poster_id, row) for poster_id, (_, row) in zip(ids, ready)]
+        with metrics.db_timer("copy_posters"):
+            await conn.copy_records_to_table("posters", records=records, columns=bulk_import.COLUMNS)
+    return [bulk_import.created(row_no, poster_id) for poster_id, (row_no, _) in zip(ids, ready)]
+
+
+async def insert_imported_rows(ready):
+    """Row-by-row fallback for a batch whose COPY failed."""
+    reports = []
+    async with state.pool.acquire() as conn:
+        for row_no, row in ready:
+            try:
+                poster_id = await conn.fetchval(_pg(bulk_import.ALLOCATE_IDS_SQL), 1)
+                await conn.execute(_pg(bulk_import.INSERT_IMPORTED_SQL), *bulk_import.record_for(poster_id, row))
+                reports.append(bulk_import.created(row_no, poster_id))
+            except Exception as e:
+                reports.append(bulk_import.failure(row_no, str(e)))
+    return reports
+
+
+async def import_posters_async(rows, images):
+    """Async counterpart of bulk_import.import_posters(): uploads run as coroutines, at most IMPORT_UPLOAD_THREADS at once."""
+    limit = asyncio.Semaphore(bulk_import.UPLOAD_THREADS)
+    # Rows naming the same image share one upload for the whole import.
+    uploads = {}
+
+    async def upload(row):
+        async with limit:
+            data = await asyncio.to_thread(images.read, row["image"])
+            content_hash, crc32c = await asyncio.to_thread(checksums, data)
+            blob_name = content_blob_name(content_hash, row["content_type"], row["image"])
+            url, _ = await upload_if_missing(data, blob_name, row["content_type"], crc32c)
+            return url, content_hash
+
+    for batch in bulk_import.batches(rows):
+        reports, ready, pending = bulk_import.prepare_batch(batch, images)
+        for _, row in pending:
+            if row["image"] not in uploads:
+                uploads[row["image"]] = asyncio.ensure_future(upload(row))
+        results = await asyncio.gather(*(uploads[row["image"]] for _, row in pending), return_exceptions=True)
+        for (row_no, row), result in zip(pending, results):
+            if isinstance(result, Exception):
+                # Later batches naming the image try again.
+                uploads.pop(row["image"], None)
+                log.warning("Import upload failed: %s", result, extra={"row": row_no})
+                reports.append(bulk_import.failure(row_no, f"Upload failed: {result}"))
+            else:
+                row["photo_url"], row["content_hash"] = result
+                ready.append((row_no, row))
+        if ready:
+            ready.sort(key=lambda item: item[0])
+            try:
+                reports.extend(await copy_imported_rows(ready))
+            except Exception as e:
+                log.warning("COPY of an import batch failed, inserting row by row: %s", e)
+                reports.extend(await insert_imported_rows(ready))
+        reports.sort(key=lambda report: report["row"])
+        for report in reports:
+            yield report
+
+
+async def bulk_import_posters(request):
+    """Async counterpart of app.bulk_import_posters()."""
+    current_user, denied = jwt_identity(request)
+    if denied:
+        return denied
+    if current_user != "admin":
+        return error({"error": "Unauthorized"}, 403)
+
+    form = await request.form()
+    metadata = form.get("metadata")
+    images_file = form.get("images")
+    if metadata is None or isinstance(metadata, str):
+        await form.close()
+        return error({"error": "A metadata file is required"}, 400)
+    try:
+        import_format = bulk_import.detect_format(metadata.filename, form.get("format"))
+        rows = bulk_import.read_rows(metadata.file, import_format)
+        images = None
+        if images_file is not None and not isinstance(images_file, str):
+            images = await asyncio.to_thread(bulk_import.open_images, images_file.file)
+    except ValueError as e:
+        await form.close()
+        return error({"error": str(e)}, 400)
+    if state.pool is None:
+        await form.close()
+        return no_database()
+
+    async def generate():
+        counts = {"created": 0, "failed": 0}
+        try:
+            async for report in import_posters_async(rows, images):
+                counts[report["status"]] += 1
+                yield dumps(report) + b"\n"
+        except Exception as e:
+            log.exception("Bulk import stopped")
+            yield dumps({"error": f"Import stopped: {e}"}) + b"\n"
+        finally:
+            await form.close()
+            if counts["created"]:
+                poster_page_cache.invalidate_where(lambda key: key[0] is None)
+        yield dumps({"summary": counts}) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+# ---------------- Poster Endpoints -----------------
+
+async def process_poster_job(job):
+    """Async counterpart of app.process_poster_job()."""
+    photo_url = variants = None
+    if job["payload"] is not None:
+        await state.pool.execute(_pg(SET_PROGRESS_SQL), "uploading", job["id"])
+        blob_name = re.sub(r'[^a-z0-9\-_.]', '', job["blob_name"].lower())
+        if job["content_hash"]:
+            photo_url, uploaded = await upload_if_missing(
+                job["payload"], blob_name, job["content_type"], job["content_crc32c"]
+            )
+        else:
+            # Queued before uploads were content-addressed.
+            photo_url = await upload_bytes(job["payload"], blob_name, job["content_type"])
+            uploaded = True
+        if not uploaded:
+            variants = await state.pool.fetchval(_pg(wsgi.FIND_VARIANTS_SQL), job["content_hash"])
+        if variants is None:
+            await state.pool.execute(_pg(SET_PROGRESS_SQL), "resizing", job["id"])
+            # Derivatives are best effort: the backfill command picks up posters without them.
+            try:
+                variants = await build_derivatives_async(job["payload"], blob_name)
+            except Exception as e:
+                log.warning("Derivative rendering failed: %s", e, extra={"job_id": job["id"]})
+
+    async with state.pool.acquire() as conn:
+        async with conn.transaction():
+            poster_id = await conn.fetchval(
+                _pg(wsgi.INSERT_POSTER_SQL),
+                job["title"], job["description"], job["artist"], photo_url, variants or None, job["content_hash"]
+            )
+            await conn.execute(_pg(COMPLETE_SQL), poster_id, job["id"])
+    log.info("Poster job created poster", extra={"job_id": job["id"], "poster_id": poster_id})
+    poster_page_cache.invalidate_where(lambda key: key[0] is None)
+
+
+async def run_job_once():
+    """Claims and processes at most one job. Returns False if the queue was empty."""
+    row = await state.pool.fetchrow(_pg(CLAIM_SQL), LOCK_TIMEOUT)
+    if row is None:
+        return False
+    job = job_from_claim_row(row)
+    with logs.correlation(f"job-{job['id']}"):
+        try:
+            await process_poster_job(job)
+        except Exception as e:
+            log.warning("Poster job attempt failed: %s", e, extra={"job_id": job["id"], "attempt": job["attempts"]})
+            if job["attempts"] < job["max_attempts"]:
+                await state.pool.execute(_pg(RETRY_SQL), str(e), retry_delay(job["attempts"]), job["id"])
+            else:
+                await state.pool.execute(_pg(FAIL_SQL), str(e), job["id"])
+    return True
+
+
+async def job_worker():
+    while True:
+        try:
+            worked = state.pool is not None and await run_job_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("Poster job worker error")
+            worked = False
+        if not worked:
+            try:
+                await asyncio.wait_for(state.job_wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            state.job_wake.clear()
+
+
+async def enqueue_poster_job(username, title, description, artist, blob_name, content_type, photo,
+                             content_hash, content_crc32c):
+    """Async counterpart of jobs.enqueue_poster_job(): the photo is read from its spool on a thread."""
+    async with state.pool.acquire() as conn:
+        job_id = await conn.fetchval(_pg(NEXT_JOB_ID_SQL))
+        chunks = copy_job_chunks(
+            (job_id, username, title, description, artist, blob_name, content_type,
+             content_hash, content_crc32c, MAX_ATTEMPTS),
+            photo
+        )
+
+        async def source():
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+
+        with metrics.db_timer("copy_job"):
+            await conn.copy_to_table("poster_jobs", source=source(), columns=COPY_JOB_COLUMNS)
+    return job_id
+
+
+async def create_poster_with_photo(request):
+    try:
+        current_user, denied = jwt_identity(request)
+        if denied:
+            return denied
+
+        form = await request.form()
+        title = form.get("title")
+        description = form.get("description")
+        artist = form.get("artist")
+        if not title:
+            return error({"error": "Title is required"}, 400)
+
+        # Copy the photo from its spool into the job row; the bucket upload
+        # happens in a worker. The body was capped by BodyLimitMiddleware while
+        # it was parsed.
+        try:
+            file_obj = form.get("photo")
+            blob_name = content_type = photo = content_hash = crc32c = None
+            if file_obj is not None and not isinstance(file_obj, str):
+                content_type = file_obj.content_type
+                if not uploads.accepts(request.url.path, content_type):
+                    return error({"error": f"{content_type or 'Untyped'} uploads are not accepted here"}, 415)
+                try:
+                    _, content_hash, crc32c = await asyncio.to_thread(
+                        hash_stream, file_obj.file, max_bytes=MAX_PHOTO_BYTES
+                    )
+                except ValueError as e:
+                    return error({"error": str(e)}, 413)
+                photo = file_obj.file
+                blob_name = content_blob_name(content_hash, content_type, file_obj.filename)
+
+            if state.pool is None:
+                return no_database()
+            try:
+                job_id = await enqueue_poster_job(
+                    current_user, title, description, artist, blob_name, content_type, photo,
+                    content_hash, crc32c
+                )
+            except Exception as db_e:
+                log.error("Error queueing poster: %s", db_e)
+                return error({"error": "Error creating poster", "details": str(db_e)}, 500)
+        finally:
+            await form.close()
+
+        state.job_wake.set()
+        return JSONResponse(
+            {"job_id": job_id, "status": "queued", "status_url": f"/posters/jobs/{job_id}"},
+            status_code=202
+        )
+    except Exception as e:
+        log.exception("Unhandled exception in /posters/upload")
+        return error({"error": "An unexpected error occurred", "details": str(e)}, 500)
+
+
+async def get_poster_job(request):
+    current_user, denied = jwt_identity(request)
+    if denied:
+        return denied
+    if state.pool is None:
+        return no_database()
+    try:
+        row = await state.pool.fetchrow(_pg(GET_JOB_SQL), request.path_params["job_id"])
+    except Exception as e:
+        log.error("Error fetching poster job: %s", e)
+        return error({"error": str(e)}, 500)
+    job = job_status_from_row(row) if row else None
+    if not job or (job.pop("username") != current_user and current_user != "admin"):
+        return error({"error": "Job not found"}, 404)
+    return JSONResponse(job)
+
+
+async def create_poster_upload_url(request):
+    current_user, denied = jwt_identity(request)
+    if denied:
+        return denied
+    data = await read_json(request)
+    title = data.get("title")
+    content_type = data.get("content_type") or ""
+    size = data.get("size")
+    if not title:
+        return error({"error": "Title is required"}, 400)
+    if not content_type.startswith("image/"):
+        return error({"error": "content_type must be an image type"}, 400)
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return error({"error": "size must be a positive integer"}, 400)
+    if size > MAX_PHOTO_BYTES:
+        return error({"error": f"Photo exceeds the {MAX_PHOTO_BYTES} byte limit"}, 413)
+
+    raw_filename = data.get("filename") or "upload"
+    safe_filename = re.sub(r'[^a-z0-9\-_.]', '', raw_filename.lower())
+    blob_name = f"{uuid.uuid4()}_{safe_filename}"
+    try:
+        # Signing may call the IAM API; keep it off the loop.
+        upload_url, upload_headers = await asyncio.to_thread(
+            generate_upload_url, BUCKET_NAME, blob_name, content_type, size, SIGNED_URL_TTL
+        )
+    except Exception as e:
+        log.error("Error signing upload URL: %s", e)
+        return error({"error": "Direct uploads are unavailable", "details": str(e)}, 503)
+
+    if state.pool is None:
+        return no_database()
+    try:
+        pending_id, expires_at = await state.pool.fetchrow(
+            _pg("INSERT INTO pending_posters (username, title, description, artist, blob_name, content_type, "
+                "expected_size, expires_at) VALUES (%s, %s, %s, %s, %s, %s, %s, now() + %s * interval '1 second') "
+                "RETURNING id, expires_at"),
+            current_user, title, data.get("description"), data.get("artist"), blob_name,
+            content_type, size, float(SIGNED_URL_TTL)
+        )
+    except Exception as e:
+        log.error("Error creating pending poster: %s", e)
+        return error({"error": str(e)}, 500)
+
+    return JSONResponse({
+        "pending_id": pending_id,
+        "upload_url": upload_url,
+        "upload_method": "PUT",
+        "upload_headers": upload_headers,
+        "expires_at": expires_at,
+        "finalize_url": f"/posters/pending/{pending_id}/finalize"
+    }, status_code=201)
+
+
+async def finalize_poster_upload(request):
+    current_user, denied = jwt_identity(request)
+    if denied:
+        return denied
+    pending_id = request.path_params["pending_id"]
+    if state.pool is None:
+        return no_database()
+    try:
+        pending = await state.pool.fetchrow(
+            _pg("SELECT username, title, description, artist, blob_name, content_type, expected_size, "
+                "poster_id, expires_at < now() FROM pending_posters WHERE id = %s"),
+            pending_id
+        )
+    except Exception as e:
+        log.error("Error fetching pending poster: %s", e)
+        return error({"error": str(e)}, 500)
+    if not pending or pending[0] != current_user:
+        return error({"error": "Pending poster not found"}, 404)
+    _, title, description, artist, blob_name, content_type, expected_size, poster_id, expired = pending
+    if poster_id is None and expired:
+        return error({"error": "The upload URL has expired"}, 410)
+
+    photo_url = None
+    if poster_id is None:
+        try:
+            meta = await blob_metadata(blob_name)
+        except Exception as e:
+            log.error("Error checking uploaded object: %s", e)
+            return error({"error": "Failed to verify upload", "details": str(e)}, 502)
+        if meta is None:
+            return error({"error": "Photo has not been uploaded yet"}, 409)
+        if meta["size"] != expected_size or meta["content_type"] != content_type:
+            return error({
+                "error": "Uploaded photo does not match the announced size or type",
+                "expected": {"size": expected_size, "content_type": content_type},
+                "actual": {"size": meta["size"], "content_type": meta["content_type"]}
+            }, 422)
+        photo_url = meta["public_url"]
+
+    status = 200
+    try:
+        row = None
+        if poster_id is None:
+            row = await state.pool.fetchrow(
+                _pg(wsgi.FINALIZE_PENDING_SQL), pending_id, title, description, artist, photo_url
+            )
+            if row:
+                status = 201
+        if row is None:
+            row = await state.pool.fetchrow(_pg(wsgi.FINALIZED_POSTER_SQL), pending_id)
+    except Exception as e:
+        log.error("Error finalizing poster: %s", e)
+        return error({"error": "Error creating poster", "details": str(e)}, 500)
+
+    if status == 201:
+        log.info("Created poster", extra={"poster_id": row[0]})
+        poster_page_cache.invalidate_where(lambda key: key[0] is None)
+    return JSONResponse({
+        "id": row[0],
+        "title": row[1],
+        "description": row[2],
+        "artist": row[3],
+        "photo_url": row[4]
+    }, status_code=status)
+
+
+async def load_posters_validators():
+    if state.pool is None:
+        raise RuntimeError("Database connection failed")
+    return conditional.watermark_validators(*await state.pool.fetchrow(_pg(wsgi.POSTERS_WATERMARK_SQL)))
+
+
+async def load_posters_page(limit, last_id):
+    """Async counterpart of app.load_posters_page(), watermark first as well."""
+    if state.pool is None:
+        raise RuntimeError("Database connection failed")
+    async with state.pool.acquire() as conn:
+        validators = conditional.watermark_validators(*await conn.fetchrow(_pg(wsgi.POSTERS_WATERMARK_SQL)))
+        if last_id is None:
+            rows = await conn.fetch(_pg(wsgi.LIST_POSTERS_SQL), limit + 1)
+        else:
+            rows = await conn.fetch(_pg(wsgi.LIST_POSTERS_AFTER_SQL), last_id, limit + 1)
+    return validators, wsgi.posters_page_body(rows, limit)
+
+
+async def cached_posters_page(limit, last_id):
+    """
+    poster_page_cache.get_or_load() for the event loop: concurrent misses on
+    one key await a single query instead of blocking a thread each.
+    """
+    key = (last_id, limit)
+    page = poster_page_cache.get(key)
+    if page is not None:
+        return page
+    load = state.loads.get(key)
+    if load is None:
+        generation = poster_page_cache.generation
+        load = asyncio.ensure_future(load_posters_page(limit, last_id))
+        state.loads[key] = load
+        load.add_done_callback(lambda done: finish_load(key, done, generation))
+    # Shielded so a client that disconnects doesn't cancel the load for the others.
+    return await asyncio.shield(load)
+
+
+def finish_load(key, load, generation):
+    state.loads.pop(key, None)
+    if not load.cancelled() and load.exception() is None:
+        # Not if a write invalidated the cache while the page was loading.
+        poster_page_cache.set(key, load.result(), generation=generation)
+
+
+async def list_posters(request):
+    try:
+        limit, position = parse_page_args(request.query_params)
+        last_id = cursor_id(position)
+    except ValueError as e:
+        return error({"error": str(e)}, 400)
+    try:
+        if conditional.is_conditional(request.headers):
+            # As in app.list_posters(): answer from the watermark, and drop a
+            # cached page whose validators it has moved past.
+            validators = await load_posters_validators()
+            if conditional.not_modified(request.headers, *validators):
+                return cacheable(request, None, *validators, headers={"Vary": "Accept-Encoding"})
+            page = poster_page_cache.get((last_id, limit))
+            if page is not None and page[0] != validators:
+                poster_page_cache.invalidate((last_id, limit))
+        validators, body = await cached_posters_page(limit, last_id)
+    except Exception as e:
+        log.error("Error fetching posters: %s", e)
+        return error({"error": str(e)}, 500)
+    data, encoding = body.encoded(compression.choose_encoding(request.headers.get("Accept-Encoding")))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return cacheable(request, data, *validators, headers=headers)
+
+
+async def load_posters(ids):
+    """Async counterpart of app.load_posters()."""
+    found, missing = wsgi.cached_posters(ids)
+    if missing:
+        if state.pool is None:
+            raise RuntimeError("Database connection failed")
+        wsgi.store_posters(found, await state.pool.fetch(_pg(wsgi.GET_POSTERS_SQL), missing))
+    return found
+
+
+async def get_posters_batch(request):
+    try:
+        ids = parse_ids(request.query_params)
+    except ValueError as e:
+        return error({"error": str(e)}, 400)
+    try:
+        found = await load_posters(ids)
+    except Exception as e:
+        log.error("Error fetching posters: %s", e)
+        return error({"error": str(e)}, 500)
+    return cacheable(request, wsgi.posters_batch_body(ids, found))
+
+
+async def get_poster(request):
+    poster_id = request.path_params["poster_id"]
+    try:
+        found = await load_posters([poster_id])
+    except Exception as e:
+        log.error("Error fetching poster: %s", e)
+        return error({"error": str(e)}, 500)
+    if poster_id not in found:
+        return error({"error": "Poster not found"}, 404)
+    return cacheable(request, found[poster_id].encode())
+
+
+async def search_posters(request):
+    q = (request.query_params.get("q") or "").strip()
+    if not q:
+        return error({"error": "q is required"}, 400)
+    try:
+        limit, position = parse_page_args(request.query_params)
+        after = cursor_rank(position)
+    except ValueError as e:
+        return error({"error": str(e)}, 400)
+
+    if state.pool is None:
+        return no_database()
+    try:
+        if after is None:
+            rows = await state.pool.fetch(_pg(wsgi.SEARCH_POSTERS_SQL), q, limit + 1)
+        else:
+            rows = await state.pool.fetch(_pg(wsgi.SEARCH_POSTERS_AFTER_SQL), q, after[0], after[1], limit + 1)
+    except Exception as e:
+        log.error("Error searching posters: %s", e)
+        return error({"error": str(e)}, 500)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor({"rank": rows[-1][2], "id": rows[-1][0]}) if has_more else None
+    return cacheable(request, json_page("posters", [row[1] for row in rows], next_cursor))
+
+
+# ---------------- Readiness -----------------
+
+async def init_connection(conn):
+    await conn.set_type_codec("jsonb", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def warm_up():
+    """
+    Opens the pool, retrying with backoff until the database answers. The
+    pool is opened whatever WARM_UP says, since requests have no other way to
+    reach the database; "storage" additionally builds the storage client,
+    importing its modules on a thread so the loop keeps serving.
+    """
+    started = time.monotonic()
+    delay = 0.5
+    while state.pool is None:
+        try:
+            state.pool = await asyncpg.create_pool(
+                database=os.environ["DB_NAME"],
+                user=os.environ["DB_USER"],
+                password=os.environ["DB_PASSWORD"],
+                host=os.environ["DB_HOST"],
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                max_queries=DB_POOL_MAX_USES,
+                max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                init=init_connection,
+                connection_class=TimedConnection,
+            )
+            state.readiness["db"] = True
+            state.readiness["error"] = None
+        except Exception as e:
+            state.readiness["error"] = str(e)
+            log.warning("Warm-up not complete, retrying: %s", e)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+    if "storage" in wsgi.WARM_UP:
+        await asyncio.to_thread(importlib.import_module, "gcloud.aio.storage")
+        storage()
+    log.info("Warm-up complete", extra={"parts": wsgi.WARM_UP, "seconds": round(time.monotonic() - started, 3)})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+
+async def startup():
+    state.job_wake = asyncio.Event()
+    state.tasks = [asyncio.create_task(warm_up())]
+    state.tasks += [asyncio.create_task(job_worker()) for _ in range(POSTER_WORKERS)]
+
+
+async def shutdown():
+    for task in state.tasks:
+        task.cancel()
+    await asyncio.gather(*state.tasks, return_exceptions=True)
+    if state.pool is not None:
+        await state.pool.close()
+    if state.session is not None:
+        await state.session.close()
+
+
+async def readyz(request):
+    ready = all(state.readiness[part] for part in {"db", *wsgi.WARM_UP})
+    return JSONResponse({"ready": ready, **state.readiness}, status_code=200 if ready else 503)
+
+
+async def debug_pool(request):
+    denied = ops_denied(request)
+    if denied:
+        return denied
+    if state.pool is None:
+        return JSONResponse({"size": 0, "idle": 0, "max": DB_POOL_MAX})
+    return JSONResponse({"size": state.pool.get_size(), "idle": state.pool.get_idle_size(), "max": DB_POOL_MAX})
+
+
+async def debug_cache(request):
+    denied = ops_denied(request)
+    if denied:
+        return denied
+    return JSONResponse(wsgi.cache_stats())
+
+
+def async_pool_gauges():
+    if state.pool is None:
+        return []
+    size, idle = state.pool.get_size(), state.pool.get_idle_size()
+    return [(("size",), size), (("in_use",), size - idle), (("idle",), idle), (("max",), DB_POOL_MAX)]
+
+
+metrics.gauge("db_async_pool_connections", "asyncpg pool connections by state.", ("state",), async_pool_gauges)
+
+
+async def prometheus_metrics(request):
+    denied = ops_denied(request)
+    if denied:
+        return denied
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+async def debug_storage(request):
+    denied = ops_denied(request)
+    if denied:
+        return denied
+    return JSONResponse(storage_stats())
+
+
+async def debug_multipart(request):
+    form = await request.form()
+    try:
+        log.debug("Debug multipart form received", extra={"form_keys": list(form.keys())})
+        # Text fields only, as request.form holds in app.py.
+        return JSONResponse({k: v for k, v in form.items() if isinstance(v, str)})
+    finally:
+        await form.close()
+
+
+async def debug_hashing(request):
+    denied = ops_denied(request)
+    if denied:
+        return denied
+    return JSONResponse(hashing_stats())
+
+
+async def hashing_overloaded(request, exc):
+    return JSONResponse({"error": "Server is busy, please retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+
+
+async def unhandled(request, exc):
+    log.error("Unhandled exception in %s", request.url.path, exc_info=exc)
+    return error({"error": str(exc)}, 500)
+
+
+routes = [
+    Route("/register", register, methods=["POST"]),
+    Route("/login", login, methods=["POST"]),
+    Route("/profile", profile, methods=["GET"]),
+    Route("/forgot-password", forgot_password, methods=["POST"]),
+    Route("/reset-password", reset_password, methods=["POST"]),
+    Route("/request-verification", request_verification, methods=["POST"]),
+    Route("/verify-email", verify_email, methods=["POST"]),
+    Route("/admin/users", get_all_users, methods=["GET"]),
+    Route("/admin/users/export", export_users, methods=["GET"]),
+    Route("/admin/posters/import", bulk_import_posters, methods=["POST"]),
+    Route("/posters/upload", create_poster_with_photo, methods=["POST"]),
+    Route("/posters/jobs/{job_id:int}", get_poster_job, methods=["GET"]),
+    Route("/posters/upload-url", create_poster_upload_url, methods=["POST"]),
+    Route("/posters/pending/{pending_id:int}/finalize", finalize_poster_upload, methods=["POST"]),
+    Route("/posters", list_posters, methods=["GET"]),
+    Route("/posters/search", search_posters, methods=["GET"]),
+    Route("/posters/batch", get_posters_batch, methods=["GET"]),
+    Route("/posters/{poster_id:int}", get_poster, methods=["GET"]),
+    Route("/readyz", readyz, methods=["GET"]),
+    Route("/debug-multipart", debug_multipart, methods=["POST"]),
+    Route("/debug-pool", debug_pool, methods=["GET"]),
+    Route("/debug-cache", debug_cache, methods=["GET"]),
+    Route("/debug-storage", debug_storage, methods=["GET"]),
+    Route("/debug-hashing", debug_hashing, methods=["GET"]),
+    Route("/metrics", prometheus_metrics, methods=["GET"]),
+]
+
+# endpoint -> route template, for low-cardinality metric labels
+ROUTE_PATHS = {route.endpoint: route.path for route in routes}
+
+
+class MetricsMiddleware:
+    """Records http_request_duration_seconds and http_requests_total per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched endpoint in the shared scope.
+            route = ROUTE_PATHS.get(scope.get("endpoint"), "unmatched")
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route, scope["method"])
+            metrics.HTTP_REQUESTS.inc(route, scope["method"], str(status))
+
+
+class BodyLimitMiddleware:
+    """
+    Caps request bodies at uploads.body_limit() for their path, answering 413
+    from here: up front when Content-Length is over the limit, otherwise as
+    soon as the bytes received pass it. The app then sees a disconnect, and
+    whatever it sends afterwards is dropped.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        limit = uploads.body_limit(path)
+        too_large = error({"error": uploads.too_large_message(path)}, 413)
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await too_large(scope, receive, send)
+            return
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    await too_large(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except ClientDisconnect:
+            if not rejected:
+                raise
+
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(MetricsMiddleware),
+        Middleware(logs.RequestIdMiddleware),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(BodyLimitMiddleware),
+        # Responses that already carry Content-Encoding (cached poster pages) pass through.
+        Middleware(GZipMiddleware, minimum_size=compression.MIN_SIZE, compresslevel=compression.GZIP_LEVEL),
+    ],
+    exception_handlers={HashingOverloaded: hashing_overloaded, Exception: unhandled},
+    lifespan=lifespan,
+)
@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import os
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+from flask_jwt_extended import create_access_token, decode_token
+from jwt.exceptions import ExpiredSignatureError, InvalidSignatureError
+
+from cache import TTLCache
+
+# Verified tokens are remembered for at most this many seconds, and never
+# past their own exp claim.
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 300))
+
+token_cache = TTLCache(
+    maxsize=int(os.environ.get("TOKEN_CACHE_SIZE", 10000)),
+    ttl=TOKEN_CACHE_TTL,
+    name="verified_tokens",
+)
+
+# Bearer token that may read /metrics and the /debug-* endpoints in place of
+# an admin's JWT, for scrapers (Prometheus's bearer_token). Unset, only
+# admins can read them.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+class AuthError(Exception):
+    """A request could not be authenticated; carries the status and message to return."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def issue_token(username, user_id):
+    """Access token whose sub is the username, with the numeric user id in the uid claim."""
+    return create_access_token(identity=username, additional_claims={"uid": user_id})
+
+
+def verify_token(token):
+    """
+    Returns the claims of a valid access token, verifying its signature only
+    on a cache miss. Must run inside the Flask app context.
+    """
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    claims = token_cache.get(digest)
+    if claims is not None:
+        return claims
+    try:
+        claims = decode_token(token)
+    except ExpiredSignatureError:
+        raise AuthError("Token has expired", 401)
+    except InvalidSignatureError:
+        raise AuthError("Signature verification failed", 422)
+    except Exception as e:
+        raise AuthError(str(e), 422)
+    if claims.get("type") != "access":
+        raise AuthError("Only non-refresh tokens are allowed", 422)
+    ttl = TOKEN_CACHE_TTL
+    if "exp" in claims:
+        ttl = min(ttl, claims["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(digest, claims, ttl=ttl)
+    return claims
+
+
+def verify_header(header):
+    """Verifies an "Authorization: Bearer <JWT>" header value and returns the claims."""
+    if not header:
+        raise AuthError("Missing Authorization Header", 401)
+    parts = header.split()
+    if len(parts) != 2 or parts[0] != "Bearer":
+        raise AuthError("Bad Authorization header. Expected 'Authorization: Bearer <JWT>'", 422)
+    return verify_token(parts[1])
+
+
+def auth_required(fn):
+    """
+    Protects a Flask view: answers 401/422 like flask-jwt-extended does, or
+    runs the view with the token's claims available through current_claims().
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            g.jwt_claims = verify_header(request.headers.get("Authorization"))
+        except AuthError as e:
+            return jsonify({"msg": e.message}), e.status
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def verify_ops_header(header):
+    """
+    Authorizes /metrics and the /debug-* endpoints: returns for METRICS_TOKEN
+    or an admin's JWT, raises AuthError otherwise.
+    """
+    if METRICS_TOKEN and header:
+        scheme, _, token = header.partition(" ")
+        if scheme == "Bearer" and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return
+    if verify_header(header)["sub"] != "admin":
+        raise AuthError("Unauthorized", 403)
+
+
+def ops_required(fn):
+    """Protects a Flask view with verify_ops_header()."""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            verify_ops_header(request.headers.get("Authorization"))
+        except AuthError as e:
+            return jsonify({"msg": e.message}), e.status
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def current_claims():
+    return g.jwt_claims
+
+
+def current_username():
+    return g.jwt_claims["sub"]
+
+
+def current_user_id():
+    """The numeric user id, or None for tokens issued before the uid claim existed."""
+    return g.jwt_claims.get("uid")
@@ -0,0 +1,91 @@
+"""
+Side-by-side benchmark of the WSGI app (gunicorn, app:app) and the async
+variant (uvicorn, asgi:app) against the same database.
+
+Both servers are started from this directory with the current environment
+(DB_*, JWT_SECRET_KEY, STORAGE_EMULATOR_HOST, ...), each scenario is driven
+at a fixed concurrency for a fixed duration, and the results are printed as
+JSON: requests/s, error count and p50/p95/p99 latency in milliseconds.
+
+Needs the packages in benchmarks/requirements.txt. Usage:
+    python3 benchmarks/compare_servers.py --concurrency 200 --duration 15
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+
+from harness import get_token, start_server, stop_server, summarize, wait_ready
+
+# name -> (method, path, needs_auth)
+SCENARIOS = {
+    "list_posters": ("GET", "/posters?limit=20", False),
+    "search_posters": ("GET", "/posters/search?q=poster&limit=20", False),
+    "profile": ("GET", "/profile", True),
+}
+
+BENCH_USER = {"username": "bench-user", "password": "bench-password", "email": "bench@example.com"}
+
+
+async def drive(base_url, method, path, headers, concurrency, duration):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    r = await client.request(method, path)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return summarize(latencies, errors, elapsed)
+
+
+def run(kinds, scenarios, concurrency, duration, base_port):
+    results = {"concurrency": concurrency, "duration": duration, "servers": {}}
+    for offset, kind in enumerate(kinds):
+        port = base_port + offset
+        base_url = f"http://127.0.0.1:{port}"
+        proc = start_server(kind, port)
+        try:
+            wait_ready(base_url, proc=proc)
+            headers = {"Authorization": "Bearer " + get_token(base_url, BENCH_USER)}
+            results["servers"][kind] = {}
+            for name in scenarios:
+                method, path, needs_auth = SCENARIOS[name]
+                results["servers"][kind][name] = asyncio.run(
+                    drive(base_url, method, path, headers if needs_auth else {}, concurrency, duration)
+                )
+        finally:
+            stop_server(proc)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the WSGI and ASGI servers")
+    parser.add_argument("--servers", default="wsgi,asgi")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=18080)
+    args = parser.parse_args()
+    results = run(args.servers.split(","), args.scenarios.split(","), args.concurrency, args.duration, args.port)
+    json.dump(results, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,217 @@
+"""
+In-memory stand-in for the parts of the Cloud Storage JSON API the backend
+uses, so uploads can be benchmarked without a bucket.
+
+Supported: simple (uploadType=media), multipart and resumable uploads,
+object metadata (GET .../o/<name>) and downloads (?alt=media). Point the
+backend at it with STORAGE_EMULATOR_HOST=http://127.0.0.1:<port>; both
+storage_client.py and gcloud-aio-storage (asgi.py) honour that variable.
+
+--latency-ms adds a fixed delay to every request to approximate the round
+trip to the real service. Usage:
+    python3 benchmarks/fake_gcs.py --port 4443 --latency-ms 20
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+try:
+    import google_crc32c
+except ImportError:  # crc32c is left out of object resources
+    google_crc32c = None
+
+_OBJECT_PATH = re.compile(r"^/(?:download/)?storage/v1/b/([^/]+)/o/(.+)$")
+_UPLOAD_PATH = re.compile(r"^/upload/storage/v1/b/([^/]+)/o$")
+_BUCKET_PATH = re.compile(r"^/storage/v1/b/([^/]+)$")
+_CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+class Store:
+    """Objects by (bucket, name), plus resumable sessions in progress."""
+
+    def __init__(self, keep_bodies=True):
+        self.keep_bodies = keep_bodies
+        self.lock = threading.Lock()
+        self.objects = {}    # (bucket, name) -> (resource, body or None)
+        self.sessions = {}   # upload id -> {"bucket", "name", "content_type", "data"}
+        self.stats = {"uploads": 0, "bytes": 0, "downloads": 0}
+
+    def put(self, bucket, name, content_type, body):
+        now = datetime.now(timezone.utc).isoformat()
+        resource = {
+            "kind": "storage#object",
+            "id": f"{bucket}/{name}/1",
+            "bucket": bucket,
+            "name": name,
+            "size": str(len(body)),
+            "contentType": content_type or "application/octet-stream",
+            "md5Hash": base64.b64encode(hashlib.md5(body).digest()).decode(),
+            "generation": "1",
+            "metageneration": "1",
+            "timeCreated": now,
+            "updated": now,
+            "mediaLink": f"/download/storage/v1/b/{bucket}/o/{quote(name, safe='')}?alt=media",
+        }
+        if google_crc32c is not None:
+            resource["crc32c"] = base64.b64encode(google_crc32c.value(body).to_bytes(4, "big")).decode()
+        with self.lock:
+            self.objects[(bucket, name)] = (resource, body if self.keep_bodies else None)
+            self.stats["uploads"] += 1
+            self.stats["bytes"] += len(body)
+        return resource
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    store = None
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _not_found(self):
+        self._send(404, {"error": {"code": 404, "message": "No such object"}})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _route(self):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(self.path)
+        return url.path, {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+    def do_GET(self):
+        path, params = self._route()
+        match = _OBJECT_PATH.match(path)
+        if match:
+            bucket, name = match.group(1), unquote(match.group(2))
+            entry = self.store.objects.get((bucket, name))
+            if entry is None:
+                return self._not_found()
+            resource, body = entry
+            if params.get("alt") == "media" or path.startswith("/download/"):
+                if body is None:
+                    return self._send(410, {"error": {"code": 410, "message": "Body not kept (--discard-bodies)"}})
+                with self.store.lock:
+                    self.store.stats["downloads"] += 1
+                return self._send(200, body, resource["contentType"], {"x-goog-hash": "md5=" + resource["md5Hash"]})
+            return self._send(200, resource)
+        match = _BUCKET_PATH.match(path)
+        if match:
+            return self._send(200, {"kind": "storage#bucket", "name": match.group(1), "id": match.group(1)})
+        if path == "/_stats":
+            with self.store.lock:
+                return self._send(200, dict(self.store.stats, objects=len(self.store.objects)))
+        self._not_found()
+
+    do_HEAD = do_GET
+
+    def do_POST(self):
+        path, params = self._route()
+        match = _UPLOAD_PATH.match(path)
+        if not match:
+            return self._not_found()
+        bucket = match.group(1)
+        upload_type = params.get("uploadType")
+        body = self._body()
+        if upload_type == "media":
+            return self._send(200, self.store.put(bucket, params["name"], self.headers.get("Content-Type"), body))
+        if upload_type == "multipart":
+            metadata, content_type, data = self._parse_multipart(body)
+            name = metadata.get("name") or params.get("name")
+            return self._send(200, self.store.put(bucket, name, metadata.get("contentType") or content_type, data))
+        if upload_type == "resumable":
+            metadata = json.loads(body) if body else {}
+            upload_id = uuid.uuid4().hex
+            with self.store.lock:
+                self.store.sessions[upload_id] = {
+                    "bucket": bucket,
+                    "name": metadata.get("name") or params.get("name"),
+                    "content_type": metadata.get("contentType") or self.headers.get("X-Upload-Content-Type"),
+                    "data": bytearray(),
+                }
+            host = self.headers.get("Host", "127.0.0.1")
+            location = f"http://{host}/upload/storage/v1/b/{bucket}/o?uploadType=resumable&upload_id={upload_id}"
+            return self._send(200, b"", headers={"Location": location})
+        self._send(400, {"error": {"code": 400, "message": f"Unsupported uploadType {upload_type}"}})
+
+    def do_PUT(self):
+        path, params = self._route()
+        session = self.store.sessions.get(params.get("upload_id"))
+        if not _UPLOAD_PATH.match(path) or session is None:
+            return self._not_found()
+        chunk = self._body()
+        total = None
+        match = _CONTENT_RANGE.match(self.headers.get("Content-Range", ""))
+        if match:
+            if match.group(1) is not None and int(match.group(1)) != len(session["data"]):
+                return self._send(400, {"error": {"code": 400, "message": "Chunk out of order"}})
+            if match.group(3) != "*":
+                total = int(match.group(3))
+        else:
+            # A single PUT with the whole object (gcloud-aio-storage).
+            total = len(session["data"]) + len(chunk)
+        session["data"] += chunk
+        if total is None or len(session["data"]) < total:
+            headers = {"Range": f"bytes=0-{len(session['data']) - 1}"} if session["data"] else {}
+            return self._send(308, b"", headers=headers)
+        with self.store.lock:
+            self.store.sessions.pop(params["upload_id"], None)
+        resource = self.store.put(session["bucket"], session["name"], session["content_type"], bytes(session["data"]))
+        self._send(200, resource)
+
+    def _parse_multipart(self, body):
+        """(metadata, media content type, media bytes) from a multipart/related body."""
+        head = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode()
+        message = BytesParser(policy=HTTP).parsebytes(head + body)
+        parts = list(message.iter_parts())
+        metadata = json.loads(parts[0].get_payload(decode=True) or b"{}")
+        media = parts[1]
+        return metadata, media.get_content_type(), media.get_payload(decode=True) or b""
+
+
+def serve(port, host="127.0.0.1", latency_ms=0, keep_bodies=True):
+    """Starts the server on a background thread and returns it (call .shutdown() to stop)."""
+    handler = type("BoundHandler", (Handler,), {"store": Store(keep_bodies), "latency": latency_ms / 1000})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gcs", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Cloud Storage server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4443)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--discard-bodies", action="store_true", help="keep only object metadata")
+    args = parser.parse_args()
+    server = serve(args.port, args.host, args.latency_ms, not args.discard_bodies)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,87 @@
+"""
+Helpers shared by the benchmark scripts: starting the servers, waiting for
+them, and summarizing latencies.
+"""
+import os
+import socket
+import subprocess
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "wsgi": lambda port: ["gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "app:app"],
+    "asgi": lambda port: ["uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """requests, errors, rps and p50/p95/p99 (ms) for latencies of successful requests, in ms."""
+    latencies = sorted(latencies)
+
+    def pct(p):
+        return round(percentile(latencies, p), 2) if latencies else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else None,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+
+def start_server(kind, port, env=None, output=subprocess.DEVNULL):
+    """Starts `kind` ("wsgi" or "asgi") from the backend directory on `port`."""
+    env = dict(env or os.environ, PORT=str(port))
+    return subprocess.Popen(
+        SERVERS[kind](port), cwd=BACKEND_DIR, env=env,
+        stdout=output, stderr=subprocess.STDOUT,
+    )
+
+
+def stop_server(proc, timeout=30):
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def wait_ready(base_url, timeout=60, proc=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode} before becoming ready")
+        try:
+            if httpx.get(base_url + "/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{base_url} did not become ready within {timeout}s")
+
+
+def get_token(base_url, user, register=True):
+    if register:
+        httpx.post(base_url + "/register", json=user, timeout=30)
+    r = httpx.post(base_url + "/login", json=user, timeout=30)
+    r.raise_for_status()
+    return r.json()["access_token"]
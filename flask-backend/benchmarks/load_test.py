@@ -0,0 +1,516 @@
+"""
+Load-test suite: serves the backend against a local Postgres and the fake
+object store in fake_gcs.py, drives realistic request mixes and writes
+per-endpoint throughput and p50/p95/p99 latency to a JSON file, so runs
+from different commits can be compared.
+
+Setup for each run:
+  - Postgres: --start-postgres runs a throwaway cluster (initdb and pg_ctl
+    from PATH or --pg-bin) in a temp directory. Otherwise the DB_* variables
+    must point at a scratch database. migrate.py brings the schema up to
+    date, then seed data is added: --users accounts (default 1M, all
+    with one password), --posters posters and an "admin" account, whose
+    password is reset. Seeding only adds what is missing, so reruns start
+    quickly.
+  - Object storage: fake_gcs.py on a free port, via STORAGE_EMULATOR_HOST.
+  - The server: gunicorn (--server wsgi, default) or uvicorn (asgi),
+    configured from the environment as in production (WEB_CONCURRENCY,
+    DB_POOL_MAX, HASH_PROCESSES, ...).
+
+Scenarios (--scenarios), each run for --duration seconds:
+  login_burst   every worker logs in as a random seeded user
+  browse        /posters first pages, following next_cursor, and searches
+  upload        /posters/upload with small to xlarge JPEGs, then polls the
+                job until it finishes ("job [size]" is the time to done)
+  admin_users   /admin/users pages at random points in the user table,
+                some filtered
+  mixed         a weighted mix of the above plus /profile
+
+Requests are drawn from a seeded RNG (--seed), so two runs with the same
+arguments send the same requests.
+
+Usage:
+    python3 benchmarks/load_test.py run --start-postgres --duration 30
+    python3 benchmarks/load_test.py compare results/old.json results/new.json
+The run writes benchmarks/results/<commit>-<server>.json unless --output is
+given. compare exits 1 if any endpoint's p95 latency rose, or its
+throughput fell, by more than --threshold.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import psycopg2
+
+from harness import BACKEND_DIR, free_port, get_token, start_server, stop_server, summarize, wait_ready
+
+sys.path.insert(0, BACKEND_DIR)
+from hashing import HASH_METHOD, SALT_LENGTH  # noqa: E402
+from migrate import migrate  # noqa: E402
+from pagination import encode_cursor  # noqa: E402
+
+# The backend modules route logging through logs.py; keep httpx's per-request lines out of the output.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BUCKET = "bench-bucket"
+PASSWORD = "bench-password"
+ADMIN = {"username": "admin", "password": "bench-admin-password"}
+
+WORDS = ("jazz", "poster", "vintage", "concert", "film", "travel", "botanical", "map", "retro", "abstract")
+
+# name -> (width, height, share of uploads)
+IMAGE_SIZES = {
+    "small": (320, 240, 40),
+    "medium": (1024, 768, 35),
+    "large": (2048, 1536, 20),
+    "xlarge": (4000, 3000, 5),
+}
+
+SEED_BATCH = 100_000
+
+
+# ---------------- Environment -----------------
+
+class LocalPostgres:
+    """A throwaway cluster in a temp directory, listening on a Unix socket only."""
+
+    def __init__(self, bin_dir=None):
+        self.bin_dir = bin_dir
+        self.dir = tempfile.mkdtemp(prefix="bench-pg-")
+        self.data = os.path.join(self.dir, "data")
+
+    def _bin(self, name):
+        return os.path.join(self.bin_dir, name) if self.bin_dir else (shutil.which(name) or name)
+
+    def start(self):
+        quiet = {"stdout": subprocess.DEVNULL, "check": True}
+        subprocess.run([self._bin("initdb"), "-D", self.data, "-U", "postgres", "-A", "trust", "--no-sync"], **quiet)
+        subprocess.run([
+            self._bin("pg_ctl"), "-D", self.data, "-l", os.path.join(self.dir, "postgres.log"), "-w",
+            "-o", f"-k {self.dir} -c listen_addresses='' -c max_connections=300", "start",
+        ], **quiet)
+        conn = psycopg2.connect(dbname="postgres", user="postgres", host=self.dir)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute("CREATE DATABASE posterdb")
+        conn.close()
+        return {"DB_HOST": self.dir, "DB_NAME": "posterdb", "DB_USER": "postgres", "DB_PASSWORD": ""}
+
+    def stop(self):
+        subprocess.run([self._bin("pg_ctl"), "-D", self.data, "-m", "fast", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def start_fake_gcs(port, latency_ms):
+    proc = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "fake_gcs.py"),
+        "--port", str(port), "--latency-ms", str(latency_ms), "--discard-bodies",
+    ])
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/_stats", timeout=1)
+            return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("fake GCS server did not start")
+
+
+def prepare_database(db_env, users, posters):
+    """Creates the schema and tops the seed data up. Returns (min user id, max user id)."""
+    from werkzeug.security import generate_password_hash
+
+    conn = psycopg2.connect(
+        dbname=db_env["DB_NAME"], user=db_env["DB_USER"], password=db_env["DB_PASSWORD"], host=db_env["DB_HOST"]
+    )
+    conn.autocommit = True
+    migrate(conn)
+    cur = conn.cursor()
+
+    password_hash = generate_password_hash(PASSWORD, HASH_METHOD, SALT_LENGTH)
+    cur.execute("SELECT count(*) FROM users WHERE username LIKE 'bench-user-%'")
+    have = cur.fetchone()[0]
+    for start in range(have + 1, users + 1, SEED_BATCH):
+        end = min(users, start + SEED_BATCH - 1)
+        print(f"Seeding users {start}-{end}", file=sys.stderr)
+        cur.execute(
+            "INSERT INTO users (username, password_hash, email, is_verified, created_at) "
+            "SELECT 'bench-user-' || n, %s, 'bench-user-' || n || '@example.com', n %% 3 = 0, "
+            "now() - (n %% 730) * interval '1 day' FROM generate_series(%s, %s) AS n",
+            (password_hash, start, end)
+        )
+
+    cur.execute("SELECT count(*) FROM posters WHERE artist LIKE 'Bench Artist %'")
+    have = cur.fetchone()[0]
+    if have < posters:
+        print(f"Seeding posters {have + 1}-{posters}", file=sys.stderr)
+        cur.execute(
+            "INSERT INTO posters (title, description, artist, photo_url) "
+            "SELECT initcap((%s::text[])[1 + n %% %s]) || ' poster ' || n, "
+            "'A ' || (%s::text[])[1 + (n / 7) %% %s] || ' print for the benchmark', "
+            "'Bench Artist ' || (n %% 500), "
+            "'https://storage.googleapis.com/' || %s || '/seed-' || n || '.jpg' "
+            "FROM generate_series(%s, %s) AS n",
+            (list(WORDS), len(WORDS), list(WORDS), len(WORDS), BUCKET, have + 1, posters)
+        )
+
+    admin_hash = generate_password_hash(ADMIN["password"], HASH_METHOD, SALT_LENGTH)
+    cur.execute(
+        "INSERT INTO users (username, password_hash, email, is_verified) VALUES ('admin', %s, %s, TRUE) "
+        "ON CONFLICT (username) DO UPDATE SET password_hash = EXCLUDED.password_hash",
+        (admin_hash, "admin@example.com")
+    )
+    cur.execute("ANALYZE users")
+    cur.execute("ANALYZE posters")
+    cur.execute("SELECT min(id), max(id) FROM users")
+    id_range = cur.fetchone()
+    cur.close()
+    conn.close()
+    return id_range
+
+
+def make_image(width, height, seed):
+    """A JPEG of smoothed noise: compresses roughly like a photo, and is the same on every run."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    small = (max(1, width // 8), max(1, height // 8))
+    bands = [Image.frombytes("L", small, rng.randbytes(small[0] * small[1])) for _ in range(3)]
+    image = Image.merge("RGB", bands).resize((width, height), Image.BICUBIC)
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+# ---------------- Scenarios -----------------
+
+class Recorder:
+    """Latencies (ms) of successful requests and error counts, per endpoint label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.timings = defaultdict(list)
+
+    async def request(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            return None
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        else:
+            self.latencies[label].append((time.perf_counter() - started) * 1000)
+        return response
+
+    def report(self, elapsed):
+        labels = sorted(set(self.latencies) | set(self.errors))
+        endpoints = {label: summarize(self.latencies[label], self.errors[label], elapsed) for label in labels}
+        everything = [ms for label in labels for ms in self.latencies[label]]
+        result = {
+            "elapsed_s": round(elapsed, 2),
+            "total": summarize(everything, sum(self.errors.values()), elapsed),
+            "endpoints": endpoints,
+        }
+        if self.timings:
+            result["jobs"] = {label: summarize(ms, 0, elapsed) for label, ms in sorted(self.timings.items())}
+        return result
+
+
+class Context:
+    def __init__(self, base_url, users_range, admin_token, user_tokens, images):
+        self.base_url = base_url
+        self.users_range = users_range
+        self.admin_headers = {"Authorization": "Bearer " + admin_token}
+        self.user_headers = [{"Authorization": "Bearer " + t} for t in user_tokens]
+        self.images = images
+        self.image_kinds = list(images)
+        self.image_weights = [IMAGE_SIZES[kind][2] for kind in self.image_kinds]
+
+
+async def login_burst(ctx, client, rng, rec):
+    n = rng.randint(1, ctx.users_range[2])
+    await rec.request(client, "POST /login", "POST", "/login", json={"username": f"bench-user-{n}", "password": PASSWORD})
+
+
+async def browse(ctx, client, rng, rec):
+    r = await rec.request(client, "GET /posters", "GET", "/posters", params={"limit": 20})
+    for _ in range(rng.randint(0, 3)):
+        cursor = r.json().get("next_cursor") if r is not None and r.status_code == 200 else None
+        if not cursor:
+            break
+        r = await rec.request(client, "GET /posters?cursor", "GET", "/posters", params={"limit": 20, "cursor": cursor})
+    if rng.random() < 0.3:
+        await rec.request(client, "GET /posters/search", "GET", "/posters/search", params={"q": rng.choice(WORDS), "limit": 20})
+
+
+async def upload(ctx, client, rng, rec):
+    kind = rng.choices(ctx.image_kinds, ctx.image_weights)[0]
+    # Uploads are stored by content hash, so a repeated image would skip the
+    # upload and resize. Bytes after the JPEG end marker make each one new.
+    photo = ctx.images[kind] + rng.randbytes(16)
+    started = time.perf_counter()
+    r = await rec.request(
+        client, f"POST /posters/upload [{kind}]", "POST", "/posters/upload",
+        headers=rng.choice(ctx.user_headers),
+        data={"title": f"Bench {rng.choice(WORDS)} poster", "description": "Uploaded by load_test.py", "artist": "Bench"},
+        files={"photo": (f"bench-{kind}.jpg", photo, "image/jpeg")},
+    )
+    if r is None or r.status_code != 202:
+        return
+    status_url = r.json()["status_url"]
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        r = await rec.request(client, "GET /posters/jobs/<id>", "GET", status_url, headers=ctx.admin_headers)
+        status = r.json().get("status") if r is not None and r.status_code == 200 else None
+        if status == "succeeded":
+            rec.timings[f"job [{kind}]"].append((time.perf_counter() - started) * 1000)
+            return
+        if status == "failed":
+            break
+    rec.errors[f"job [{kind}]"] += 1
+
+
+async def admin_users(ctx, client, rng, rec):
+    low, high = ctx.users_range[:2]
+    params = {"limit": 50, "cursor": encode_cursor({"id": rng.randint(low, high)})}
+    label = "GET /admin/users"
+    if rng.random() < 0.3:
+        label = "GET /admin/users [filtered]"
+        params["is_verified"] = "true"
+        since = datetime.now() - timedelta(days=rng.randint(1, 730))
+        params["created_after"] = since.replace(microsecond=0).isoformat()
+    await rec.request(client, label, "GET", "/admin/users", params=params, headers=ctx.admin_headers)
+
+
+async def profile(ctx, client, rng, rec):
+    await rec.request(client, "GET /profile", "GET", "/profile", headers=rng.choice(ctx.user_headers))
+
+
+MIX = ((browse, 60), (profile, 15), (login_burst, 10), (upload, 5), (admin_users, 10))
+
+
+async def mixed(ctx, client, rng, rec):
+    action = rng.choices([a for a, _ in MIX], [w for _, w in MIX])[0]
+    await action(ctx, client, rng, rec)
+
+
+SCENARIOS = {
+    "login_burst": login_burst,
+    "browse": browse,
+    "upload": upload,
+    "admin_users": admin_users,
+    "mixed": mixed,
+}
+
+
+async def run_scenario(ctx, name, concurrency, duration, seed):
+    rec = Recorder()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=ctx.base_url, limits=limits, timeout=120) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker(i):
+            rng = random.Random(f"{seed}-{name}-{i}")
+            while time.monotonic() < deadline:
+                await SCENARIOS[name](ctx, client, rng, rec)
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+    return rec.report(elapsed)
+
+
+# ---------------- Runs and comparisons -----------------
+
+def git_revision():
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no", "--", "."))
+    return commit, dirty
+
+
+def run(args):
+    pg = LocalPostgres(args.pg_bin) if args.start_postgres else None
+    gcs = server = None
+    server_log = tempfile.NamedTemporaryFile(prefix="bench-server-", suffix=".log", delete=False)
+    try:
+        if pg is not None:
+            db_env = pg.start()
+        else:
+            db_env = {k: os.environ.get(k, "") for k in ("DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD")}
+            if not db_env["DB_HOST"] or not db_env["DB_NAME"]:
+                sys.exit("Set DB_HOST/DB_NAME/DB_USER/DB_PASSWORD for a scratch database, or pass --start-postgres")
+        low, high = prepare_database(db_env, args.users, args.posters)
+
+        gcs_port = free_port()
+        gcs = start_fake_gcs(gcs_port, args.gcs_latency_ms)
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = dict(
+            os.environ, **db_env,
+            STORAGE_EMULATOR_HOST=f"http://127.0.0.1:{gcs_port}",
+            POSTER_BUCKET_NAME=BUCKET,
+            LOG_LEVEL=os.environ.get("LOG_LEVEL", "WARNING"),
+        )
+        server = start_server(args.server, port, env, output=server_log)
+        wait_ready(base_url, timeout=120, proc=server)
+
+        admin_token = get_token(base_url, ADMIN, register=False)
+        user_tokens = [
+            get_token(base_url, {"username": f"bench-user-{n}", "password": PASSWORD}, register=False)
+            for n in range(1, min(args.users, 20) + 1)
+        ]
+        images = {
+            kind: make_image(width, height, f"{args.seed}-{kind}")
+            for kind, (width, height, _) in IMAGE_SIZES.items()
+        }
+        ctx = Context(base_url, (low, high, args.users), admin_token, user_tokens, images)
+
+        commit, dirty = git_revision()
+        results = {
+            "commit": commit,
+            "dirty": dirty,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "server": args.server,
+            "config": {
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "users": args.users,
+                "posters": args.posters,
+                "seed": args.seed,
+                "gcs_latency_ms": args.gcs_latency_ms,
+                "image_bytes": {kind: len(data) for kind, data in images.items()},
+                "env": {k: os.environ[k] for k in (
+                    "WEB_CONCURRENCY", "GUNICORN_THREADS", "DB_POOL_MAX", "ASYNC_DB_POOL_MAX",
+                    "HASH_PROCESSES", "POSTER_WORKERS", "DERIVATIVE_PROCESSES",
+                    "DERIVATIVE_UPLOAD_THREADS",
+                ) if k in os.environ},
+            },
+            "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "scenarios": {},
+        }
+        for name in args.scenarios.split(","):
+            print(f"Running {name} for {args.duration}s at concurrency {args.concurrency}", file=sys.stderr)
+            results["scenarios"][name] = asyncio.run(
+                run_scenario(ctx, name, args.concurrency, args.duration, args.seed)
+            )
+        results["object_store"] = httpx.get(f"http://127.0.0.1:{gcs_port}/_stats").json()
+    except Exception:
+        server_log.flush()
+        print(f"Run failed; server output is in {server_log.name}", file=sys.stderr)
+        raise
+    finally:
+        if server is not None:
+            stop_server(server)
+        if gcs is not None:
+            gcs.terminate()
+            gcs.wait()
+        if pg is not None:
+            pg.stop()
+    server_log.close()
+    os.unlink(server_log.name)
+
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", f"{commit}{'-dirty' if dirty else ''}-{args.server}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+        f.write("\n")
+    print_results(results)
+    print(f"\nWrote {output}")
+
+
+def _fmt(value):
+    return "-" if value is None else str(value)
+
+
+def print_results(results):
+    for name, scenario in results["scenarios"].items():
+        print(f"\n{name} ({scenario['elapsed_s']}s)")
+        print(f"  {'endpoint':<36} {'ok':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        rows = dict(scenario["endpoints"], **scenario.get("jobs", {}), total=scenario["total"])
+        for label, s in rows.items():
+            print(f"  {label:<36} {s['requests']:>7} {s['errors']:>5} {_fmt(s['rps']):>8} "
+                  f"{_fmt(s['p50_ms']):>9} {_fmt(s['p95_ms']):>9} {_fmt(s['p99_ms']):>9}")
+
+
+def compare(old, new, threshold):
+    """Prints p95 and throughput changes per endpoint; returns the regressed (scenario, endpoint) pairs."""
+    regressions = []
+    print(f"{old['commit']} -> {new['commit']}")
+    for name, scenario in new["scenarios"].items():
+        before_scenario = old["scenarios"].get(name)
+        if before_scenario is None:
+            continue
+        print(f"\n{name}")
+        before_rows = dict(before_scenario["endpoints"], **before_scenario.get("jobs", {}))
+        for label, after in dict(scenario["endpoints"], **scenario.get("jobs", {})).items():
+            before = before_rows.get(label)
+            if not before or not before["p95_ms"] or not after["p95_ms"] or not before["rps"]:
+                continue
+            p95_change = after["p95_ms"] / before["p95_ms"] - 1
+            rps_change = (after["rps"] or 0) / before["rps"] - 1
+            regressed = p95_change > threshold or rps_change < -threshold
+            if regressed:
+                regressions.append((name, label))
+            print(f"  {label:<36} p95 {before['p95_ms']:>8} -> {after['p95_ms']:>8} ({p95_change:+.0%})  "
+                  f"rps {before['rps']:>8} -> {after['rps']:>8} ({rps_change:+.0%}){'  REGRESSED' if regressed else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend load tests")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run the scenarios and write a results file")
+    run_parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    run_parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    run_parser.add_argument("--concurrency", type=int, default=50)
+    run_parser.add_argument("--duration", type=float, default=20.0, help="seconds per scenario")
+    run_parser.add_argument("--users", type=int, default=1_000_000)
+    run_parser.add_argument("--posters", type=int, default=20_000)
+    run_parser.add_argument("--seed", default="1")
+    run_parser.add_argument("--gcs-latency-ms", type=float, default=20)
+    run_parser.add_argument("--start-postgres", action="store_true")
+    run_parser.add_argument("--pg-bin", help="directory holding initdb and pg_ctl")
+    run_parser.add_argument("--output")
+
+    compare_parser = sub.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        run(args)
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        sys.exit(1 if compare(old, new, args.threshold) else 0)
@@ -0,0 +1,179 @@
+"""
+Cold-start profile: what importing the app costs, module by module, and how
+long a freshly started server takes to answer.
+
+  imports         imports --module (app or asgi) in a fresh interpreter with
+                  `python -X importtime`, --runs times, and reports the median
+                  total, the cumulative cost of each module it imports
+                  directly, and the self time summed per top-level package
+                  (so google.*, protobuf etc. are counted wherever they were
+                  first imported from).
+  first-response  starts the server (gunicorn or uvicorn, configured from the
+                  environment as in production) --runs times and measures,
+                  from spawning the process, the first response of any status
+                  to --path and the first 200 from /readyz.
+
+Both print a table, or JSON with --json. Usage:
+    python3 benchmarks/startup.py imports --module app --runs 5
+    python3 benchmarks/startup.py first-response --server wsgi --path /posters?limit=1
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from harness import BACKEND_DIR, free_port, start_server, stop_server
+
+# "import time:  self [us] | cumulative | <indent>name", indented two spaces per level.
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(module):
+    """[(depth, name, self us, cumulative us)] from importing `module` in a new interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=os.environ, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append((len(match.group(3)) // 2, match.group(4), int(match.group(1)), int(match.group(2))))
+    return rows
+
+
+def profile_once(module):
+    rows = import_times(module)
+    # A module's imports are listed before it, one level deeper.
+    end = max(i for i, row in enumerate(rows) if row[0] == 0 and row[1] == module)
+    direct = {}
+    for depth, name, _, cumulative in reversed(rows[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct[name] = cumulative
+    packages = defaultdict(int)
+    for _, name, own, _ in rows[:end + 1]:
+        packages[name.split(".")[0]] += own
+    return rows[end][3], direct, packages
+
+
+def median_ms(samples):
+    return round(statistics.median(samples) / 1000, 1)
+
+
+def profile_imports(module, runs):
+    totals, direct, packages = [], defaultdict(list), defaultdict(list)
+    for _ in range(runs):
+        total, run_direct, run_packages = profile_once(module)
+        totals.append(total)
+        for name, us in run_direct.items():
+            direct[name].append(us)
+        for name, us in run_packages.items():
+            packages[name].append(us)
+
+    def ranked(samples):
+        return dict(sorted(((name, median_ms(us)) for name, us in samples.items()), key=lambda item: -item[1]))
+
+    return {
+        "module": module,
+        "runs": runs,
+        "total_ms": median_ms(totals),
+        "direct_ms": ranked(direct),
+        "packages_ms": ranked(packages),
+    }
+
+
+def first_response(kind, path, timeout):
+    """(seconds to the first response on `path`, seconds to /readyz 200) for one fresh server."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = start_server(kind, port)
+    first = ready = None
+    try:
+        with httpx.Client(timeout=5) as client:
+            while time.perf_counter() - started < timeout:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited with status {proc.returncode}")
+                try:
+                    if first is None:
+                        client.get(base_url + path)
+                        first = time.perf_counter() - started
+                    if client.get(base_url + "/readyz").status_code == 200:
+                        ready = time.perf_counter() - started
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        stop_server(proc)
+    if first is None:
+        raise RuntimeError(f"no response from {base_url}{path} within {timeout}s")
+    return first, ready
+
+
+def profile_first_response(kind, path, runs, timeout):
+    firsts, readies = [], []
+    for _ in range(runs):
+        first, ready = first_response(kind, path, timeout)
+        firsts.append(first)
+        if ready is not None:
+            readies.append(ready)
+    return {
+        "server": kind,
+        "path": path,
+        "runs": runs,
+        "first_response_ms": round(statistics.median(firsts) * 1000, 1),
+        "ready_ms": round(statistics.median(readies) * 1000, 1) if readies else None,
+    }
+
+
+def print_imports(profile, top):
+    print(f"import {profile['module']}: {profile['total_ms']} ms (median of {profile['runs']})")
+    for title, key in (("Direct imports (cumulative)", "direct_ms"), ("Packages (self time)", "packages_ms")):
+        print(f"\n{title}:")
+        for name, ms in list(profile[key].items())[:top]:
+            print(f"  {name:<40} {ms:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cold-start profile")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imports_parser = sub.add_parser("imports", help="per-module import cost")
+    imports_parser.add_argument("--module", default="app")
+    imports_parser.add_argument("--runs", type=int, default=5)
+    imports_parser.add_argument("--top", type=int, default=20)
+    imports_parser.add_argument("--json", action="store_true")
+
+    first_parser = sub.add_parser("first-response", help="time from process start to the first response")
+    first_parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    first_parser.add_argument("--path", default="/readyz")
+    first_parser.add_argument("--runs", type=int, default=5)
+    first_parser.add_argument("--timeout", type=float, default=60)
+    first_parser.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "imports":
+        profile = profile_imports(args.module, args.runs)
+        if args.json:
+            print(json.dumps(profile, indent=2))
+        else:
+            print_imports(profile, args.top)
+    else:
+        profile = profile_first_response(args.server, args.path, args.runs, args.timeout)
+        if args.json:
+            print(json.dumps(profile, indent=2))
+        else:
+            print(f"{profile['server']}: first response on {profile['path']} after {profile['first_response_ms']} ms, "
+                  f"ready after {profile['ready_ms']} ms (median of {profile['runs']})")
@@ -0,0 +1,411 @@
+"""
+Bulk poster import: rows of poster metadata (NDJSON or CSV) plus an optional
+zip archive of images (or, from the command line, a directory).
+
+Each row has a title and optionally a description, an artist, and either
+`image` (a file name in the archive) or `photo_url` (an image that is already
+hosted). Rows are handled IMPORT_BATCH_SIZE at a time: the batch's images go
+to the bucket on IMPORT_UPLOAD_THREADS threads, then the rows that are ready
+are written to posters with one COPY. If the COPY fails, the batch is retried
+row by row so a single bad row doesn't take the others down with it.
+
+Images are stored under names derived from their content (as with
+/posters/upload), so an image several rows share, or one already in the
+bucket, is only uploaded once.
+
+Imported posters have no resized variants yet; run
+`python3 derivatives.py backfill` afterwards.
+
+Usage: python3 bulk_import.py posters.csv --images photos.zip --report report.ndjson
+"""
+import argparse
+import codecs
+import csv
+import io
+import json
+import mimetypes
+import os
+import posixpath
+import sys
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+import logs
+import metrics
+
+BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+UPLOAD_THREADS = int(os.environ.get("IMPORT_UPLOAD_THREADS", 16))
+MAX_PHOTO_BYTES = int(os.environ.get("MAX_PHOTO_BYTES", 20 * 1024 * 1024))
+
+FIELDS = ("title", "description", "artist", "image", "photo_url")
+COLUMNS = ("id", "title", "description", "artist", "photo_url", "content_hash")
+
+# Ids are drawn up front so COPY can write them and the report can name them.
+ALLOCATE_IDS_SQL = metrics.name_statement(
+    "allocate_poster_ids",
+    "SELECT nextval(pg_get_serial_sequence('posters', 'id')) FROM generate_series(1, %s)"
+)
+COPY_POSTERS_SQL = f"COPY posters ({', '.join(COLUMNS)}) FROM STDIN"
+INSERT_IMPORTED_SQL = metrics.name_statement(
+    "insert_imported_poster",
+    "INSERT INTO posters (id, title, description, artist, photo_url, content_hash) VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+log = logs.get_logger(__name__)
+
+
+# ---------------- Input -----------------
+
+def detect_format(filename, requested=None):
+    """"ndjson" or "csv", from an explicit choice or the file extension."""
+    if requested:
+        if requested not in ("ndjson", "csv"):
+            raise ValueError("format must be ndjson or csv")
+        return requested
+    ext = posixpath.splitext((filename or "").lower())[1]
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    raise ValueError("Cannot tell the metadata format from the file name; pass format=ndjson or format=csv")
+
+
+def read_rows(stream, import_format):
+    """
+    Returns an iterator of (row number, record) over a binary NDJSON or CSV
+    stream. Rows are numbered from 1, skipping blank NDJSON lines. A row that
+    can't be read (not UTF-8, not valid JSON, malformed CSV) comes through
+    with a ValueError as its record, so it fails on its own and the rows
+    after it are still imported.
+    """
+    lines = _Lines(stream)
+    if import_format == "csv":
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or "title" not in reader.fieldnames:
+            raise ValueError("CSV needs a header row with a title column")
+        if lines.bad:
+            raise ValueError("CSV header is not valid UTF-8")
+        return _csv_rows(reader, lines)
+    return _ndjson_rows(lines)
+
+
+class _Lines:
+    """
+    Text lines of a binary stream. A line that isn't valid UTF-8 is decoded
+    with replacement characters and flagged in `bad`, for whichever row it
+    belongs to to report.
+    """
+
+    def __init__(self, stream):
+        self._lines = iter(stream)
+        self._first = True
+        self.bad = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        if self._first:
+            self._first = False
+            if line.startswith(codecs.BOM_UTF8):
+                line = line[len(codecs.BOM_UTF8):]
+        try:
+            return line.decode("utf-8")
+        except UnicodeDecodeError:
+            self.bad = True
+            return line.decode("utf-8", "replace")
+
+
+def _csv_rows(reader, lines):
+    row_no = 0
+    while True:
+        lines.bad = False
+        try:
+            record = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # The reader starts afresh on the next line.
+            record = ValueError(f"Invalid CSV: {e}")
+        row_no += 1
+        if lines.bad and not isinstance(record, Exception):
+            record = ValueError("Row is not valid UTF-8")
+        yield row_no, record
+
+
+def _ndjson_rows(lines):
+    row_no = 0
+    for line in lines:
+        if not line.strip():
+            lines.bad = False
+            continue
+        row_no += 1
+        if lines.bad:
+            lines.bad = False
+            yield row_no, ValueError("Row is not valid UTF-8")
+            continue
+        try:
+            yield row_no, json.loads(line)
+        except ValueError:
+            yield row_no, ValueError("Invalid JSON")
+
+
+class ZipImages:
+    """Images in a zip archive, found by full path or by bare file name."""
+
+    def __init__(self, fileobj):
+        try:
+            self._zip = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise ValueError("images must be a zip archive")
+        self._lock = threading.Lock()
+        self._members = {}
+        for info in self._zip.infolist():
+            if not info.is_dir():
+                self._members.setdefault(info.filename, info)
+                self._members.setdefault(posixpath.basename(info.filename), info)
+
+    def size(self, name):
+        info = self._members.get(name)
+        return info.file_size if info is not None else None
+
+    def read(self, name):
+        # Reads share one file handle; uploads, the slow part, run in parallel.
+        with self._lock:
+            return self._zip.read(self._members[name])
+
+
+class DirectoryImages:
+    """Images in a local directory (command line only)."""
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+
+    def _path(self, name):
+        path = os.path.realpath(os.path.join(self.root, name))
+        return path if path.startswith(self.root + os.sep) else None
+
+    def size(self, name):
+        path = self._path(name)
+        return os.path.getsize(path) if path and os.path.isfile(path) else None
+
+    def read(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+
+def open_images(source):
+    """A directory path, or a seekable zip file object or path."""
+    if isinstance(source, str) and os.path.isdir(source):
+        return DirectoryImages(source)
+    return ZipImages(source)
+
+
+# ---------------- Batches -----------------
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prepare_row(record, images):
+    """Validates one record; returns the row to import or raises ValueError."""
+    if isinstance(record, Exception):
+        raise ValueError(str(record))
+    if not isinstance(record, dict):
+        raise ValueError("Row must be an object")
+    row = {}
+    for field in FIELDS:
+        value = record.get(field)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{field} must be a string")
+        row[field] = value or None
+    if not row["title"] or not row["title"].strip():
+        raise ValueError("title is required")
+    if row["image"] and row["photo_url"]:
+        raise ValueError("Give image or photo_url, not both")
+    if row["photo_url"] and not row["photo_url"].startswith(("https://", "http://")):
+        raise ValueError("photo_url must be an http(s) URL")
+    if row["image"]:
+        if images is None:
+            raise ValueError("Row names an image but no images archive was given")
+        size = images.size(row["image"])
+        if size is None:
+            raise ValueError(f"{row['image']} is not in the images archive")
+        if size > MAX_PHOTO_BYTES:
+            raise ValueError(f"Photo exceeds the {MAX_PHOTO_BYTES} byte limit")
+        content_type = mimetypes.guess_type(row["image"])[0] or ""
+        if not content_type.startswith("image/"):
+            raise ValueError(f"{row['image']} is not an image")
+        row["content_type"] = content_type
+    return row
+
+
+def prepare_batch(batch, images):
+    """
+    Splits a batch into (failed reports, rows ready to insert, rows that need
+    their image uploaded first), each row as (row number, row).
+    """
+    failed, ready, pending = [], [], []
+    for row_no, record in batch:
+        try:
+            row = prepare_row(record, images)
+        except ValueError as e:
+            failed.append(failure(row_no, str(e)))
+            continue
+        (pending if row["image"] else ready).append((row_no, row))
+    return failed, ready, pending
+
+
+def record_for(poster_id, row):
+    return (poster_id, row["title"], row["description"], row["artist"], row["photo_url"], row.get("content_hash"))
+
+
+def created(row_no, poster_id):
+    return {"row": row_no, "status": "created", "poster_id": poster_id}
+
+
+def failure(row_no, message):
+    return {"row": row_no, "status": "failed", "error": message}
+
+
+def copy_text(records):
+    """Records in COPY's text format."""
+    return "".join("\t".join(db_pool.copy_field(v) for v in record) + "\n" for record in records)
+
+
+# ---------------- Import -----------------
+
+def _upload(images, row, bucket_name):
+    """Stores one image under its content-derived name; returns (url, content hash)."""
+    from storage_client import checksums, content_blob_name, upload_if_missing
+
+    data = images.read(row["image"])
+    content_hash, crc32c = checksums(data)
+    blob_name = content_blob_name(content_hash, row["content_type"], row["image"])
+    url, _ = upload_if_missing(data, bucket_name, blob_name, row["content_type"], crc32c)
+    return url, content_hash
+
+
+def _copy_rows(connection, ready):
+    with connection() as conn:
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        cur = conn.cursor()
+        try:
+            cur.execute(ALLOCATE_IDS_SQL, (len(ready),))
+            ids = [r[0] for r in cur.fetchall()]
+            records = [record_for(poster_id, row) for poster_id, (_, row) in zip(ids, ready)]
+            with metrics.db_timer("copy_posters"):
+                cur.copy_expert(COPY_POSTERS_SQL, io.StringIO(copy_text(records)))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    return [created(row_no, poster_id) for poster_id, (row_no, _) in zip(ids, ready)]
+
+
+def _insert_rows(connection, ready):
+    """Row-by-row fallback for a batch whose COPY failed."""
+    reports = []
+    with connection() as conn:
+        if not conn:
+            return [failure(row_no, "Database connection failed") for row_no, _ in ready]
+        cur = conn.cursor()
+        try:
+            for row_no, row in ready:
+                try:
+                    cur.execute(ALLOCATE_IDS_SQL, (1,))
+                    poster_id = cur.fetchone()[0]
+                    cur.execute(INSERT_IMPORTED_SQL, record_for(poster_id, row))
+                    conn.commit()
+                    reports.append(created(row_no, poster_id))
+                except Exception as e:
+                    conn.rollback()
+                    reports.append(failure(row_no, str(e).strip()))
+        finally:
+            cur.close()
+    return reports
+
+
+def import_posters(rows, images, bucket_name, connection, threads=UPLOAD_THREADS, batch_size=BATCH_SIZE):
+    """
+    Imports (row number, record) pairs and yields a report per row,
+    {"row", "status": "created" | "failed", "poster_id" | "error"}, in row
+    order as each batch finishes. `connection` returns a context manager
+    yielding a psycopg2 connection (or None when none is available).
+    """
+    # Rows naming the same image share one upload for the whole import.
+    uploads = {}
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="import-upload") as executor:
+        for batch in batches(rows, batch_size):
+            reports, ready, pending = prepare_batch(batch, images)
+            futures = []
+            for row_no, row in pending:
+                if row["image"] not in uploads:
+                    uploads[row["image"]] = executor.submit(_upload, images, row, bucket_name)
+                futures.append((row_no, row, uploads[row["image"]]))
+            for row_no, row, future in futures:
+                try:
+                    row["photo_url"], row["content_hash"] = future.result()
+                except Exception as e:
+                    # Later batches naming the image try again.
+                    uploads.pop(row["image"], None)
+                    log.warning("Import upload failed: %s", e, extra={"row": row_no})
+                    reports.append(failure(row_no, f"Upload failed: {e}"))
+                else:
+                    ready.append((row_no, row))
+            if ready:
+                ready.sort(key=lambda item: item[0])
+                try:
+                    reports.extend(_copy_rows(connection, ready))
+                except Exception as e:
+                    log.warning("COPY of an import batch failed, inserting row by row: %s", e)
+                    reports.extend(_insert_rows(connection, ready))
+            reports.sort(key=lambda report: report["row"])
+            log.info("Imported poster batch", extra={
+                "rows_created": sum(r["status"] == "created" for r in reports),
+                "rows_failed": sum(r["status"] == "failed" for r in reports),
+            })
+            yield from reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-import posters")
+    parser.add_argument("metadata", help="NDJSON or CSV file of posters")
+    parser.add_argument("--images", help="zip archive or directory holding the images rows refer to")
+    parser.add_argument("--format", choices=("ndjson", "csv"))
+    parser.add_argument("--bucket", default=os.environ.get("POSTER_BUCKET_NAME", "poster-app-photos-137340833578"))
+    parser.add_argument("--threads", type=int, default=UPLOAD_THREADS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--report", default="import-report.ndjson", help="where to write the per-row report")
+    args = parser.parse_args()
+
+    try:
+        import_format = detect_format(args.metadata, args.format)
+        images = open_images(args.images) if args.images else None
+    except ValueError as e:
+        parser.error(str(e))
+    counts = {"created": 0, "failed": 0}
+    with open(args.metadata, "rb") as f, open(args.report, "w") as out:
+        try:
+            rows = read_rows(f, import_format)
+        except ValueError as e:
+            parser.error(str(e))
+        pool = db_pool.get_pool()
+        for report in import_posters(rows, images, args.bucket, pool.connection, args.threads, args.batch_size):
+            counts[report["status"]] += 1
+            out.write(json.dumps(report) + "\n")
+    log.info("Import finished", extra={"rows_created": counts["created"], "rows_failed": counts["failed"], "report": args.report})
+    sys.exit(1 if counts["failed"] else 0)
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with per-entry TTL and LRU eviction.
+
+    get_or_load() collapses concurrent misses on the same key into a single
+    call to the loader; the other callers wait for its result.
+    """
+
+    def __init__(self, maxsize=256, ttl=30.0, name="cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._inflight = {}          # key -> _Flight
+        self._generation = 0         # bumped by every invalidation
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "loads": 0,
+            "load_errors": 0,
+            "collapsed": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def _lookup(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._data[key]
+            self._stats["expirations"] += 1
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def get_many(self, keys):
+        """Returns {key: value} for the keys that are cached, under one lock."""
+        found = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self._lookup(key, now)
+                if entry is None:
+                    self._stats["misses"] += 1
+                else:
+                    self._stats["hits"] += 1
+                    found[key] = entry[1]
+        return found
+
+    @property
+    def generation(self):
+        """Bumped by every invalidation; see set()."""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, ttl=None, generation=None):
+        """
+        Stores `value`. For a value loaded outside get_or_load(), pass the
+        generation read before the load started: the value is dropped if an
+        invalidation landed in between.
+        """
+        with self._lock:
+            if generation is None or generation == self._generation:
+                self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl=None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for `key`, calling `loader()` on a miss.
+        Exceptions raised by the loader propagate to every waiting caller.
+        """
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+            if entry is not None:
+                self._stats["hits"] += 1
+                return entry[1]
+            self._stats["misses"] += 1
+            flight = self._inflight.get(key)
+            if flight is None:
+                flight = _Flight(self._generation)
+                self._inflight[key] = flight
+                leader = True
+            else:
+                self._stats["collapsed"] += 1
+                leader = False
+
+        if not leader:
+            return flight.wait()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._stats["load_errors"] += 1
+                self._inflight.pop(key, None)
+            flight.fail(e)
+            raise
+        with self._lock:
+            self._stats["loads"] += 1
+            # Don't cache a value that was computed before an invalidation landed.
+            if flight.generation == self._generation:
+                self._store(key, value)
+            self._inflight.pop(key, None)
+        flight.resolve(value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drops every entry whose key satisfies `predicate(key)`."""
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._data)
+            stats["maxsize"] = self.maxsize
+            stats["ttl"] = self.ttl
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class _Flight:
+    """A load in progress that other callers can wait on."""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def wait(self):
+        self._event.wait()
+        if self._error is not None:
+            raise self._error
+        return self._value
@@ -0,0 +1,103 @@
+"""
+Conditional GETs and Cache-Control for the read endpoints; shared by app.py
+and asgi.py.
+
+Validators are weak ETags (the same for every Content-Encoding of a body),
+plus Last-Modified where there is a timestamp to give. GET /posters takes
+its validators from the table's watermark (see POSTERS_WATERMARK_SQL in
+app.py), so it can answer a revalidation with 304 before running the page
+query. The other endpoints listed in CACHE_CONTROL get an ETag digested from
+the body they built, which saves the transfer but not the work.
+"""
+import hashlib
+import os
+from datetime import timezone
+
+from werkzeug.http import http_date, parse_date, parse_etags, unquote_etag
+
+# How long browsers (max-age) and shared caches such as a CDN (s-maxage) may
+# reuse public poster reads without revalidating.
+PUBLIC_MAX_AGE = int(os.environ.get("PUBLIC_MAX_AGE", 30))
+CDN_MAX_AGE = int(os.environ.get("CDN_MAX_AGE", PUBLIC_MAX_AGE))
+PUBLIC = f"public, max-age={PUBLIC_MAX_AGE}, s-maxage={CDN_MAX_AGE}"
+
+# Endpoint (the view's name, the same in both apps) -> Cache-Control for its
+# 200 and 304 responses. Profiles may only be kept by the user's browser, and
+# are revalidated on every use.
+CACHE_CONTROL = {
+    "list_posters": PUBLIC,
+    "search_posters": PUBLIC,
+    "get_poster": PUBLIC,
+    "get_posters_batch": PUBLIC,
+    "profile": "private, no-cache",
+}
+
+
+def etag_for(*parts):
+    """Weak ETag header value over `parts` (bytes, or anything str() describes)."""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return f'W/"{digest.hexdigest()}"'
+
+
+def watermark_validators(version, changed_at):
+    """(ETag, Last-Modified) for a table at `version`, last written at `changed_at`."""
+    # In UTC, so servers on sessions with different time zones agree.
+    changed = changed_at.astimezone(timezone.utc).isoformat() if changed_at is not None else None
+    return etag_for("posters", version, changed), changed_at
+
+
+def is_conditional(headers):
+    return "If-None-Match" in headers or "If-Modified-Since" in headers
+
+
+def not_modified(headers, etag, last_modified=None):
+    """
+    Whether the request's If-None-Match (or, without one, If-Modified-Since)
+    says the client already has the representation with these validators.
+    ETags compare weakly; dates to the second, as HTTP dates carry no more.
+    """
+    if_none_match = headers.get("If-None-Match")
+    if if_none_match is not None:
+        return parse_etags(if_none_match).contains_weak(unquote_etag(etag)[0])
+    since = parse_date(headers.get("If-Modified-Since"))
+    if since is None or last_modified is None:
+        return False
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag, last_modified=None):
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def init_app(app):
+    """
+    Adds Cache-Control to the CACHE_CONTROL endpoints, gives their 200s an
+    ETag when the view didn't set one, and turns matching revalidations into
+    304s.
+    """
+    from flask import request
+
+    @app.after_request
+    def conditional_response(response):
+        cache_control = CACHE_CONTROL.get(request.endpoint)
+        if cache_control is None or request.method not in ("GET", "HEAD"):
+            return response
+        if response.status_code == 200 and not response.is_streamed:
+            etag = response.headers.get("ETag")
+            if etag is None:
+                etag = response.headers["ETag"] = etag_for(response.get_data())
+            last_modified = response.last_modified
+            if not_modified(request.headers, etag, last_modified):
+                vary = response.headers.get("Vary")
+                response = app.response_class(status=304, headers=validator_headers(etag, last_modified))
+                if vary:
+                    response.headers["Vary"] = vary
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = cache_control
+        return response
@@ -0,0 +1,387 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+import metrics
+
+
+class PoolError(Exception):
+    """Raised when a connection cannot be checked out of the pool."""
+
+
+class PoolTimeout(PoolError):
+    """Raised when the pool stays saturated for longer than the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are checked for liveness on checkout and recycled once they
+    have been used `max_uses` times or are older than `max_lifetime` seconds.
+    """
+
+    def __init__(self, connect, minconn=1, maxconn=5, timeout=10.0,
+                 max_uses=1000, max_lifetime=1800.0, check_idle_after=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (minconn, maxconn))
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_lifetime = max_lifetime
+        self.check_idle_after = check_idle_after
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []        # idle connections, most recently returned last
+        self._meta = {}        # id(conn) -> {"created": ts, "uses": n, "returned": ts}
+        self._size = 0         # idle + checked out
+        self._closed = False
+        self._pid = os.getpid()
+        self._inherited = []   # parent's connections, kept referenced so GC never closes them
+
+        self._stats = {
+            "checkouts": 0,
+            "connects": 0,
+            "recycled": 0,
+            "failed_health_checks": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "saturated_checkouts": 0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._register(conn)
+            self._idle.append(conn)
+            self._size += 1
+
+    # ---------------- internals -----------------
+
+    def _register(self, conn):
+        now = time.monotonic()
+        self._meta[id(conn)] = {"created": now, "uses": 0, "returned": now}
+        self._stats["connects"] += 1
+
+    def _discard(self, conn):
+        self._meta.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn, now):
+        meta = self._meta.get(id(conn))
+        if meta is None:
+            return True
+        if self.max_uses and meta["uses"] >= self.max_uses:
+            return True
+        if self.max_lifetime and now - meta["created"] >= self.max_lifetime:
+            return True
+        return False
+
+    def _is_alive(self, conn, now):
+        if conn.closed:
+            return False
+        meta = self._meta[id(conn)]
+        # Connections handed back recently are trusted; only ping ones that sat idle.
+        if now - meta["returned"] < self.check_idle_after:
+            return True
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reset_after_fork(self):
+        # Connections must never be shared across processes (e.g. preloaded workers).
+        if os.getpid() != self._pid:
+            with self._cond:
+                if os.getpid() != self._pid:
+                    self._inherited.extend(self._idle)
+                    self._idle = []
+                    self._meta = {}
+                    self._size = 0
+                    self._pid = os.getpid()
+
+    # ---------------- public API -----------------
+
+    def getconn(self):
+        """Check a healthy connection out of the pool, waiting if it is saturated."""
+        self._reset_after_fork()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = None
+        while True:
+            # Reserve either an idle connection or a free slot under the lock;
+            # pinging and connecting happen outside it.
+            with self._cond:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                conn = None
+                reserved = False
+                while conn is None:
+                    if self._idle:
+                        conn = self._idle.pop()
+                    elif self._size < self.maxconn:
+                        self._size += 1
+                        reserved = True
+                        break
+                    else:
+                        if waited is None:
+                            waited = time.monotonic()
+                            self._stats["waits"] += 1
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats["timeouts"] += 1
+                            self._record_wait(waited)
+                            raise PoolTimeout("Timed out waiting %.1fs for a database connection" % self.timeout)
+                        self._cond.wait(remaining)
+
+            if reserved:
+                try:
+                    conn = self._connect()
+                except Exception as e:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise PoolError("Database connection failed: %s" % e) from e
+                with self._cond:
+                    self._register(conn)
+            else:
+                now = time.monotonic()
+                if self._expired(conn, now):
+                    self._release_slot(conn, "recycled")
+                    continue
+                if not self._is_alive(conn, now):
+                    self._release_slot(conn, "failed_health_checks")
+                    continue
+
+            with self._cond:
+                self._meta[id(conn)]["uses"] += 1
+                self._stats["checkouts"] += 1
+                if waited is not None:
+                    self._record_wait(waited)
+                if self._size >= self.maxconn and not self._idle:
+                    self._stats["saturated_checkouts"] += 1
+            metrics.DB_POOL_CHECKOUT.observe(time.monotonic() - started)
+            return conn
+
+    def _release_slot(self, conn, counter):
+        with self._cond:
+            self._stats[counter] += 1
+            self._discard(conn)
+            self._size -= 1
+            self._cond.notify()
+
+    def _record_wait(self, started):
+        elapsed = time.monotonic() - started
+        self._stats["wait_time_total"] += elapsed
+        if elapsed > self._stats["wait_time_max"]:
+            self._stats["wait_time_max"] = elapsed
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            if id(conn) not in self._meta:
+                # Connection from before a fork or already discarded.
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                return
+            if discard or conn.closed or self._closed or self._expired(conn, time.monotonic()):
+                if not discard and not conn.closed and not self._closed:
+                    self._stats["recycled"] += 1
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._meta[id(conn)]["returned"] = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager for a per-request checkout. The connection is returned
+        to the pool on exit; it is discarded if the block raised a database error.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard or conn.closed)
+
+    def stats(self):
+        """Snapshot of pool counters and current occupancy."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["min"] = self.minconn
+            stats["max"] = self.maxconn
+        return stats
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                self._discard(conn)
+                self._size -= 1
+            self._idle = []
+            self._cond.notify_all()
+
+
+# ---------------- COPY -----------------
+
+def copy_field(value):
+    """One value in COPY's text format."""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CopySource:
+    """
+    File-like read() over an iterable of bytes chunks, for copy_expert().
+    Chunks are handed out in pieces rather than joined, so a large row
+    streamed through it is never held whole.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = b""
+        self._offset = 0
+
+    def read(self, size=-1):
+        while self._offset >= len(self._chunk):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._chunk, self._offset = chunk, 0
+        end = len(self._chunk) if size is None or size < 0 else self._offset + size
+        piece = self._chunk[self._offset:end]
+        self._offset += len(piece)
+        return piece
+
+
+# ---------------- Prepared statements -----------------
+
+PreparedStatement = namedtuple("PreparedStatement", "name prepare execute")
+
+_prepared = {}   # psycopg2 SQL -> PreparedStatement
+
+
+def numbered_placeholders(sql):
+    """Rewrites psycopg2's %s placeholders into Postgres's $1..$n."""
+    parts = sql.split("%s")
+    return parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+
+
+def prepared(name, sql):
+    """
+    Registers a hot statement under `name`, for the db_query_* metrics and as
+    a named prepared statement: connections from this module PREPARE it the
+    first time they run it and EXECUTE it from then on, so Postgres parses
+    and plans it once per connection. Returns `sql` unchanged.
+    """
+    metrics.name_statement(name, sql)
+    count = sql.count("%s")
+    arguments = "(" + ", ".join(["%s"] * count) + ")" if count else ""
+    _prepared[sql] = PreparedStatement(
+        name, f"PREPARE {name} AS {numbered_placeholders(sql).replace('%%', '%')}", f"EXECUTE {name}{arguments}"
+    )
+    return sql
+
+
+class PreparingConnection(extensions.connection):
+    """Remembers which statements have been PREPAREd in its session."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Prepared statements outlive transactions, rolled back or not.
+        self.prepared = set()
+
+
+class TimedCursor(extensions.cursor):
+    """
+    Records every execute() in db_query_duration_seconds, by statement name,
+    and runs statements registered with prepared() as prepared statements.
+    """
+
+    def execute(self, query, vars=None):
+        name = metrics.statement_name(query)
+        statement = _prepared.get(query)
+        prepared_here = getattr(self.connection, "prepared", None)
+        if statement is not None and prepared_here is not None:
+            if statement.name not in prepared_here:
+                with metrics.db_timer("prepare"):
+                    super().execute(statement.prepare)
+                prepared_here.add(statement.name)
+            query = statement.execute
+        with metrics.db_timer(name):
+            return super().execute(query, vars)
+
+
+def connect_from_env():
+    return psycopg2.connect(
+        dbname=os.environ["DB_NAME"],
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASSWORD"],
+        host=os.environ["DB_HOST"],
+        connection_factory=PreparingConnection,
+        cursor_factory=TimedCursor,
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_stats():
+    """The process-wide pool's stats, or {} if it hasn't been created yet."""
+    pool = _pool
+    return pool.stats() if pool is not None else {}
+
+
+def get_pool():
+    """Return the process-wide pool, creating it from the environment on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    connect_from_env,
+                    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+                    maxconn=int(os.environ.get("DB_POOL_MAX", 5)),
+                    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+                    max_uses=int(os.environ.get("DB_POOL_MAX_USES", 1000)),
+                    max_lifetime=float(os.environ.get("DB_POOL_MAX_LIFETIME", 1800)),
+                    check_idle_after=float(os.environ.get("DB_POOL_CHECK_IDLE_AFTER", 30)),
+                )
+    return _pool
@@ -0,0 +1,183 @@
+import argparse
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse, unquote
+
+from psycopg2.extras import Json
+
+import logs
+
+# Widths (in px) rendered for every photo, and the formats each is encoded in.
+WIDTHS = tuple(int(w) for w in os.environ.get("DERIVATIVE_WIDTHS", "200,400,800,1600").split(","))
+FORMATS = (("image/webp", "WEBP", "webp"), ("image/jpeg", "JPEG", "jpg"))
+QUALITY = int(os.environ.get("DERIVATIVE_QUALITY", 80))
+PROCESSES = int(os.environ.get("DERIVATIVE_PROCESSES", max(1, (os.cpu_count() or 2) - 1)))
+# Concurrent uploads per photo; the default covers every derivative at once.
+UPLOAD_THREADS = int(os.environ.get("DERIVATIVE_UPLOAD_THREADS", len(WIDTHS) * len(FORMATS)))
+
+log = logs.get_logger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def render_derivatives(data, widths=WIDTHS):
+    """
+    Decodes an image and re-encodes it at each width (never upscaling).
+    Runs in a worker process; returns [(width, content_type, ext, bytes)].
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        targets = sorted({w for w in widths if w < image.width} | {min(max(widths), image.width)})
+
+        rendered = []
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for content_type, pil_format, ext in FORMATS:
+                frame = resized.convert("RGB") if pil_format == "JPEG" else resized
+                out = io.BytesIO()
+                frame.save(out, pil_format, quality=QUALITY, optimize=True)
+                rendered.append((width, content_type, ext, out.getvalue()))
+        return rendered
+
+
+def get_executor():
+    """Process pool shared by the upload workers and the backfill command."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn, not fork: the web process is multi-threaded.
+                _executor = ProcessPoolExecutor(
+                    max_workers=PROCESSES, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _executor
+
+
+def derivative_blob_name(base_blob_name, width, ext):
+    """Object name of one derivative, stored next to the original."""
+    stem = base_blob_name.rsplit(".", 1)[0]
+    return f"{stem}_{width}w.{ext}"
+
+
+def build_derivatives(data, bucket_name, base_blob_name):
+    """
+    Renders `data` off-process, uploads the derivatives next to the original
+    on UPLOAD_THREADS threads and returns the variants structure stored in
+    posters.photo_variants:
+    {content_type: [[width, url], ...]}.
+    """
+    from storage_client import upload_stream
+
+    rendered = get_executor().submit(render_derivatives, data).result()
+    variants = {}
+    with ThreadPoolExecutor(max_workers=UPLOAD_THREADS, thread_name_prefix="derivative-upload") as executor:
+        uploads = [
+            (width, content_type, executor.submit(
+                upload_stream, io.BytesIO(body), bucket_name,
+                derivative_blob_name(base_blob_name, width, ext), content_type=content_type
+            ))
+            for width, content_type, ext, body in rendered
+        ]
+        for width, content_type, future in uploads:
+            url, _ = future.result()
+            variants.setdefault(content_type, []).append([width, url])
+    return variants
+
+
+def srcset_from_variants(variants):
+    """Turns stored variants into {content_type: "url 200w, url 400w"}, ready for <source srcset>."""
+    if not variants:
+        return None
+    return {
+        content_type: ", ".join(f"{url} {width}w" for width, url in sorted(entries))
+        for content_type, entries in variants.items()
+    }
+
+
+def blob_name_from_url(photo_url, bucket_name):
+    """Recovers the object name from a public https://storage.googleapis.com/<bucket>/<name> URL."""
+    path = unquote(urlparse(photo_url).path).lstrip("/")
+    prefix = bucket_name + "/"
+    return path[len(prefix):] if path.startswith(prefix) else None
+
+
+def backfill(batch_size=50, io_threads=8):
+    """
+    Renders derivatives for every poster that has a photo but no variants,
+    walking the table by id in batches. Downloads and uploads run on a thread
+    pool; rendering runs on the process pool.
+    """
+    import db_pool
+    from storage_client import download_blob
+
+    bucket_name = os.environ.get("POSTER_BUCKET_NAME", "poster-app-photos-137340833578")
+    pool = db_pool.get_pool()
+    last_id = 0
+    done = failed = 0
+
+    def process(row):
+        poster_id, photo_url = row
+        blob_name = blob_name_from_url(photo_url, bucket_name)
+        if not blob_name:
+            raise ValueError(f"photo_url is not in bucket {bucket_name}: {photo_url}")
+        return poster_id, build_derivatives(download_blob(bucket_name, blob_name), bucket_name, blob_name)
+
+    with ThreadPoolExecutor(max_workers=io_threads) as threads:
+        while True:
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    cur.execute(
+                        "SELECT id, photo_url FROM posters WHERE id > %s AND photo_url IS NOT NULL "
+                        "AND photo_variants IS NULL ORDER BY id LIMIT %s",
+                        (last_id, batch_size)
+                    )
+                    rows = cur.fetchall()
+                finally:
+                    cur.close()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            futures = [(row[0], threads.submit(process, row)) for row in rows]
+            results = []
+            for poster_id, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    failed += 1
+                    log.warning("Derivative backfill failed: %s", e, extra={"poster_id": poster_id})
+
+            with pool.connection() as conn:
+                cur = conn.cursor()
+                try:
+                    for poster_id, variants in results:
+                        cur.execute(
+                            "UPDATE posters SET photo_variants = %s WHERE id = %s",
+                            (Json(variants), poster_id)
+                        )
+                    conn.commit()
+                finally:
+                    cur.close()
+            done += len(results)
+            log.info("Backfilled derivatives", extra={"done": done, "failed": failed, "last_id": last_id})
+    return done, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poster photo derivatives")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("backfill", help="Render derivatives for existing posters")
+    cmd.add_argument("--batch-size", type=int, default=50)
+    cmd.add_argument("--io-threads", type=int, default=8)
+    args = parser.parse_args()
+    backfill(batch_size=args.batch_size, io_threads=args.io_threads)
@@ -0,0 +1,47 @@
+# gunicorn settings for serving app:app in production (see start.sh).
+# Every value can be overridden from the environment.
+import os
+
+cpus = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# One process per CPU, each serving requests on a small thread pool. Keep
+# DB_POOL_MAX at or above threads + POSTER_WORKERS so threads rarely wait.
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", cpus))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Import the app once in the master and fork workers from it, so each worker
+# starts serving without re-importing Flask and psycopg2. The storage client
+# is imported and built per worker, by the warm-up or the first upload.
+preload_app = True
+
+# Recycle workers after a bounded number of requests (jittered so they don't
+# all restart together) to cap slow memory growth.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# On SIGTERM, stop accepting connections and let in-flight requests finish.
+# Cloud Run allows 10 seconds between SIGTERM and SIGKILL.
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 8))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    # Connections and clients must be created after the fork, per worker,
+    # and in the background so the worker serves while they're set up.
+    import app
+    app.start_warm_up()
+
+
+def worker_exit(server, worker):
+    import app
+    import db_pool
+    app.job_workers.stop(timeout=graceful_timeout)
+    if db_pool._pool is not None:
+        db_pool._pool.closeall()
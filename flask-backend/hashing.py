@@ -0,0 +1,171 @@
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+import logs
+
+# werkzeug method string, e.g. "pbkdf2:sha256:600000".
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}")
+SALT_LENGTH = int(os.environ.get("PASSWORD_SALT_LENGTH", 16))
+# Every server worker process has its own pool, so by default the CPUs are
+# split between the WEB_CONCURRENCY workers (gunicorn.conf.py runs one per CPU
+# unless it is set) instead of each worker starting one process per CPU.
+# 0 hashes inline on the calling thread (handy for local runs and tests).
+WEB_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+HASH_PROCESSES = int(os.environ.get("HASH_PROCESSES", max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+# Requests beyond this many queued or running hashes are shed with a 503.
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", 4 * max(1, HASH_PROCESSES)))
+
+
+class HashingOverloaded(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+
+def _normalize(method):
+    # "pbkdf2:sha256" means werkzeug's default iteration count; spell it out
+    # so stored hashes can be compared against the configured parameters.
+    parts = method.split(":")
+    if parts[0] == "pbkdf2" and len(parts) == 2:
+        return f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+log = logs.get_logger(__name__)
+
+_method = _normalize(HASH_METHOD)
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+_stats = {"hashes": 0, "verifications": 0, "rehashes": 0, "shed": 0}
+
+
+def _count(name):
+    with _pending_lock:
+        _stats[name] += 1
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=HASH_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _executor
+
+
+def _discard_executor(executor):
+    # A child died (e.g. OOM-killed); start a fresh pool on the next call.
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _run(fn, *args):
+    global _pending
+    if HASH_PROCESSES <= 0:
+        return fn(*args)
+    with _pending_lock:
+        if _pending >= HASH_MAX_PENDING:
+            _stats["shed"] += 1
+            raise HashingOverloaded("Too many password operations in flight")
+        _pending += 1
+    try:
+        executor = _get_executor()
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            _discard_executor(executor)
+            raise
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+def hash_password(password):
+    """Hashes with the configured method off the request thread."""
+    _count("hashes")
+    return _run(generate_password_hash, password, _method, SALT_LENGTH)
+
+
+def verify_password(password_hash, password):
+    _count("verifications")
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with parameters other than the configured ones."""
+    return password_hash.split("$", 1)[0] != _method
+
+
+def rehash_if_needed(password_hash, password):
+    """
+    Call after a successful verification; returns a replacement hash when the
+    stored one is outdated, otherwise None.
+    """
+    if not needs_rehash(password_hash):
+        return None
+    _count("rehashes")
+    return hash_password(password)
+
+
+def hashing_stats():
+    with _pending_lock:
+        stats = dict(_stats, pending=_pending)
+    stats.update(method=_method, processes=HASH_PROCESSES, max_pending=HASH_MAX_PENDING)
+    return stats
+
+
+def benchmark(duration=5.0, threads=None):
+    """
+    Drives verify_password() from `threads` concurrent callers for `duration`
+    seconds and logs logins per second overall and per hashing process.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    threads = threads or max(1, HASH_PROCESSES) * 2
+    stored = generate_password_hash("correct horse battery staple", _method, SALT_LENGTH)
+    verify_password(stored, "warm up the pool")
+    deadline = time.monotonic() + duration
+    counts = [0] * threads
+
+    def worker(i):
+        while time.monotonic() < deadline:
+            try:
+                verify_password(stored, "correct horse battery staple")
+                counts[i] += 1
+            except HashingOverloaded:
+                time.sleep(0.001)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.monotonic() - started
+    total = sum(counts)
+    cores = max(1, HASH_PROCESSES)
+    log.info("Hashing benchmark finished", extra={
+        "method": _method, "processes": HASH_PROCESSES, "threads": threads,
+        "logins": total, "seconds": round(elapsed, 2),
+        "per_second": round(total / elapsed, 1), "per_core": round(total / elapsed / cores, 1),
+        "shed": _stats["shed"],
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password hashing service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmd = sub.add_parser("bench", help="Measure logins per second per core")
+    cmd.add_argument("--duration", type=float, default=5.0)
+    cmd.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+    benchmark(duration=args.duration, threads=args.threads)
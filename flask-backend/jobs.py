@@ -0,0 +1,291 @@
+import binascii
+import os
+import threading
+
+import db_pool
+import logs
+from metrics import db_timer, name_statement
+
+POSTER_WORKERS = int(os.environ.get("POSTER_WORKERS", 2))
+POLL_INTERVAL = float(os.environ.get("POSTER_JOB_POLL_INTERVAL", 2))
+MAX_ATTEMPTS = int(os.environ.get("POSTER_JOB_MAX_ATTEMPTS", 5))
+BACKOFF_BASE = float(os.environ.get("POSTER_JOB_BACKOFF_BASE", 5))
+BACKOFF_MAX = float(os.environ.get("POSTER_JOB_BACKOFF_MAX", 600))
+# A running job whose worker has not finished within this many seconds is
+# assumed lost (instance shut down mid-job) and becomes claimable again.
+LOCK_TIMEOUT = float(os.environ.get("POSTER_JOB_LOCK_TIMEOUT", 300))
+# Bytes of photo read and hex-encoded at a time while a job is written.
+PAYLOAD_CHUNK_SIZE = 512 * 1024
+
+log = logs.get_logger(__name__)
+
+# Statements are shared with the asyncio worker in asgi.py, which rewrites
+# the %s placeholders for asyncpg. Status polls and claims, which run all the
+# time, are prepared statements. Jobs are written with COPY, so the photo
+# streams from the spooled upload into the row instead of being read into
+# memory and escaped as one bytea literal; COPY can't return the id, so it's
+# drawn from the sequence first.
+NEXT_JOB_ID_SQL = name_statement(
+    "next_job_id", "SELECT nextval(pg_get_serial_sequence('poster_jobs', 'id'))"
+)
+COPY_JOB_COLUMNS = (
+    "id", "username", "title", "description", "artist", "blob_name", "content_type",
+    "content_hash", "content_crc32c", "max_attempts", "payload",
+)
+COPY_JOB_SQL = f"COPY poster_jobs ({', '.join(COPY_JOB_COLUMNS)}) FROM STDIN"
+
+GET_JOB_SQL = db_pool.prepared("get_job", (
+    "SELECT j.id, j.status, j.progress, j.attempts, j.max_attempts, j.error, "
+    "j.created_at, j.updated_at, j.username, "
+    "p.id, p.title, p.description, p.artist, p.photo_url "
+    "FROM poster_jobs j LEFT JOIN posters p ON p.id = j.poster_id WHERE j.id = %s"
+))
+
+CLAIM_SQL = db_pool.prepared("claim_job", """
+    UPDATE poster_jobs
+       SET status = 'running', progress = 'claimed', attempts = attempts + 1,
+           locked_at = now(), updated_at = now()
+     WHERE id = (
+           SELECT id FROM poster_jobs
+            WHERE (status = 'queued' AND run_after <= now())
+               OR (status = 'running' AND locked_at < now() - %s * interval '1 second')
+            ORDER BY run_after, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED)
+    RETURNING id, attempts, max_attempts, username, title, description, artist,
+              blob_name, content_type, payload, content_hash, content_crc32c
+""")
+
+SET_PROGRESS_SQL = name_statement(
+    "set_job_progress", "UPDATE poster_jobs SET progress = %s, updated_at = now() WHERE id = %s"
+)
+
+COMPLETE_SQL = name_statement("complete_job", (
+    "UPDATE poster_jobs SET status = 'succeeded', progress = 'done', poster_id = %s, "
+    "payload = NULL, error = NULL, locked_at = NULL, updated_at = now() WHERE id = %s"
+))
+
+RETRY_SQL = name_statement("retry_job", (
+    "UPDATE poster_jobs SET status = 'queued', progress = 'retry scheduled', error = %s, "
+    "locked_at = NULL, run_after = now() + %s * interval '1 second', updated_at = now() "
+    "WHERE id = %s"
+))
+
+FAIL_SQL = name_statement("fail_job", (
+    "UPDATE poster_jobs SET status = 'failed', progress = 'failed', error = %s, "
+    "locked_at = NULL, payload = NULL, updated_at = now() WHERE id = %s"
+))
+
+
+def job_status_from_row(row):
+    """Shapes a GET_JOB_SQL row for the status endpoint."""
+    job = {
+        "id": row[0],
+        "status": row[1],
+        "progress": row[2],
+        "attempts": row[3],
+        "max_attempts": row[4],
+        "error": row[5],
+        "created_at": row[6],
+        "updated_at": row[7],
+        "username": row[8],
+        "poster": None,
+    }
+    if row[9] is not None:
+        job["poster"] = {
+            "id": row[9],
+            "title": row[10],
+            "description": row[11],
+            "artist": row[12],
+            "photo_url": row[13],
+        }
+    return job
+
+
+def job_from_claim_row(row):
+    return {
+        "id": row[0],
+        "attempts": row[1],
+        "max_attempts": row[2],
+        "username": row[3],
+        "title": row[4],
+        "description": row[5],
+        "artist": row[6],
+        "blob_name": row[7],
+        "content_type": row[8],
+        "payload": bytes(row[9]) if row[9] is not None else None,
+        # None for jobs queued before uploads were content-addressed.
+        "content_hash": row[10],
+        "content_crc32c": row[11],
+    }
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt: exponential, capped at BACKOFF_MAX."""
+    return min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (attempts - 1)))
+
+
+def copy_job_chunks(values, photo, chunk_size=PAYLOAD_CHUNK_SIZE):
+    """
+    One poster_jobs row in COPY's text format, as bytes chunks: `values` for
+    COPY_JOB_COLUMNS up to the payload, then `photo` (a file positioned at the
+    image's start, or None) as the payload, read and hex-encoded a chunk at a
+    time.
+    """
+    head = "\t".join(db_pool.copy_field(v) for v in values) + "\t"
+    if photo is None:
+        yield (head + "\\N\n").encode()
+        return
+    # bytea's hex input form, \x..., with the backslash escaped for COPY.
+    yield (head + "\\\\x").encode()
+    while True:
+        chunk = photo.read(chunk_size)
+        if not chunk:
+            break
+        yield binascii.hexlify(chunk)
+    yield b"\n"
+
+
+def enqueue_poster_job(conn, username, title, description, artist, blob_name, content_type, photo,
+                       content_hash=None, content_crc32c=None):
+    """
+    Writes a queued ingestion job and returns its id. `photo` is a file
+    positioned at the image's start, or None. The caller commits.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(NEXT_JOB_ID_SQL)
+        job_id = cur.fetchone()[0]
+        values = (job_id, username, title, description, artist, blob_name, content_type,
+                  content_hash, content_crc32c, MAX_ATTEMPTS)
+        with db_timer("copy_job"):
+            cur.copy_expert(
+                COPY_JOB_SQL, db_pool.CopySource(copy_job_chunks(values, photo)), size=2 * PAYLOAD_CHUNK_SIZE
+            )
+        return job_id
+    finally:
+        cur.close()
+
+
+def get_job(conn, job_id):
+    """Returns a job's status (plus the created poster once it succeeded), or None."""
+    cur = conn.cursor()
+    try:
+        cur.execute(GET_JOB_SQL, (job_id,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+    return job_status_from_row(row) if row else None
+
+
+def claim_job(conn):
+    """
+    Claims the oldest runnable job, skipping rows other workers hold locked.
+    Returns the job as a dict, or None if nothing is runnable.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute(CLAIM_SQL, (LOCK_TIMEOUT,))
+        row = cur.fetchone()
+        conn.commit()
+    finally:
+        cur.close()
+    return job_from_claim_row(row) if row else None
+
+
+def set_progress(conn, job_id, progress):
+    cur = conn.cursor()
+    try:
+        cur.execute(SET_PROGRESS_SQL, (progress, job_id))
+        conn.commit()
+    finally:
+        cur.close()
+
+
+def complete_job(cur, job_id, poster_id):
+    """Marks a job done inside the caller's transaction and drops its payload."""
+    cur.execute(COMPLETE_SQL, (poster_id, job_id))
+
+
+def fail_job(conn, job, error):
+    """Schedules a retry with exponential backoff, or fails the job for good."""
+    retry = job["attempts"] < job["max_attempts"]
+    cur = conn.cursor()
+    try:
+        if retry:
+            cur.execute(RETRY_SQL, (error, retry_delay(job["attempts"]), job["id"]))
+        else:
+            cur.execute(FAIL_SQL, (error, job["id"]))
+        conn.commit()
+    finally:
+        cur.close()
+    return retry
+
+
+class JobWorkerPool:
+    """
+    Background threads that claim poster jobs and pass them to `handler(job)`.
+
+    The handler raises to signal failure; the job is then retried with
+    backoff until it runs out of attempts.
+    """
+
+    def __init__(self, handler, workers=POSTER_WORKERS, poll_interval=POLL_INTERVAL):
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Starts the worker threads once per process; safe to call repeatedly."""
+        with self._lock:
+            if self._pid == os.getpid() or self.workers <= 0:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"poster-job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def notify(self):
+        """Wakes idle workers after a job was enqueued in this process."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                worked = self.run_once()
+            except Exception:
+                log.exception("Poster job worker error")
+                worked = False
+            if not worked:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self):
+        """Claims and processes at most one job. Returns False if the queue was empty."""
+        pool = db_pool.get_pool()
+        with pool.connection() as conn:
+            job = claim_job(conn)
+        if job is None:
+            return False
+        with logs.correlation(f"job-{job['id']}"):
+            try:
+                self.handler(job)
+            except Exception as e:
+                log.warning("Poster job attempt failed: %s", e, extra={"job_id": job["id"], "attempt": job["attempts"]})
+                with pool.connection() as conn:
+                    fail_job(conn, job, str(e))
+        return True
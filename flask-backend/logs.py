@@ -0,0 +1,330 @@
+"""
+Structured logging: one JSON object per line on stdout, in the shape Cloud
+Logging parses (severity, message, trace).
+
+Request threads only build the record and put it on a bounded queue; a
+background thread formats and writes batches. If the writer falls behind,
+records are dropped and counted in log_records_dropped_total rather than
+slowing requests down.
+
+Usage: log = logs.get_logger(__name__), then log.info("Created poster",
+extra={"poster_id": 42}). Keep the message a constant (or a %s template)
+and put variable data in extra fields or args, so repeated lines share a
+template for sampling and searching.
+
+Environment:
+  LOG_LEVEL            root level (default INFO)
+  LOG_LEVELS           per-logger overrides, e.g. "jobs=DEBUG,user_cache=WARNING"
+  LOG_FORMAT           "json" (default) or "text" for local runs
+  LOG_QUEUE_SIZE       records buffered for the writer (default 10000)
+  LOG_SAMPLE_BURST     DEBUG lines per template written in full each window (default 20)
+  LOG_SAMPLE_WINDOW    seconds (default 60)
+  LOG_SAMPLE_RATE      past the burst, 1 in this many is written (default 100)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import metrics
+
+LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LEVELS = os.environ.get("LOG_LEVELS", "")
+FORMAT = os.environ.get("LOG_FORMAT", "json")
+QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+SAMPLE_BURST = int(os.environ.get("LOG_SAMPLE_BURST", 20))
+SAMPLE_WINDOW = float(os.environ.get("LOG_SAMPLE_WINDOW", 60))
+SAMPLE_RATE = int(os.environ.get("LOG_SAMPLE_RATE", 100))
+# Cloud Logging links entries to a request's trace when this is set.
+PROJECT = os.environ.get("GOOGLE_CLOUD_PROJECT")
+
+# Most records are written well under this; flush at least this often.
+BATCH_SIZE = 500
+
+RECORDS_DROPPED = metrics.counter(
+    "log_records_dropped_total", "Log records dropped because the writer queue was full."
+)
+
+request_id = contextvars.ContextVar("request_id", default=None)
+trace_id = contextvars.ContextVar("trace_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through extra=.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+# ---------------- Correlation ids -----------------
+
+def ids_from_headers(get_header):
+    """(request id, trace id) from incoming headers, generating a request id if none came in."""
+    trace = None
+    cloud_trace = get_header("X-Cloud-Trace-Context")
+    if cloud_trace:
+        trace = cloud_trace.split("/", 1)[0] or None
+    rid = get_header("X-Request-ID") or trace or uuid.uuid4().hex
+    return rid[:128], trace
+
+
+@contextmanager
+def correlation(rid, trace=None):
+    """Tags every record logged in this context (thread or task) with `rid`."""
+    rid_token = request_id.set(rid)
+    trace_token = trace_id.set(trace)
+    try:
+        yield
+    finally:
+        request_id.reset(rid_token)
+        trace_id.reset(trace_token)
+
+
+def init_app(app):
+    """Gives each Flask request a correlation id, echoed back as X-Request-ID."""
+    from flask import g, request
+
+    @app.before_request
+    def bind_request_id():
+        rid, trace = ids_from_headers(request.headers.get)
+        g.log_tokens = (request_id.set(rid), trace_id.set(trace))
+
+    @app.after_request
+    def add_request_id_header(response):
+        rid = request_id.get()
+        if rid is not None:
+            response.headers["X-Request-ID"] = rid
+        return response
+
+    @app.teardown_request
+    def unbind_request_id(exc):
+        tokens = g.pop("log_tokens", None)
+        if tokens is not None:
+            request_id.reset(tokens[0])
+            trace_id.reset(tokens[1])
+
+
+class RequestIdMiddleware:
+    """ASGI counterpart of init_app()."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        rid, trace = ids_from_headers(lambda name: headers.get(name.lower()))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        with correlation(rid, trace):
+            await self.app(scope, receive, send_with_id)
+
+
+# ---------------- Formatting -----------------
+
+def _fields(record):
+    fields = {
+        "severity": record.levelname,
+        "message": record.getMessage(),
+        "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+        "logger": record.name,
+    }
+    if record.request_id is not None:
+        fields["request_id"] = record.request_id
+    if record.trace_id is not None and PROJECT:
+        fields["logging.googleapis.com/trace"] = f"projects/{PROJECT}/traces/{record.trace_id}"
+    for key, value in vars(record).items():
+        if key not in _RECORD_ATTRS and key not in ("request_id", "trace_id"):
+            fields[key] = value
+    if record.exc_text:
+        # Error Reporting picks exceptions up from this field.
+        fields["stack_trace"] = record.exc_text
+    return fields
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(_fields(record), default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = _fields(record)
+        head = f"{fields.pop('time')} {fields.pop('severity'):<7} {fields.pop('logger')}: {fields.pop('message')}"
+        stack = fields.pop("stack_trace", None)
+        if fields:
+            head += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return head + ("\n" + stack if stack else "")
+
+
+# ---------------- Pipeline -----------------
+
+class _Sampler(logging.Filter):
+    """
+    Lets the first SAMPLE_BURST DEBUG records per (logger, template) through
+    in each window, then 1 in SAMPLE_RATE, marked with sample_rate.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= SAMPLE_WINDOW:
+                if len(self._windows) >= 10000:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0]
+            window[1] += 1
+            count = window[1]
+        if count <= SAMPLE_BURST:
+            return True
+        if (count - SAMPLE_BURST) % SAMPLE_RATE == 0:
+            record.sample_rate = SAMPLE_RATE
+            return True
+        return False
+
+
+class QueueHandler(logging.Handler):
+    """
+    Hands records to the writer thread. Everything that has to happen on the
+    calling thread (the correlation ids, the message and traceback text,
+    which may reference objects the caller goes on to change) is done here;
+    the rest is left to the writer.
+    """
+
+    def __init__(self, formatter):
+        super().__init__()
+        self.formatter = formatter
+        self.addFilter(_Sampler())
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def handle(self, record):
+        # logging.Handler.handle() serializes every thread on one lock around
+        # emit(); the queue is already thread safe.
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def emit(self, record):
+        try:
+            record.request_id = request_id.get()
+            record.trace_id = trace_id.get()
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+                record.exc_info = None
+            if self._thread is None:
+                self._start()
+            self._queue.put_nowait(record)
+        except queue.Full:
+            RECORDS_DROPPED.inc()
+        except Exception:
+            self.handleError(record)
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _write_loop(self):
+        stream = sys.stdout
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            stop = False
+            for record in batch:
+                if record is None:
+                    stop = True
+                    continue
+                try:
+                    lines.append(self.formatter.format(record))
+                except Exception:
+                    self.handleError(record)
+            if lines:
+                try:
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+                except Exception:
+                    pass
+            if stop:
+                return
+
+    def close(self):
+        """Writes out whatever is queued, waiting up to a second."""
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            try:
+                self._queue.put(None, timeout=1)
+            except queue.Full:
+                pass
+            thread.join(1)
+        self._thread = None
+        super().close()
+
+    def _after_fork(self):
+        # The writer thread did not survive the fork, and records still queued
+        # belong to the parent, which writes them itself.
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+
+def _parse_levels(spec):
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+handler = QueueHandler(TextFormatter() if FORMAT == "text" else JSONFormatter())
+
+
+def configure():
+    """Routes the root logger (and so every library logger) through the queue."""
+    root = logging.getLogger()
+    if handler not in root.handlers:
+        root.addHandler(handler)
+    root.setLevel(LEVEL)
+    for name, level in _parse_levels(LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+configure()
+atexit.register(handler.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=handler._after_fork)
@@ -0,0 +1,246 @@
+"""
+In-process metrics with a Prometheus text exposition (see render()).
+
+Counters and histograms are lock-striped: each thread is assigned one of
+STRIPES shards on first use and only ever takes that shard's lock, so
+request threads don't contend on a single lock. Shards are summed at
+scrape time. Values are per process; under gunicorn each worker serves
+its own /metrics.
+"""
+import itertools
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+STRIPES = int(os.environ.get("METRICS_STRIPES", 16))
+
+# Seconds; covers fast cached reads through slow uploads.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_local = threading.local()
+_next_stripe = itertools.count()
+
+
+def _stripe_index():
+    index = getattr(_local, "stripe", None)
+    if index is None:
+        index = _local.stripe = next(_next_stripe) % STRIPES
+    return index
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._stripes = [(threading.Lock(), {}) for _ in range(STRIPES)]
+
+    def _merged(self):
+        merged = {}
+        for lock, data in self._stripes:
+            with lock:
+                for key, value in data.items():
+                    merged[key] = self._merge(merged.get(key), value)
+        return merged
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._merged().items()):
+            lines.extend(self._render_series(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        lock, data = self._stripes[_stripe_index()]
+        with lock:
+            data[label_values] = data.get(label_values, 0) + amount
+
+    def _merge(self, total, value):
+        return value if total is None else total + value
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        lock, data = self._stripes[_stripe_index()]
+        with lock:
+            series = data.get(label_values)
+            if series is None:
+                # per-bucket counts (not cumulative), then sum and count
+                series = data[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def _merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def _render_series(self, key, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            le = 'le="%s"' % _format_value(float(bound))
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [le])} {cumulative}")
+        labels = _format_labels(self.labels, key)
+        inf = _format_labels(self.labels, key, ['le="+Inf"'])
+        lines.append(f"{self.name}_bucket{inf} {series[-1]}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+        lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    Read at scrape time from `collect()`, which returns [(label_values, value)].
+    Use kind="counter" for running totals kept elsewhere (e.g. cache stats).
+    """
+
+    def __init__(self, name, help, labels, collect, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = self.collect()
+        except Exception:
+            samples = []
+        for key, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(float(value))}")
+        return lines
+
+
+_registry = []
+
+
+def counter(name, help, labels=()):
+    metric = Counter(name, help, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name, help, labels, collect, kind="gauge"):
+    metric = Gauge(name, help, labels, collect, kind)
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """Every registered metric in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---------------- Application metrics -----------------
+
+HTTP_REQUESTS = counter("http_requests_total", "Requests by route, method and status.", ("route", "method", "status"))
+HTTP_LATENCY = histogram("http_request_duration_seconds", "Request latency by route.", ("route", "method"))
+DB_QUERY_LATENCY = histogram("db_query_duration_seconds", "Query latency by statement name.", ("statement",))
+DB_QUERY_ERRORS = counter("db_query_errors_total", "Failed queries by statement name.", ("statement",))
+DB_POOL_CHECKOUT = histogram(
+    "db_pool_checkout_seconds", "Time to check a connection out of the pool, including any wait."
+)
+GCS_UPLOAD_LATENCY = histogram("gcs_upload_duration_seconds", "Object upload duration.", ("kind",))
+GCS_UPLOAD_BYTES = counter("gcs_upload_bytes_total", "Bytes uploaded to object storage.", ("kind",))
+GCS_UPLOAD_ERRORS = counter("gcs_upload_errors_total", "Failed object uploads.", ("kind",))
+GCS_UPLOADS_SKIPPED = counter(
+    "gcs_uploads_skipped_total", "Uploads skipped because the same content was already stored."
+)
+
+
+_statement_names = {}
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+
+
+def name_statement(name, sql):
+    """Registers `sql` under `name` for the db_query_* metrics and returns it unchanged."""
+    _statement_names[sql] = name
+    return sql
+
+
+def statement_name(sql):
+    """
+    The registered name of a statement, or "<verb>_<table>" (e.g.
+    "select_users") for ad-hoc SQL.
+    """
+    name = _statement_names.get(sql)
+    if name is None:
+        words = sql.split(None, 1)
+        verb = words[0].lower() if words else "unknown"
+        match = _TABLE_RE.search(sql)
+        name = f"{verb}_{match.group(1).lower()}" if match else verb
+        # Dynamic WHERE clauses make many texts; don't let the memo grow unbounded.
+        if len(_statement_names) < 1000:
+            _statement_names[sql] = name
+    return name
+
+
+@contextmanager
+def db_timer(statement):
+    """Times a query (execute plus fetch) under a statement name."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_QUERY_ERRORS.inc(statement)
+        raise
+    finally:
+        DB_QUERY_LATENCY.observe(time.perf_counter() - started, statement)
@@ -0,0 +1,170 @@
+"""
+Schema migrations: applies migrations/*.sql in file-name order and records
+each one in schema_migrations, so a file runs once per database.
+
+Files are named NNN_description.sql. 000 creates the base tables on a fresh
+database and leaves existing ones alone; every file is written to be safe on
+a database where it was already applied by hand (IF NOT EXISTS and friends).
+
+A file runs in one transaction together with its record, unless its first
+line is `-- migrate: no-transaction`. Those hold a single statement that
+can't run in a transaction (CREATE INDEX CONCURRENTLY). They run in
+autocommit mode and are recorded afterwards. A concurrent build that fails
+leaves an INVALID index behind, which IF NOT EXISTS would skip on the next
+run, so the runner stops if an index the file creates is invalid.
+
+001-007 predate this runner and were applied by hand. To bring a database
+to where this runner takes over without it, run them from flask-backend/ in
+file-name order, with the usual PG* variables set:
+
+    for f in migrations/00[1-7]_*.sql; do
+        psql -v ON_ERROR_STOP=1 -f "$f" || break
+    done
+
+Not with --single-transaction: psql -f runs each statement on its own,
+which 005 and 007 (CREATE INDEX CONCURRENTLY) need. On a database migrated
+this way the first run re-runs them as no-ops and records them.
+
+A session advisory lock serializes runners, so instances that start together
+apply each migration once. Run before deploying code that depends on the
+new schema (start.sh runs it first with MIGRATE_ON_START=1).
+
+Usage:
+    python3 migrate.py            apply pending migrations
+    python3 migrate.py --status   list migrations and whether each is applied
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+
+import logs
+
+log = logs.get_logger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+NO_TRANSACTION = "-- migrate: no-transaction"
+# Arbitrary, but the same for every runner.
+LOCK_KEY = 7_362_019_044
+
+CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+    "version TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+)
+APPLIED_SQL = "SELECT version FROM schema_migrations"
+RECORD_SQL = "INSERT INTO schema_migrations (version) VALUES (%s) ON CONFLICT DO NOTHING"
+INVALID_INDEXES_SQL = (
+    "SELECT indexrelid::regclass::text FROM pg_index "
+    "WHERE NOT indisvalid AND indexrelid::regclass::text = ANY(%s)"
+)
+# Names of the indexes a no-transaction file builds.
+CREATED_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\S+)", re.IGNORECASE
+)
+
+Migration = namedtuple("Migration", "version path transactional")
+
+
+class MigrationError(Exception):
+    """Raised when a migration leaves the schema in a state the runner won't record."""
+
+
+def migration_files(directory=MIGRATIONS_DIR):
+    """Every migration in `directory`, in the order they apply."""
+    migrations = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".sql"):
+            continue
+        path = os.path.join(directory, name)
+        with open(path) as f:
+            first_line = f.readline().strip()
+        migrations.append(Migration(name[:-len(".sql")], path, first_line != NO_TRANSACTION))
+    return migrations
+
+
+def applied_versions(cur):
+    cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return set()
+    cur.execute(APPLIED_SQL)
+    return {row[0] for row in cur.fetchall()}
+
+
+def apply(cur, migration):
+    with open(migration.path) as f:
+        sql = f.read()
+    if migration.transactional:
+        cur.execute("BEGIN")
+        try:
+            cur.execute(sql)
+            cur.execute(RECORD_SQL, (migration.version,))
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        return
+    cur.execute(sql)
+    # Only this file's indexes: one left over from elsewhere isn't its doing.
+    cur.execute(INVALID_INDEXES_SQL, (CREATED_INDEX.findall(sql),))
+    invalid = [row[0] for row in cur.fetchall()]
+    if invalid:
+        raise MigrationError(
+            f"{migration.version} left invalid indexes: {', '.join(invalid)}. "
+            "Fix the cause, drop them and run again."
+        )
+    cur.execute(RECORD_SQL, (migration.version,))
+
+
+def migrate(conn, migrations=None):
+    """Applies pending migrations on an autocommit connection; returns the versions applied."""
+    migrations = migration_files() if migrations is None else migrations
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+        try:
+            cur.execute(CREATE_TABLE_SQL)
+            applied = applied_versions(cur)
+            done = []
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                started = time.monotonic()
+                apply(cur, migration)
+                done.append(migration.version)
+                log.info("Applied migration", extra={
+                    "version": migration.version, "seconds": round(time.monotonic() - started, 3)
+                })
+            return done
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+    finally:
+        cur.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations")
+    parser.add_argument("--status", action="store_true", help="list migrations instead of applying them")
+    args = parser.parse_args()
+
+    import db_pool
+
+    conn = db_pool.connect_from_env()
+    conn.autocommit = True
+    try:
+        if args.status:
+            cur = conn.cursor()
+            applied = applied_versions(cur)
+            cur.close()
+            for migration in migration_files():
+                print(f"{'applied' if migration.version in applied else 'pending':<8} {migration.version}")
+            sys.exit(0)
+        try:
+            done = migrate(conn)
+        except Exception as e:
+            log.error("Migration failed: %s", e)
+            sys.exit(1)
+        log.info("Migrations up to date", extra={"applied": len(done)})
+    finally:
+        conn.close()
@@ -0,0 +1,18 @@
+-- The tables the app started with, for a fresh database. On an existing one
+-- they are left as they are; later migrations add to them.
+CREATE TABLE IF NOT EXISTS users (
+    id            SERIAL PRIMARY KEY,
+    username      TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    email         TEXT,
+    is_verified   BOOLEAN DEFAULT FALSE,
+    created_at    TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS posters (
+    id          SERIAL PRIMARY KEY,
+    title       TEXT NOT NULL,
+    description TEXT,
+    artist      TEXT,
+    photo_url   TEXT
+);
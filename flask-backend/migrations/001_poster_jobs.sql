@@ -0,0 +1,28 @@
+-- Durable queue for asynchronous poster ingestion (see jobs.py).
+-- The uploaded image is kept in `payload` until the job succeeds, so any
+-- instance can pick the job up.
+CREATE TABLE IF NOT EXISTS poster_jobs (
+    id            BIGSERIAL PRIMARY KEY,
+    status        TEXT NOT NULL DEFAULT 'queued',   -- queued | running | succeeded | failed
+    progress      TEXT,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 5,
+    run_after     TIMESTAMPTZ NOT NULL DEFAULT now(),
+    locked_at     TIMESTAMPTZ,
+    username      TEXT,
+    title         TEXT NOT NULL,
+    description   TEXT,
+    artist        TEXT,
+    blob_name     TEXT,
+    content_type  TEXT,
+    payload       BYTEA,
+    poster_id     INTEGER,
+    error         TEXT,
+    created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at    TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Workers only ever scan claimable jobs.
+CREATE INDEX IF NOT EXISTS poster_jobs_claimable_idx
+    ON poster_jobs (run_after, id)
+    WHERE status IN ('queued', 'running');
@@ -0,0 +1,15 @@
+-- Posters whose image is being uploaded straight to the bucket through a
+-- signed URL. A row is finalized into `posters` once the object is verified.
+CREATE TABLE IF NOT EXISTS pending_posters (
+    id             BIGSERIAL PRIMARY KEY,
+    username       TEXT NOT NULL,
+    title          TEXT NOT NULL,
+    description    TEXT,
+    artist         TEXT,
+    blob_name      TEXT NOT NULL,
+    content_type   TEXT NOT NULL,
+    expected_size  BIGINT NOT NULL,
+    poster_id      INTEGER,
+    created_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_at     TIMESTAMPTZ NOT NULL
+);
@@ -0,0 +1,3 @@
+-- Resized WebP/JPEG renditions of each poster photo, written by derivatives.py:
+-- {"image/webp": [[200, "https://..."], ...], "image/jpeg": [...]}
+ALTER TABLE posters ADD COLUMN IF NOT EXISTS photo_variants JSONB;
@@ -0,0 +1,8 @@
+-- Weighted full-text document for /posters/search. Adding a stored generated
+-- column rewrites the table once; the index is built separately in 005.
+ALTER TABLE posters ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(artist, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED;
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Built concurrently so reads and writes on posters continue during the build.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS posters_search_vector_idx
+    ON posters USING GIN (search_vector);
@@ -0,0 +1,8 @@
+-- SHA-256 (hex) of a poster's original image. Uploads are stored under a
+-- name derived from it, so posters showing the same image share one object;
+-- the index is built separately in 007.
+ALTER TABLE posters ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Checksums taken while the upload was received, for the worker that stores it.
+ALTER TABLE poster_jobs ADD COLUMN IF NOT EXISTS content_hash TEXT;
+ALTER TABLE poster_jobs ADD COLUMN IF NOT EXISTS content_crc32c TEXT;
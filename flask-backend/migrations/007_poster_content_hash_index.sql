@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Finds an earlier poster with the same image, whose resized variants can be
+-- reused. Built concurrently so reads and writes on posters continue.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS posters_content_hash_idx
+    ON posters (content_hash)
+    WHERE content_hash IS NOT NULL;
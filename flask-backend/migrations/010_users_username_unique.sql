@@ -0,0 +1,8 @@
+-- migrate: no-transaction
+-- Login, profile and password lookups go by username, and register() relies
+-- on this index for INSERT ... ON CONFLICT (username) DO NOTHING. The build
+-- fails if usernames are already duplicated; find them with
+--   SELECT username FROM users GROUP BY username HAVING count(*) > 1
+-- then drop the invalid index it leaves, resolve them and run again.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS users_username_key
+    ON users (username);
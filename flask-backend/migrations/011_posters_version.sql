@@ -0,0 +1,35 @@
+-- A version for the posters table as a whole, bumped by every statement that
+-- writes to it. GET /posters derives its ETag and Last-Modified from this row
+-- (see POSTERS_WATERMARK_SQL in app.py). The trigger runs once per statement,
+-- so a bulk import's COPY bumps it once per batch. Updating the row serializes
+-- writes to posters until they commit, which is short for every writer here.
+CREATE TABLE IF NOT EXISTS posters_version (
+    id          BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version     BIGINT NOT NULL DEFAULT 0,
+    changed_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO posters_version DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- clock_timestamp() rather than the transaction's start, and never backwards,
+-- so Last-Modified only moves forward whatever order writers commit in.
+CREATE OR REPLACE FUNCTION posters_bump_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE posters_version
+       SET version = version + 1, changed_at = greatest(changed_at, clock_timestamp());
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS posters_bump_version ON posters;
+CREATE TRIGGER posters_bump_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON posters
+    FOR EACH STATEMENT EXECUTE FUNCTION posters_bump_version();
+
+-- An earlier draft took the validators from max(id) and max(updated_at),
+-- which missed deletes. Remove what it left on databases it was applied to by
+-- hand: nothing reads updated_at, and its per-row trigger and index only
+-- slowed every write.
+DROP TRIGGER IF EXISTS posters_touch_updated_at ON posters;
+DROP FUNCTION IF EXISTS posters_touch_updated_at();
+DROP INDEX IF EXISTS posters_updated_at_idx;
+ALTER TABLE posters DROP COLUMN IF EXISTS updated_at;
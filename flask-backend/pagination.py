@@ -0,0 +1,98 @@
+import base64
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", 20))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+MAX_BATCH_IDS = int(os.environ.get("MAX_BATCH_IDS", 100))
+
+
+def encode_cursor(position):
+    """
+    Encodes a keyset position (e.g. {"id": 42}) as an opaque, URL-safe cursor.
+    """
+    raw = json.dumps(position, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_cursor(). Raises ValueError if it was tampered with.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def parse_page_args(args, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Reads ?limit= and ?cursor= from request args.
+    Returns (limit, position) where position is None for the first page.
+    """
+    raw_limit = args.get("limit")
+    if raw_limit in (None, ""):
+        limit = default
+    else:
+        try:
+            limit = int(raw_limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if limit < 1:
+            raise ValueError("limit must be at least 1")
+    limit = min(limit, maximum)
+
+    cursor = args.get("cursor")
+    position = decode_cursor(cursor) if cursor else None
+    return limit, position
+
+
+def cursor_id(position):
+    """Extracts the last-seen id from a decoded cursor, validating its type."""
+    if position is None:
+        return None
+    last_id = position.get("id")
+    if not isinstance(last_id, int) or isinstance(last_id, bool) or not 0 <= last_id < 2 ** 63:
+        raise ValueError("Invalid cursor")
+    return last_id
+
+
+def cursor_rank(position):
+    """Extracts (rank, last_id) from a decoded search cursor, validating types."""
+    if position is None:
+        return None
+    rank = position.get("rank")
+    last_id = cursor_id(position)
+    if not isinstance(rank, (int, float)) or isinstance(rank, bool):
+        raise ValueError("Invalid cursor")
+    return float(rank), last_id
+
+
+def parse_ids(args, maximum=MAX_BATCH_IDS):
+    """
+    Reads ?ids=1,2,3 (or repeated ?ids=) from request args. Returns the ids
+    in request order with duplicates dropped.
+    """
+    ids = []
+    for value in args.getlist("ids"):
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                item = int(part)
+            except ValueError:
+                raise ValueError("ids must be integers")
+            if not 1 <= item < 2 ** 63:
+                raise ValueError("ids must be positive 64-bit integers")
+            ids.append(item)
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError("ids is required")
+    if len(ids) > maximum:
+        raise ValueError(f"At most {maximum} ids per request")
+    return ids
@@ -0,0 +1,84 @@
+import json
+import os
+from datetime import date
+from decimal import Decimal
+
+from flask import current_app
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+# "orjson" (default when installed) or "json".
+BACKEND = os.environ.get("JSON_BACKEND", "orjson" if orjson else "json")
+if BACKEND == "orjson" and orjson is None:
+    raise RuntimeError("JSON_BACKEND=orjson but orjson is not installed")
+
+
+def _default(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """
+    Serializes to compact JSON bytes; dates and datetimes become ISO 8601
+    strings, Decimals strings with their exact digits.
+    """
+    if BACKEND == "orjson":
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+def loads(data):
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """
+    Used by jsonify(). Encodes with orjson when that is the backend, and with
+    the stdlib for what orjson rejects (ints past 64 bits, non-string keys) and
+    for indented output. Flask's default renders datetimes as RFC 822 HTTP
+    dates; the API has always sent ISO 8601. Decimals (NUMERIC columns) are
+    sent as strings, as dumps() does, rather than rounded through a float.
+    """
+
+    def encode(self, o):
+        if BACKEND == "orjson" and self.indent is None:
+            try:
+                option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+                return orjson.dumps(o, default=self.default, option=option).decode()
+            except TypeError:
+                pass
+        return super().encode(o)
+
+    def default(self, o):
+        if isinstance(o, (date, Decimal)):
+            return _default(o)
+        return super().default(o)
+
+
+def json_response(body, status=200):
+    """A response for an already-serialized JSON body (or any object, via dumps())."""
+    if not isinstance(body, (bytes, bytearray)):
+        body = dumps(body)
+    return current_app.response_class(body, status=status, mimetype="application/json")
+
+
+def json_page(name, fragments, next_cursor):
+    """
+    Assembles {"<name>": [...], "next_cursor": ...} from rows Postgres already
+    rendered as JSON text (json_build_object(...)::text), without decoding them.
+    """
+    return b"".join((
+        b'{"', name.encode(), b'":[',
+        ",".join(fragments).encode(),
+        b'],"next_cursor":', dumps(next_cursor), b"}",
+    ))
@@ -10,6 +10,10 @@ export JWT_SECRET_KEY="your-secret-key"
 export POSTER_BUCKET_NAME="poster-app-photos-137340833578"
 export PORT=8080
 
+# Database connection pool sizing (per process)
+export DB_POOL_MIN=1
+export DB_POOL_MAX=6
+
 # Optionally, print the environment variables for verification
 echo "DB_HOST: $DB_HOST"
 echo "DB_NAME: $DB_NAME"
@@ -18,6 +22,23 @@ echo "JWT_SECRET_KEY: $JWT_SECRET_KEY"
 echo "POSTER_BUCKET_NAME: $POSTER_BUCKET_NAME"
 echo "PORT: $PORT"
 
-# Start the Flask app
-python3 app.py
+# Apply pending schema migrations first when asked (see migrate.py). Off by
+# default: with several instances, prefer running it once per deploy.
+if [ "$MIGRATE_ON_START" = "1" ]; then
+    python3 migrate.py || exit 1
+fi
+
+# Start the app: gunicorn by default, the async variant (asgi.py) under uvicorn with
+# SERVER_MODE=asgi, or the Flask development server with SERVER_MODE=dev.
+# exec so SIGTERM from Cloud Run reaches the server and in-flight requests drain.
+if [ "$SERVER_MODE" = "dev" ]; then
+    exec python3 app.py
+fi
+if [ "$SERVER_MODE" = "asgi" ]; then
+    # Exported so hashing.py sizes its pool for the same number of workers.
+    export WEB_CONCURRENCY="${WEB_CONCURRENCY:-1}"
+    exec uvicorn asgi:app --host 0.0.0.0 --port "$PORT" --workers "$WEB_CONCURRENCY" \
+        --timeout-graceful-shutdown 8
+fi
+exec gunicorn -c gunicorn.conf.py app:app
  
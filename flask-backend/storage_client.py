@@ -0,0 +1,326 @@
+import base64
+import datetime
+import hashlib
+import io
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+import threading
+import time
+
+import google_crc32c
+
+import logs
+import metrics
+
+# google-cloud-storage sends objects up to this size as a single multipart
+# request; anything larger (or of unknown size) goes through a resumable
+# upload in chunks of UPLOAD_CHUNK_SIZE, which must be a multiple of 256 KiB.
+_MAX_MULTIPART_SIZE = 8 * 1024 * 1024
+_CHUNK_MULTIPLE = 256 * 1024
+UPLOAD_CHUNK_SIZE = int(os.environ.get("GCS_UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+HTTP_POOL_SIZE = int(os.environ.get("GCS_HTTP_POOL_SIZE", 16))
+# Uploads are read and hashed in chunks of this size.
+HASH_CHUNK_SIZE = 1024 * 1024
+# Set to a URL such as http://localhost:4443 to talk to a fake GCS server.
+EMULATOR_HOST = os.environ.get("STORAGE_EMULATOR_HOST")
+# Service-account JSON key used to sign URLs locally. Without it, URLs are
+# signed through the IAM signBlob API with the runtime service account.
+SIGNING_KEY_FILE = os.environ.get("GCS_SIGNING_KEY_FILE")
+
+log = logs.get_logger(__name__)
+
+_client = None
+_client_lock = threading.Lock()
+_signing_credentials = None
+
+_stats_lock = threading.Lock()
+_stats = {
+    "uploads": 0,
+    "uploads_skipped": 0,
+    "upload_errors": 0,
+    "resumable_uploads": 0,
+    "bytes_uploaded": 0,
+    "client_init_seconds": 0.0,
+    "upload_seconds_total": 0.0,
+    "upload_seconds_max": 0.0,
+}
+
+
+def _round_chunk_size(size):
+    return max(_CHUNK_MULTIPLE, (size // _CHUNK_MULTIPLE) * _CHUNK_MULTIPLE)
+
+
+def _mount_pool(session):
+    import requests
+
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=3
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _build_client():
+    # google-cloud-storage pulls in google-auth, api_core, protobuf and
+    # requests, a good share of the app's import time, so it's imported here,
+    # with the first client, rather than at startup.
+    import google.auth
+    import requests
+    from google.auth.transport.requests import AuthorizedSession
+    from google.cloud import storage
+
+    if EMULATOR_HOST:
+        from google.auth.credentials import AnonymousCredentials
+        session = _mount_pool(requests.Session())
+        return storage.Client(
+            project=os.environ.get("GCS_PROJECT", "test"),
+            credentials=AnonymousCredentials(),
+            client_options={"api_endpoint": EMULATOR_HOST},
+            _http=session,
+        )
+    # Discover credentials once and share one pooled, authorized HTTP session.
+    credentials, project = google.auth.default(scopes=storage.Client.SCOPE)
+    return storage.Client(
+        project=project,
+        credentials=credentials,
+        _http=_mount_pool(AuthorizedSession(credentials)),
+    )
+
+
+def get_storage_client():
+    """Returns the process-wide storage client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                started = time.monotonic()
+                _client = _build_client()
+                with _stats_lock:
+                    _stats["client_init_seconds"] = time.monotonic() - started
+    return _client
+
+
+def _file_size(file_obj):
+    try:
+        pos = file_obj.tell()
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(pos)
+        return size
+    except (AttributeError, OSError):
+        return None
+
+
+def upload_stream(file_obj, bucket_name, blob_name, content_type=None, chunk_size=None, crc32c=None):
+    """
+    Streams `file_obj` from its start into gs://bucket_name/blob_name. With
+    `crc32c` (see hash_stream()), GCS rejects the upload if the bytes it
+    received don't match.
+
+    Objects are expected to be publicly readable through a bucket-level IAM
+    binding (see grant_public_read), so no per-object ACL call is made.
+    Returns (public_url, timings) where timings holds per-phase seconds.
+    """
+    timings = {}
+    started = time.monotonic()
+
+    client = get_storage_client()
+    timings["client"] = time.monotonic() - started
+
+    phase = time.monotonic()
+    file_obj.seek(0)
+    size = _file_size(file_obj)
+    chunk_size = _round_chunk_size(chunk_size or UPLOAD_CHUNK_SIZE)
+    blob = client.bucket(bucket_name).blob(blob_name)
+    blob.chunk_size = chunk_size
+    if crc32c:
+        blob.crc32c = crc32c
+    resumable = size is None or size > _MAX_MULTIPART_SIZE
+    timings["prepare"] = time.monotonic() - phase
+
+    kind = "resumable" if resumable else "multipart"
+    phase = time.monotonic()
+    try:
+        blob.upload_from_file(file_obj, content_type=content_type, size=size)
+    except Exception:
+        record_upload_error()
+        metrics.GCS_UPLOAD_ERRORS.inc(kind)
+        raise
+    timings["upload"] = time.monotonic() - phase
+    timings["total"] = time.monotonic() - started
+    metrics.GCS_UPLOAD_LATENCY.observe(timings["upload"], kind)
+    metrics.GCS_UPLOAD_BYTES.inc(kind, amount=size or 0)
+    record_upload(size, timings["upload"], resumable)
+    return blob.public_url, timings
+
+
+# ---------------- Content addressing -----------------
+
+def _crc32c_b64(value):
+    # GCS reports crc32c as the base64 of the big-endian 32-bit value.
+    return base64.b64encode(value.to_bytes(4, "big")).decode()
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE, max_bytes=None):
+    """
+    Reads a seekable `stream` to the end, hashing each chunk as it arrives,
+    then rewinds it to where it started so the data can be sent on from the
+    stream instead of being held in memory. Returns (size, sha256 hex digest,
+    crc32c in GCS's base64 form). Raises ValueError past `max_bytes`, before
+    reading anything when the size is known up front.
+    """
+    start = stream.tell()
+    size = _file_size(stream)
+    if size is not None and max_bytes is not None and size - start > max_bytes:
+        raise ValueError(f"Upload exceeds the {max_bytes} byte limit")
+    sha256 = hashlib.sha256()
+    crc32c = 0
+    read = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        read += len(chunk)
+        if max_bytes is not None and read > max_bytes:
+            raise ValueError(f"Upload exceeds the {max_bytes} byte limit")
+        sha256.update(chunk)
+        crc32c = google_crc32c.extend(crc32c, chunk)
+    stream.seek(start)
+    return read, sha256.hexdigest(), _crc32c_b64(crc32c)
+
+
+def checksums(data):
+    """(sha256 hex digest, crc32c) of bytes already in memory."""
+    return hashlib.sha256(data).hexdigest(), _crc32c_b64(google_crc32c.value(data))
+
+
+def content_blob_name(sha256, content_type, filename=None):
+    """
+    Object name derived from the content, so every upload of the same image
+    shares one object (and one CDN cache entry).
+    """
+    ext = mimetypes.guess_extension(content_type or "") or posixpath.splitext(filename or "")[1]
+    return sha256 + re.sub(r"[^a-z0-9.]", "", ext.lower())
+
+
+def upload_if_missing(data, bucket_name, blob_name, content_type, crc32c):
+    """
+    Uploads `data` to a content-derived name unless an object with the same
+    crc32c is already stored there. Returns (public_url, uploaded).
+    """
+    existing = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+    if existing is not None and existing.crc32c == crc32c:
+        record_upload_skipped()
+        metrics.GCS_UPLOADS_SKIPPED.inc()
+        return existing.public_url, False
+    url, _ = upload_stream(io.BytesIO(data), bucket_name, blob_name, content_type=content_type, crc32c=crc32c)
+    return url, True
+
+
+def _get_signing_credentials():
+    global _signing_credentials
+    if _signing_credentials is None and SIGNING_KEY_FILE:
+        from google.oauth2 import service_account
+        _signing_credentials = service_account.Credentials.from_service_account_file(SIGNING_KEY_FILE)
+    return _signing_credentials
+
+
+def generate_upload_url(bucket_name, blob_name, content_type, size, expires_in=900):
+    """
+    Returns (url, headers) for a V4 signed PUT of exactly `size` bytes of
+    `content_type`. The client must send `headers` with the upload.
+    """
+    client = get_storage_client()
+    blob = client.bucket(bucket_name).blob(blob_name)
+    headers = {"x-goog-content-length-range": f"{size},{size}"}
+    kwargs = {}
+    credentials = _get_signing_credentials()
+    if credentials is not None:
+        kwargs["credentials"] = credentials
+    elif not hasattr(client._credentials, "sign_bytes"):
+        # Runtime credentials (e.g. Cloud Run metadata server) cannot sign
+        # locally; hand the signing to IAM instead.
+        import google.auth.transport.requests
+        client._credentials.refresh(google.auth.transport.requests.Request())
+        kwargs["service_account_email"] = client._credentials.service_account_email
+        kwargs["access_token"] = client._credentials.token
+    if EMULATOR_HOST:
+        kwargs["api_access_endpoint"] = EMULATOR_HOST
+    url = blob.generate_signed_url(
+        version="v4",
+        expiration=datetime.timedelta(seconds=expires_in),
+        method="PUT",
+        content_type=content_type,
+        headers=headers,
+        **kwargs,
+    )
+    return url, dict(headers, **{"Content-Type": content_type})
+
+
+def get_blob_metadata(bucket_name, blob_name):
+    """Returns {"size", "content_type", "crc32c", "public_url"} for an object, or None if it doesn't exist."""
+    blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+    if blob is None:
+        return None
+    return {"size": blob.size, "content_type": blob.content_type, "crc32c": blob.crc32c, "public_url": blob.public_url}
+
+
+def download_blob(bucket_name, blob_name):
+    """Returns an object's bytes."""
+    return get_storage_client().bucket(bucket_name).blob(blob_name).download_as_bytes()
+
+
+def storage_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+# The async server (asgi.py) uploads through its own client and counts here
+# too, so /debug-storage reads the same on both.
+
+def record_upload(size, seconds, resumable=False):
+    with _stats_lock:
+        _stats["uploads"] += 1
+        _stats["resumable_uploads"] += int(resumable)
+        _stats["bytes_uploaded"] += size or 0
+        _stats["upload_seconds_total"] += seconds
+        _stats["upload_seconds_max"] = max(_stats["upload_seconds_max"], seconds)
+
+
+def record_upload_error():
+    with _stats_lock:
+        _stats["upload_errors"] += 1
+
+
+def record_upload_skipped():
+    with _stats_lock:
+        _stats["uploads_skipped"] += 1
+
+
+def grant_public_read(bucket_name):
+    """
+    One-off setup: lets allUsers read every object in the bucket, replacing
+    the per-object make_public() call that used to follow each upload.
+    """
+    bucket = get_storage_client().bucket(bucket_name)
+    policy = bucket.get_iam_policy(requested_policy_version=3)
+    for binding in policy.bindings:
+        if binding["role"] == "roles/storage.objectViewer" and "allUsers" in binding["members"]:
+            return False
+    policy.bindings.append({"role": "roles/storage.objectViewer", "members": {"allUsers"}})
+    bucket.set_iam_policy(policy)
+    return True
+
+
+if __name__ == "__main__":
+    # Usage: python3 storage_client.py grant-public-read <bucket>
+    if len(sys.argv) != 3 or sys.argv[1] != "grant-public-read":
+        log.error("Usage: python3 storage_client.py grant-public-read <bucket>")
+        sys.exit(2)
+    changed = grant_public_read(sys.argv[2])
+    log.info("Granted public read on bucket" if changed else "Bucket is already publicly readable",
+             extra={"bucket": sys.argv[2]})
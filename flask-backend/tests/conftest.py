@@ -0,0 +1,8 @@
+# pip install -r requirements-dev.txt && python -m pytest tests
+# The migration tests that need PostgreSQL run when the DB_* variables are set
+# (as for the app) and are skipped otherwise.
+import os
+import sys
+
+# The app is a flat set of modules next to this directory, not a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
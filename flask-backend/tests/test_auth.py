@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token
+
+import auth
+import cache
+from auth import AuthError, verify_header, verify_token
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "test-secret-" + "x" * 32
+    JWTManager(app)
+    auth.token_cache.clear()
+    with app.app_context():
+        yield app
+    auth.token_cache.clear()
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Counts the signature checks verify_token() makes."""
+    calls = []
+    decode = auth.decode_token
+
+    def counting(token):
+        calls.append(token)
+        return decode(token)
+
+    monkeypatch.setattr(auth, "decode_token", counting)
+    return calls
+
+
+def test_verified_tokens_are_cached(app, decodes):
+    token = auth.issue_token("alice", 7)
+    claims = verify_token(token)
+    assert claims["sub"] == "alice" and claims["uid"] == 7
+    assert verify_token(token) == claims
+    assert len(decodes) == 1
+
+
+def test_cache_entry_ends_at_exp(app, decodes, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    token = create_access_token("alice", expires_delta=timedelta(seconds=30))
+    verify_token(token)
+    now[0] += 29
+    verify_token(token)
+    assert len(decodes) == 1
+    now[0] += 2
+    # Past exp the cache no longer vouches for the token; the signature check
+    # runs again (and, with a real clock, would reject it).
+    verify_token(token)
+    assert len(decodes) == 2
+
+
+def test_expired_token(app):
+    token = create_access_token("alice", expires_delta=timedelta(seconds=-1))
+    with pytest.raises(AuthError) as exc:
+        verify_token(token)
+    assert (exc.value.status, exc.value.message) == (401, "Token has expired")
+    assert auth.token_cache.stats()["size"] == 0
+
+
+def test_refresh_tokens_are_refused(app):
+    with pytest.raises(AuthError) as exc:
+        verify_token(create_refresh_token("alice"))
+    assert exc.value.status == 422
+
+
+def test_bad_signature(app):
+    token = auth.issue_token("alice", 7)
+    head, payload, signature = token.split(".")
+    forged = ".".join([head, payload, signature[::-1]])
+    with pytest.raises(AuthError) as exc:
+        verify_token(forged)
+    assert exc.value.status == 422
+    with pytest.raises(AuthError):
+        verify_token("not-a-jwt")
+
+
+@pytest.mark.parametrize("header, status", [
+    (None, 401),
+    ("", 401),
+    ("Token abc", 422),
+    ("Bearer", 422),
+    ("Bearer a b", 422),
+])
+def test_verify_header_rejects(app, header, status):
+    with pytest.raises(AuthError) as exc:
+        verify_header(header)
+    assert exc.value.status == status
+
+
+def test_verify_header(app):
+    assert verify_header("Bearer " + auth.issue_token("alice", 7))["sub"] == "alice"
@@ -0,0 +1,55 @@
+import codecs
+import io
+
+import pytest
+
+from bulk_import import read_rows
+
+
+def rows(data, import_format):
+    return list(read_rows(io.BytesIO(data), import_format))
+
+
+def errors(result):
+    return {row_no: str(record) for row_no, record in result if isinstance(record, Exception)}
+
+
+def test_ndjson():
+    result = rows(b'{"title": "a"}\n\n{"title": "b"}\n', "ndjson")
+    assert result == [(1, {"title": "a"}), (2, {"title": "b"})]
+
+
+def test_ndjson_bad_rows_fail_on_their_own():
+    data = b'{"title": "a"}\n{"title": "\xff"}\n{not json\n{"title": "d"}\n'
+    result = rows(data, "ndjson")
+    assert errors(result) == {2: "Row is not valid UTF-8", 3: "Invalid JSON"}
+    assert result[0] == (1, {"title": "a"}) and result[3] == (4, {"title": "d"})
+
+
+def test_csv_strips_the_bom():
+    result = rows(codecs.BOM_UTF8 + b"title,artist\nDune,Struzan\n", "csv")
+    assert result == [(1, {"title": "Dune", "artist": "Struzan"})]
+
+
+def test_csv_bad_utf8_row_is_reported():
+    result = rows(b"title,artist\na,x\nb\xe9,y\nc,z\n", "csv")
+    assert errors(result) == {2: "Row is not valid UTF-8"}
+    assert [record["title"] for _, record in result if isinstance(record, dict)] == ["a", "c"]
+
+
+def test_csv_malformed_row_is_reported():
+    huge = b'"' + b"x" * 200_000 + b'"'
+    result = rows(b"title,artist\na,x\n" + huge + b",y\nc,z\n", "csv")
+    assert list(errors(result)) == [2]
+    assert errors(result)[2].startswith("Invalid CSV")
+    assert result[-1][1] == {"title": "c", "artist": "z"}
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"", "header row"),
+    (b"name,artist\na,b\n", "header row"),
+    (b"title,art\xffist\na,b\n", "not valid UTF-8"),
+])
+def test_csv_header_problems(data, message):
+    with pytest.raises(ValueError, match=message):
+        read_rows(io.BytesIO(data), "csv")
@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+
+def test_get_or_load_caches_until_ttl(clock):
+    c = TTLCache(ttl=10)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls)
+
+    assert c.get_or_load("k", loader) == 1
+    clock.now += 9.9
+    assert c.get_or_load("k", loader) == 1
+    clock.now += 0.1
+    assert c.get_or_load("k", loader) == 2
+    assert c.stats()["expirations"] == 1
+
+
+def test_lru_eviction(clock):
+    c = TTLCache(maxsize=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.get_many(["a", "b", "c"]) == {"a": 1, "c": 3}
+    assert c.stats()["evictions"] == 1
+
+
+def test_invalidate(clock):
+    c = TTLCache()
+    c.set("a", 1)
+    c.set("b", 2)
+    c.invalidate("a")
+    assert c.get("a") is None
+    assert c.get("b") == 2
+    assert c.get_or_load("a", lambda: 10) == 10
+
+
+def test_invalidate_where(clock):
+    c = TTLCache()
+    for key in [("posters", 1), ("posters", 2), ("search", 1)]:
+        c.set(key, key)
+    c.invalidate_where(lambda key: key[0] == "posters")
+    assert c.get_many([("posters", 1), ("posters", 2), ("search", 1)]) == {("search", 1): ("search", 1)}
+
+
+def test_load_racing_an_invalidation_is_not_cached(clock):
+    c = TTLCache()
+
+    def loader():
+        c.invalidate("k")  # lands while the old value is being computed
+        return "stale"
+
+    assert c.get_or_load("k", loader) == "stale"
+    assert c.get("k") is None
+    assert c.get_or_load("k", lambda: "fresh") == "fresh"
+    assert c.get("k") == "fresh"
+
+
+def test_loader_errors_propagate_and_are_not_cached(clock):
+    c = TTLCache()
+
+    def loader():
+        raise RuntimeError("db down")
+
+    with pytest.raises(RuntimeError):
+        c.get_or_load("k", loader)
+    assert c.get_or_load("k", lambda: 1) == 1
+    assert c.stats()["load_errors"] == 1
+
+
+def test_concurrent_misses_collapse_into_one_load():
+    c = TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "v"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(c.get_or_load("k", loader)))
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(c.get_or_load("k", loader))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    while c.stats()["collapsed"] < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in [leader] + followers:
+        t.join(5)
+    assert results == ["v"] * 5
+    assert len(calls) == 1
+
+
+def test_set_with_a_stale_generation_is_dropped(clock):
+    c = TTLCache()
+    generation = c.generation
+    c.invalidate_where(lambda key: True)  # lands while the value is loading
+    c.set("k", "stale", generation=generation)
+    assert c.get("k") is None
+    c.set("k", "fresh", generation=c.generation)
+    assert c.get("k") == "fresh"
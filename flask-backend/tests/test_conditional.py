@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, timezone
+
+from werkzeug.http import http_date
+
+from conditional import etag_for, not_modified, watermark_validators
+
+ETAG = etag_for("posters", 7)
+CHANGED = datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+
+
+def test_etags_are_weak_and_stable():
+    assert ETAG.startswith('W/"')
+    assert etag_for("posters", 7) == ETAG
+    assert etag_for("posters", 8) != ETAG
+    assert etag_for(b"posters", b"7") == ETAG
+
+
+def test_if_none_match():
+    assert not_modified({"If-None-Match": ETAG}, ETAG)
+    # Weak comparison: the strong form of the same tag matches too.
+    assert not_modified({"If-None-Match": ETAG[2:]}, ETAG)
+    assert not_modified({"If-None-Match": f'W/"other", {ETAG}'}, ETAG)
+    assert not_modified({"If-None-Match": "*"}, ETAG)
+    assert not not_modified({"If-None-Match": etag_for("posters", 8)}, ETAG)
+
+
+def test_if_modified_since():
+    assert not_modified({"If-Modified-Since": http_date(CHANGED)}, ETAG, CHANGED)
+    assert not_modified({"If-Modified-Since": http_date(CHANGED + timedelta(hours=1))}, ETAG, CHANGED)
+    assert not not_modified({"If-Modified-Since": http_date(CHANGED - timedelta(seconds=1))}, ETAG, CHANGED)
+
+
+def test_if_modified_since_needs_a_date_on_both_sides():
+    assert not not_modified({}, ETAG, CHANGED)
+    assert not not_modified({"If-Modified-Since": "yesterday"}, ETAG, CHANGED)
+    assert not not_modified({"If-Modified-Since": http_date(CHANGED)}, ETAG, None)
+
+
+def test_if_none_match_takes_precedence():
+    headers = {"If-None-Match": etag_for("posters", 8), "If-Modified-Since": http_date(CHANGED)}
+    assert not not_modified(headers, ETAG, CHANGED)
+    headers = {"If-None-Match": ETAG, "If-Modified-Since": http_date(CHANGED - timedelta(days=1))}
+    assert not_modified(headers, ETAG, CHANGED)
+
+
+def test_watermark_validators():
+    etag, last_modified = watermark_validators(7, CHANGED)
+    assert last_modified == CHANGED
+    assert watermark_validators(8, CHANGED)[0] != etag
+    # The same instant seen from a session in another time zone.
+    elsewhere = CHANGED.astimezone(timezone(timedelta(hours=-5)))
+    assert watermark_validators(7, elsewhere)[0] == etag
+    assert watermark_validators(7, None)[1] is None
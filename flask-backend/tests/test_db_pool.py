@@ -0,0 +1,185 @@
+import threading
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import ConnectionPool, PoolError, PoolTimeout
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool."""
+
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = 0
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_INTRANS if self.in_transaction else extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql):
+        if not self.conn.alive:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class Connector:
+    def __init__(self):
+        self.made = []
+        self.fail = False
+
+    def __call__(self):
+        if self.fail:
+            raise psycopg2.OperationalError("could not connect")
+        conn = FakeConnection()
+        self.made.append(conn)
+        return conn
+
+
+@pytest.fixture
+def connect():
+    return Connector()
+
+
+def test_checkout_reuses_idle_connections(connect):
+    pool = ConnectionPool(connect, minconn=1, maxconn=2)
+    assert len(connect.made) == 1
+    conn = pool.getconn()
+    assert conn is connect.made[0]
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_invalid_sizes_are_rejected(connect):
+    with pytest.raises(ValueError):
+        ConnectionPool(connect, minconn=3, maxconn=2)
+
+
+def test_recycles_after_max_uses(connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, max_uses=2)
+    first = pool.getconn()
+    pool.putconn(first)
+    assert pool.getconn() is first
+    pool.putconn(first)
+    assert first.closed
+    second = pool.getconn()
+    assert second is not first
+    assert pool.stats()["recycled"] == 1
+
+
+def test_recycles_after_max_lifetime(connect, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db_pool.time, "monotonic", lambda: now[0])
+    pool = ConnectionPool(connect, minconn=1, maxconn=1, max_lifetime=60)
+    now[0] += 61
+    conn = pool.getconn()
+    assert conn is connect.made[1]
+    assert connect.made[0].closed
+    assert pool.stats()["size"] == 1
+
+
+def test_dead_idle_connection_is_replaced(connect):
+    pool = ConnectionPool(connect, minconn=1, maxconn=1, check_idle_after=0)
+    connect.made[0].alive = False
+    conn = pool.getconn()
+    assert conn is connect.made[1]
+    assert pool.stats()["failed_health_checks"] == 1
+
+
+def test_return_rolls_back_an_open_transaction(connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1)
+    conn = pool.getconn()
+    conn.in_transaction = True
+    pool.putconn(conn)
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+
+def test_connection_discards_on_database_errors(connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("terminating connection")
+    assert conn.closed
+    assert pool.stats()["size"] == 0
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            raise ValueError("not the connection's fault")
+    assert not conn.closed
+    assert pool.stats()["idle"] == 1
+
+
+def test_saturated_pool_times_out(connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, timeout=0.05)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert stats["timeouts"] == 1 and stats["waits"] == 1 and stats["in_use"] == 1
+
+
+def test_waiter_gets_the_returned_connection(connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, timeout=5)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    while pool.stats()["waits"] == 0:
+        threading.Event().wait(0.01)
+    pool.putconn(conn)
+    waiter.join(5)
+    assert got == [conn]
+    assert len(connect.made) == 1
+
+
+def test_failed_connect_frees_the_slot(connect):
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, timeout=0.05)
+    connect.fail = True
+    with pytest.raises(PoolError, match="could not connect"):
+        pool.getconn()
+    connect.fail = False
+    assert pool.getconn() is connect.made[0]
+
+
+def test_child_process_never_uses_the_parents_connections(connect, monkeypatch):
+    pool = ConnectionPool(connect, minconn=1, maxconn=1)
+    parents = pool.getconn()
+    pool.putconn(parents)
+    monkeypatch.setattr(db_pool.os, "getpid", lambda: pool._pid + 1)
+    conn = pool.getconn()
+    assert conn is not parents
+    # Left open: closing it would end the parent's session too.
+    assert not parents.closed
+    assert pool.stats()["size"] == 1
+
+
+def test_closed_pool_refuses_checkouts(connect):
+    pool = ConnectionPool(connect, minconn=1, maxconn=1)
+    pool.closeall()
+    assert connect.made[0].closed
+    with pytest.raises(PoolError, match="closed"):
+        pool.getconn()
@@ -0,0 +1,194 @@
+import os
+import threading
+import uuid
+
+import pytest
+
+import migrate
+from migrate import LOCK_KEY, MigrationError, migration_files
+
+
+class FakeCursor:
+    """Records statements and answers the runner's own queries."""
+
+    def __init__(self, applied=(), invalid=(), fail_on=None):
+        self.applied = list(applied)
+        self.invalid = list(invalid)
+        self.fail_on = fail_on
+        self.statements = []
+        self.closed = False
+        self._result = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+        if self.fail_on is not None and self.fail_on in sql:
+            raise RuntimeError("migration failed")
+        if "to_regclass" in sql:
+            self._result = [(True,)]
+        elif sql == migrate.APPLIED_SQL:
+            self._result = [(v,) for v in self.applied]
+        elif sql == migrate.INVALID_INDEXES_SQL:
+            self._result = [(name,) for name in self.invalid if name in params[0]]
+        else:
+            self._result = []
+
+    def fetchone(self):
+        return self._result[0]
+
+    def fetchall(self):
+        return self._result
+
+    def close(self):
+        self.closed = True
+
+    def sql(self):
+        return [sql for sql, _ in self.statements]
+
+    def recorded(self):
+        return [params[0] for sql, params in self.statements if sql == migrate.RECORD_SQL]
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+
+@pytest.fixture
+def migrations_dir(tmp_path):
+    files = {
+        "002_second.sql": "CREATE TABLE second (id INT);",
+        "010_index.sql": f"{migrate.NO_TRANSACTION}\nCREATE INDEX CONCURRENTLY IF NOT EXISTS second_id_idx ON second (id);",
+        "001_first.sql": "CREATE TABLE first (id INT);",
+        "README.md": "not a migration",
+    }
+    for name, sql in files.items():
+        (tmp_path / name).write_text(sql)
+    return tmp_path
+
+
+def test_migration_files_are_ordered_by_name(migrations_dir):
+    migrations = migration_files(str(migrations_dir))
+    assert [m.version for m in migrations] == ["001_first", "002_second", "010_index"]
+    assert [m.transactional for m in migrations] == [True, True, False]
+
+
+def test_shipped_migrations_have_unique_numbers():
+    versions = [m.version for m in migration_files()]
+    assert versions[0].startswith("000_")
+    numbers = [v.split("_", 1)[0] for v in versions]
+    assert len(set(numbers)) == len(numbers)
+
+
+def test_applies_pending_in_order_under_the_lock(migrations_dir):
+    cur = FakeCursor(applied=["002_second"])
+    done = migrate.migrate(FakeConnection(cur), migration_files(str(migrations_dir)))
+    assert done == ["001_first", "010_index"]
+    assert cur.recorded() == ["001_first", "010_index"]
+    assert cur.statements[0] == ("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+    assert cur.statements[-1] == ("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+    assert cur.closed
+    sql = cur.sql()
+    assert "CREATE TABLE second (id INT);" not in sql
+    # The transactional file runs between BEGIN and COMMIT with its record; the
+    # concurrent index build runs on its own.
+    first = sql.index("CREATE TABLE first (id INT);")
+    assert sql[first - 1] == "BEGIN" and sql[first + 1] == migrate.RECORD_SQL and sql[first + 2] == "COMMIT"
+    index = next(i for i, s in enumerate(sql) if "CONCURRENTLY" in s)
+    assert sql[index - 1] != "BEGIN"
+    assert sql[index + 1] == migrate.INVALID_INDEXES_SQL
+
+
+def test_failure_rolls_back_and_releases_the_lock(migrations_dir):
+    cur = FakeCursor(fail_on="CREATE TABLE second")
+    with pytest.raises(RuntimeError):
+        migrate.migrate(FakeConnection(cur), migration_files(str(migrations_dir)))
+    assert cur.recorded() == ["001_first"]
+    sql = cur.sql()
+    assert sql[-2:] == ["ROLLBACK", "SELECT pg_advisory_unlock(%s)"]
+    assert not any("CONCURRENTLY" in s for s in sql)
+
+
+def test_invalid_index_is_not_recorded(migrations_dir):
+    cur = FakeCursor(applied=["001_first", "002_second"], invalid=["second_id_idx", "unrelated_idx"])
+    with pytest.raises(MigrationError, match="second_id_idx") as exc:
+        migrate.migrate(FakeConnection(cur), migration_files(str(migrations_dir)))
+    assert "unrelated_idx" not in str(exc.value)
+    assert cur.recorded() == []
+    assert cur.sql()[-1] == "SELECT pg_advisory_unlock(%s)"
+
+
+def test_unrelated_invalid_index_is_ignored(migrations_dir):
+    cur = FakeCursor(applied=["001_first", "002_second"], invalid=["unrelated_idx"])
+    assert migrate.migrate(FakeConnection(cur), migration_files(str(migrations_dir))) == ["010_index"]
+
+
+# ---------------- Against PostgreSQL -----------------
+# Run with the usual DB_* variables set; skipped otherwise.
+
+@pytest.fixture
+def schema():
+    if not os.environ.get("DB_HOST"):
+        pytest.skip("DB_HOST is not set")
+    import db_pool
+
+    name = f"test_migrate_{uuid.uuid4().hex[:8]}"
+    conns = []
+
+    def connect():
+        conn = db_pool.connect_from_env()
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {name}")
+        cur.execute(f"SET search_path TO {name}")
+        cur.close()
+        conns.append(conn)
+        return conn
+
+    yield connect
+    cur = conns[0].cursor()
+    cur.execute(f"DROP SCHEMA {name} CASCADE")
+    cur.close()
+    for conn in conns:
+        conn.close()
+
+
+def test_concurrent_runners_apply_each_migration_once(schema, tmp_path):
+    # Not IF NOT EXISTS: a second application would fail. The sleep keeps the
+    # first runner inside the lock while the other one starts.
+    (tmp_path / "001_first.sql").write_text("CREATE TABLE first (id INT); SELECT pg_sleep(0.5);")
+    (tmp_path / "002_second.sql").write_text("CREATE TABLE second (id INT);")
+    migrations = migration_files(str(tmp_path))
+    conns = [schema(), schema()]
+    results, errors = [], []
+
+    def run(conn):
+        try:
+            results.append(migrate.migrate(conn, migrations))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(conn,)) for conn in conns]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    assert errors == []
+    assert sorted(results) == [[], ["001_first", "002_second"]]
+
+    cur = conns[0].cursor()
+    cur.execute("SELECT version FROM schema_migrations ORDER BY version")
+    assert [row[0] for row in cur.fetchall()] == ["001_first", "002_second"]
+    cur.close()
+
+
+def test_failed_migration_is_retried(schema, tmp_path):
+    (tmp_path / "001_first.sql").write_text("CREATE TABLE first (id INT);")
+    (tmp_path / "002_broken.sql").write_text("CREATE TABLE broken (id INT); SELECT 1 / 0;")
+    conn = schema()
+    with pytest.raises(Exception, match="division by zero"):
+        migrate.migrate(conn, migration_files(str(tmp_path)))
+    (tmp_path / "002_broken.sql").write_text("CREATE TABLE broken (id INT);")
+    assert migrate.migrate(conn, migration_files(str(tmp_path))) == ["002_broken"]
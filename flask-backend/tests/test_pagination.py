@@ -0,0 +1,75 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from pagination import cursor_id, cursor_rank, decode_cursor, encode_cursor, parse_ids, parse_page_args
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"rank": 0.5, "id": 42})
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == {"rank": 0.5, "id": 42}
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm90IGpzb24", encode_cursor([1, 2]), encode_cursor(7)])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor(cursor)
+
+
+def test_parse_page_args_defaults():
+    assert parse_page_args(MultiDict(), default=20, maximum=100) == (20, None)
+    assert parse_page_args(MultiDict({"limit": "", "cursor": ""}), default=20, maximum=100) == (20, None)
+
+
+def test_parse_page_args_clamps_limit_and_decodes_cursor():
+    args = MultiDict({"limit": "500", "cursor": encode_cursor({"id": 9})})
+    assert parse_page_args(args, default=20, maximum=100) == (100, {"id": 9})
+
+
+@pytest.mark.parametrize("limit", ["abc", "0", "-3", "1.5"])
+def test_parse_page_args_rejects_bad_limit(limit):
+    with pytest.raises(ValueError):
+        parse_page_args(MultiDict({"limit": limit}))
+
+
+def test_cursor_id():
+    assert cursor_id(None) is None
+    assert cursor_id({"id": 0}) == 0
+    assert cursor_id({"id": 42}) == 42
+    # bigserial ids past int4 are fine; the queries cast to bigint.
+    assert cursor_id({"id": 2 ** 63 - 1}) == 2 ** 63 - 1
+
+
+@pytest.mark.parametrize("position", [{}, {"id": "5"}, {"id": 5.0}, {"id": True}, {"id": -1}, {"id": 2 ** 63}])
+def test_cursor_id_rejects(position):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        cursor_id(position)
+
+
+def test_cursor_rank():
+    assert cursor_rank(None) is None
+    assert cursor_rank({"rank": 1, "id": 3}) == (1.0, 3)
+    assert isinstance(cursor_rank({"rank": 1, "id": 3})[0], float)
+
+
+@pytest.mark.parametrize("position", [{"id": 3}, {"rank": "0.1", "id": 3}, {"rank": False, "id": 3}, {"rank": 0.1}])
+def test_cursor_rank_rejects(position):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        cursor_rank(position)
+
+
+def test_parse_ids_keeps_order_and_drops_duplicates():
+    args = MultiDict([("ids", "3, 1,,3"), ("ids", "2"), ("ids", "1")])
+    assert parse_ids(args) == [3, 1, 2]
+
+
+@pytest.mark.parametrize("value, message", [
+    ("", "ids is required"),
+    ("1,x", "ids must be integers"),
+    ("0", "ids must be positive"),
+    (str(2 ** 63), "ids must be positive"),
+    ("1,2,3", "At most 2 ids"),
+])
+def test_parse_ids_rejects(value, message):
+    with pytest.raises(ValueError, match=message):
+        parse_ids(MultiDict({"ids": value}), maximum=2)
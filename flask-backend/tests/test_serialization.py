@@ -0,0 +1,82 @@
+import json
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from flask import Flask, jsonify
+
+import serialization
+from serialization import dumps, loads
+
+SAMPLE = {
+    "posters": [{
+        "id": 2 ** 40, "title": "Dune — 1984", "rank": 0.25, "photo_url": None,
+        "created_at": datetime(2024, 5, 1, 12, 30, 15, 250000),
+        "updated_at": datetime(2024, 5, 1, 12, 30, 15, tzinfo=timezone(timedelta(hours=2))),
+        "released": date(1984, 12, 14), "price": Decimal("12.50"), "tags": ["sf", "film"],
+    }],
+    "next_cursor": "eyJpZCI6MX0",
+}
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(serialization, "BACKEND", request.param)
+    return request.param
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json_encoder = serialization.JSONEncoder
+    app.config["JSONIFY_PRETTYPRINT_REGULAR"] = False
+    with app.app_context():
+        yield app
+
+
+def test_jsonify_dates_and_decimals(app, backend):
+    decoded = json.loads(jsonify(SAMPLE).get_data())
+    poster = decoded["posters"][0]
+    assert poster["created_at"] == "2024-05-01T12:30:15.250000"
+    assert poster["updated_at"] == "2024-05-01T12:30:15+02:00"
+    assert poster["released"] == "1984-12-14"
+    assert poster["price"] == "12.50"
+    assert poster["title"] == "Dune — 1984" and poster["id"] == 2 ** 40
+
+
+def test_backends_agree(app, monkeypatch):
+    outputs = set()
+    for name in ("orjson", "json"):
+        monkeypatch.setattr(serialization, "BACKEND", name)
+        outputs.add(json.dumps(json.loads(jsonify(SAMPLE).get_data())))
+    assert len(outputs) == 1
+
+
+def test_jsonify_sorts_keys(app, backend):
+    body = jsonify({"b": 1, "a": {"d": 2, "c": 3}}).get_data()
+    assert body.replace(b" ", b"").strip() == b'{"a":{"c":3,"d":2},"b":1}'
+
+
+def test_jsonify_falls_back_for_what_orjson_rejects(app, backend):
+    assert json.loads(jsonify({"big": 2 ** 70}).get_data()) == {"big": 2 ** 70}
+    app.config["JSON_SORT_KEYS"] = False
+    assert json.loads(jsonify({1: "a"}).get_data()) == {"1": "a"}
+
+
+def test_jsonify_pretty_print(app, backend):
+    app.config["JSONIFY_PRETTYPRINT_REGULAR"] = True
+    assert b'\n  "a": 1' in jsonify({"a": 1}).get_data()
+
+
+def test_unknown_types_still_fail(app, backend):
+    with pytest.raises(TypeError):
+        jsonify({"x": object()})
+
+
+def test_dumps_round_trip(backend):
+    body = dumps(SAMPLE)
+    assert isinstance(body, bytes)
+    assert b", " not in body and b'": ' not in body
+    decoded = loads(body)
+    assert decoded["posters"][0]["price"] == "12.50"
+    assert decoded["posters"][0]["created_at"] == "2024-05-01T12:30:15.250000"
@@ -0,0 +1,89 @@
+import io
+
+import pytest
+from flask import Flask, jsonify, request
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+import uploads
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(uploads.UPLOAD_LIMITS, "/posters/upload", (4096, ("image/",)))
+    monkeypatch.setitem(uploads.UPLOAD_LIMITS, "/admin/posters/import", (16384, None))
+    monkeypatch.setattr(uploads, "MAX_REQUEST_BYTES", 1024)
+    monkeypatch.setattr(uploads, "SPOOL_THRESHOLD", 1000)
+
+    app = Flask(__name__)
+    uploads.init_app(app)
+
+    @app.route("/posters/upload", methods=["POST"])
+    @app.route("/admin/posters/import", methods=["POST"])
+    def upload():
+        photo = request.files["photo"]
+        return jsonify({"size": len(photo.read()), "on_disk": photo.stream._rolled})
+
+    @app.route("/login", methods=["POST"])
+    def login():
+        return jsonify(request.get_json())
+
+    return app.test_client()
+
+
+def form(size, content_type="image/jpeg"):
+    return {"title": "t", "photo": (io.BytesIO(b"x" * size), "p.jpg", content_type)}
+
+
+def test_upload_within_the_limit(client):
+    response = client.post("/posters/upload", data=form(3000))
+    assert response.status_code == 200
+    # Past SPOOL_THRESHOLD the part went to a temporary file, not memory.
+    assert response.get_json() == {"size": 3000, "on_disk": True}
+    assert client.post("/posters/upload", data=form(500)).get_json() == {"size": 500, "on_disk": False}
+
+
+def test_limits_are_per_path(client):
+    response = client.post("/posters/upload", data=form(8000))
+    assert response.status_code == 413
+    assert response.get_json() == {"error": "Request body exceeds the 4096 byte limit"}
+    assert client.post("/admin/posters/import", data=form(8000)).status_code == 200
+
+
+def test_part_types_are_per_path(client):
+    response = client.post("/posters/upload", data=form(10, "text/plain"))
+    assert response.status_code == 415
+    assert response.get_json() == {"error": "text/plain uploads are not accepted here"}
+    assert client.post("/admin/posters/import", data=form(10, "text/plain")).status_code == 200
+
+
+def test_other_paths_get_the_default_limit(client):
+    assert client.post("/login", json={"username": "a"}).status_code == 200
+    response = client.post("/login", json={"username": "a" * 2000})
+    assert response.status_code == 413
+    assert response.get_json() == {"error": "Request body exceeds the 1024 byte limit"}
+
+
+def post_chunked(app, path, body):
+    """Posts a body without a Content-Length, as gunicorn passes a chunked one; returns (status, body)."""
+    environ = EnvironBuilder(
+        path=path, method="POST", input_stream=io.BytesIO(body), content_type="application/json"
+    ).get_environ()
+    del environ["CONTENT_LENGTH"]
+    environ["wsgi.input_terminated"] = True
+    # Straight to the app: the test client would put the Content-Length back.
+    app_iter, status, _ = run_wsgi_app(app, environ, buffered=True)
+    return int(status.split()[0]), b"".join(app_iter)
+
+
+def test_body_without_content_length_is_cut_off(client):
+    assert post_chunked(client.application, "/login", b'{"username": "a"}') == (200, b'{"username":"a"}\n')
+    status, _ = post_chunked(client.application, "/login", b'{"username": "' + b"a" * 2000 + b'"}')
+    assert status == 413
+
+
+def test_body_limit_and_accepts():
+    assert uploads.body_limit("/posters/upload") == uploads.MAX_PHOTO_BYTES + uploads.FORM_OVERHEAD_BYTES
+    assert uploads.body_limit("/anything") == uploads.MAX_REQUEST_BYTES
+    assert uploads.accepts("/posters/upload", "image/png")
+    assert not uploads.accepts("/posters/upload", None)
+    assert uploads.accepts("/admin/posters/import", "application/zip")
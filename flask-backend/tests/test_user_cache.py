@@ -0,0 +1,80 @@
+from user_cache import LocalBackend, UserCache
+
+
+class Loader:
+    """Stands in for the users query; counts how often it runs."""
+
+    def __init__(self, record):
+        self.record = record
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return dict(self.record)
+
+
+class BrokenBackend:
+    def get_many(self, keys):
+        raise ConnectionError("redis down")
+
+    def set(self, key, value, ttl):
+        raise ConnectionError("redis down")
+
+    def incr(self, key):
+        raise ConnectionError("redis down")
+
+
+def test_invalidate_without_backend_reloads():
+    users = UserCache(backend=None, local_ttl=60)
+    db = Loader({"id": 1, "name": "a"})
+    assert users.get_or_load(1, db) == {"id": 1, "name": "a"}
+    assert users.get_or_load(1, db) == {"id": 1, "name": "a"}
+    assert db.calls == 1
+    db.record["name"] = "b"
+    users.invalidate(1)
+    assert users.get_or_load(1, db) == {"id": 1, "name": "b"}
+    assert db.calls == 2
+
+
+def test_shared_backend_serves_other_processes():
+    shared = LocalBackend()
+    first, second = UserCache(backend=shared, local_ttl=60), UserCache(backend=shared, local_ttl=60)
+    db = Loader({"id": 1, "name": "a"})
+    first.get_or_load(1, db)
+    assert second.get_or_load(1, db) == {"id": 1, "name": "a"}
+    assert db.calls == 1
+    assert second.stats()["shared_hits"] == 1
+
+
+def test_invalidate_reaches_other_processes_after_local_ttl():
+    shared = LocalBackend()
+    # local_ttl=0: the other process goes back to the shared store every time,
+    # as it does once its LOCAL_TTL runs out.
+    writer, reader = UserCache(backend=shared, local_ttl=60), UserCache(backend=shared, local_ttl=0)
+    db = Loader({"id": 1, "name": "a"})
+    writer.get_or_load(1, db)
+    assert reader.get_or_load(1, db)["name"] == "a"
+
+    db.record["name"] = "b"
+    writer.invalidate(1)
+    # The shared entry carries the old generation, so both reload from the db.
+    assert reader.get_or_load(1, db)["name"] == "b"
+    assert writer.get_or_load(1, db)["name"] == "b"
+    assert db.calls == 2
+
+
+def test_missing_users_are_not_shared():
+    shared = LocalBackend()
+    users = UserCache(backend=shared, local_ttl=0)
+    assert users.get_or_load(2, lambda: None) is None
+    assert shared.get_many(["user:2"]) == [None]
+
+
+def test_backend_errors_fall_back_to_the_database():
+    users = UserCache(backend=BrokenBackend(), local_ttl=60)
+    db = Loader({"id": 1})
+    assert users.get_or_load(1, db) == {"id": 1}
+    users.invalidate(1)
+    assert users.get_or_load(1, db) == {"id": 1}
+    assert db.calls == 2
+    assert users.stats()["shared_errors"] == 3
@@ -0,0 +1,127 @@
+"""
+Request body limits and how multipart uploads are buffered while they're
+parsed; shared by app.py and asgi.py.
+
+Both servers parse multipart bodies incrementally. File parts are written to
+a SpooledTemporaryFile that stays in memory up to SPOOL_THRESHOLD bytes and
+rolls over to a temporary file in SPOOL_DIR beyond it, so a large photo or
+import archive never has to fit in memory while the request is read. Bodies
+are capped per path by body_limit(): a Content-Length over the limit is
+refused before any of the body is read, and a body without one is cut off
+once it passes the limit. accepts() says which file part types a path takes;
+the WSGI app refuses others as soon as the part's headers are parsed.
+"""
+import os
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.utils import cached_property
+from werkzeug.wsgi import get_input_stream
+
+MAX_PHOTO_BYTES = int(os.environ.get("MAX_PHOTO_BYTES", 20 * 1024 * 1024))
+MAX_IMPORT_BYTES = int(os.environ.get("MAX_IMPORT_BYTES", 512 * 1024 * 1024))
+# Every other body: JSON posts and the like.
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 1024 * 1024))
+# Room for the text fields and multipart framing around an upload's file.
+FORM_OVERHEAD_BYTES = int(os.environ.get("UPLOAD_FORM_OVERHEAD_BYTES", 64 * 1024))
+# Non-file form fields are always held in memory.
+MAX_FORM_MEMORY_BYTES = int(os.environ.get("MAX_FORM_MEMORY_BYTES", 1024 * 1024))
+
+SPOOL_THRESHOLD = int(os.environ.get("UPLOAD_SPOOL_THRESHOLD", 1024 * 1024))
+# None means the system default (TMPDIR), which is all the ASGI app's parser
+# uses. On Cloud Run that is an in-memory filesystem; point both at a mounted
+# volume to take large uploads off the instance's memory.
+SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR") or None
+
+# path -> (largest body, accepted file part content type prefixes, or None for any)
+UPLOAD_LIMITS = {
+    "/posters/upload": (MAX_PHOTO_BYTES + FORM_OVERHEAD_BYTES, ("image/",)),
+    "/admin/posters/import": (MAX_IMPORT_BYTES, None),
+}
+
+
+def body_limit(path):
+    """Largest request body accepted on `path`, in bytes."""
+    return UPLOAD_LIMITS.get(path, (MAX_REQUEST_BYTES, None))[0]
+
+
+def accepts(path, content_type):
+    """Whether a file part of `content_type` may be uploaded to `path`."""
+    types = UPLOAD_LIMITS.get(path, (None, None))[1]
+    return types is None or (content_type or "").startswith(types)
+
+
+def spool():
+    """Buffer for one file part: in memory up to SPOOL_THRESHOLD, on disk past it."""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD, mode="rb+", dir=SPOOL_DIR)
+
+
+def too_large_message(path):
+    return f"Request body exceeds the {body_limit(path)} byte limit"
+
+
+class CappedStream:
+    """A body without a Content-Length, refused once more than `limit` bytes have been read."""
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self._limit = limit
+        self._read = 0
+
+    def _count(self, data):
+        self._read += len(data)
+        if self._read > self._limit:
+            raise RequestEntityTooLarge()
+        return data
+
+    def read(self, size=-1):
+        return self._count(self._stream.read(size))
+
+    def readline(self, size=-1):
+        return self._count(self._stream.readline(size))
+
+
+class UploadRequest(Request):
+    """Flask request with per-path body limits and spooled file parts."""
+
+    max_form_memory_size = MAX_FORM_MEMORY_BYTES
+
+    @property
+    def max_content_length(self):
+        return body_limit(self.path)
+
+    @cached_property
+    def stream(self):
+        # Servers that take chunked bodies (gunicorn) hand them over unbounded.
+        stream = get_input_stream(self.environ)
+        if self.content_length is None:
+            return CappedStream(stream, self.max_content_length)
+        return stream
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Called when a file part's headers have been parsed, before its data.
+        if not accepts(self.path, content_type):
+            raise UnsupportedMediaType(f"{content_type or 'Untyped'} uploads are not accepted here")
+        return spool()
+
+
+def init_app(app):
+    """Installs UploadRequest and answers oversized or unaccepted bodies with JSON errors."""
+    from flask import jsonify, request
+
+    app.request_class = UploadRequest
+
+    @app.before_request
+    def check_content_length():
+        # Form parsing checks this too, but get_json() and friends don't.
+        if request.content_length is not None and request.content_length > request.max_content_length:
+            raise RequestEntityTooLarge()
+
+    @app.errorhandler(RequestEntityTooLarge)
+    def request_too_large(e):
+        return jsonify({"error": too_large_message(request.path)}), 413
+
+    @app.errorhandler(UnsupportedMediaType)
+    def unsupported_media_type(e):
+        return jsonify({"error": e.description}), 415
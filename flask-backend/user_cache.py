@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+
+import logs
+from cache import TTLCache
+from serialization import dumps, loads
+
+# "none" keeps user records in each process only; "redis" shares them between
+# processes and instances through USER_CACHE_REDIS_URL; "local" is an
+# in-process stand-in for the shared store, for tests and local runs (it is
+# not shared between gunicorn workers).
+BACKEND = os.environ.get("USER_CACHE_BACKEND", "none")
+REDIS_URL = os.environ.get("USER_CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Lifetime of an entry in the shared store.
+SHARED_TTL = float(os.environ.get("USER_CACHE_TTL", 300))
+# Lifetime of an entry in this process. invalidate() only clears the process
+# that made the change, so this bounds how stale a profile can be anywhere
+# else: other gunicorn workers and instances serve the old record for up to
+# this many seconds. Keep it short, with or without a shared backend.
+LOCAL_TTL = float(os.environ.get("USER_CACHE_LOCAL_TTL", 5))
+MAXSIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+
+log = logs.get_logger(__name__)
+
+
+class LocalBackend:
+    """
+    Dict-backed stand-in for the shared store with the same operations as
+    RedisBackend. Caches that share one instance behave like instances
+    sharing a Redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}   # key -> (expires_at or None, value)
+
+    def _get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= now:
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            return [self._get(key, now) for key in keys]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._get(key, time.monotonic()) or 0) + 1
+            self._data[key] = (None, str(value))
+            return value
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get_many(self, keys):
+        return [v.decode() if v is not None else None for v in self._redis.mget(keys)]
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, value, ex=max(1, int(ttl)))
+
+    def incr(self, key):
+        return self._redis.incr(key)
+
+
+def make_backend(name=BACKEND):
+    if name == "none":
+        return None
+    if name == "local":
+        return LocalBackend()
+    if name == "redis":
+        return RedisBackend(REDIS_URL)
+    raise ValueError(f"Unknown USER_CACHE_BACKEND: {name}")
+
+
+class UserCache:
+    """
+    Profile records keyed by user id: a TTLCache in front of an optional
+    shared store.
+
+    Each user has a generation counter in the shared store that invalidate()
+    bumps. Entries carry the generation they were loaded under and are
+    ignored once it moves on, so a load racing an invalidation can't publish
+    a stale record. Shared-store errors fall back to the database.
+    """
+
+    def __init__(self, backend=None, local_ttl=LOCAL_TTL, shared_ttl=SHARED_TTL, maxsize=MAXSIZE):
+        self.backend = backend
+        self.shared_ttl = shared_ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=local_ttl, name="users")
+        self._lock = threading.Lock()
+        self._stats = {"shared_hits": 0, "shared_misses": 0, "shared_errors": 0, "db_loads": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_or_load(self, user_id, loader):
+        """
+        Returns the user record, calling `loader()` (which returns the record
+        or None) only if neither the local nor the shared cache has it.
+        """
+        return self.local.get_or_load(user_id, lambda: self._load(user_id, loader))
+
+    def _load(self, user_id, loader):
+        generation = None
+        backend_ok = False
+        if self.backend is not None:
+            try:
+                raw, generation = self.backend.get_many([f"user:{user_id}", f"user:{user_id}:gen"])
+                if raw is not None:
+                    entry = loads(raw)
+                    if entry["gen"] == generation:
+                        self._count("shared_hits")
+                        return entry["user"]
+                self._count("shared_misses")
+            except Exception as e:
+                log.error("User cache backend error: %s", e)
+                self._count("shared_errors")
+            else:
+                backend_ok = True
+        self._count("db_loads")
+        user = loader()
+        if backend_ok and user is not None:
+            try:
+                self.backend.set(f"user:{user_id}", dumps({"gen": generation, "user": user}), self.shared_ttl)
+            except Exception as e:
+                log.error("User cache backend error: %s", e)
+                self._count("shared_errors")
+        return user
+
+    def invalidate(self, user_id):
+        """
+        Call after changing a user's row. Other processes see the change
+        within LOCAL_TTL seconds.
+        """
+        self.local.invalidate(user_id)
+        if self.backend is not None:
+            try:
+                self.backend.incr(f"user:{user_id}:gen")
+            except Exception as e:
+                log.error("User cache backend error: %s", e)
+                self._count("shared_errors")
+
+    def stats(self):
+        stats = self.local.stats()
+        with self._lock:
+            stats.update(self._stats)
+        stats["backend"] = type(self.backend).__name__ if self.backend is not None else None
+        return stats
+
+
+user_cache = UserCache(make_backend())
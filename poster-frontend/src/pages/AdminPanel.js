@@ -4,25 +4,29 @@ import React, { useEffect, useState } from 'react';
 const AdminPanel = ({ token }) => {
   const [users, setUsers] = useState([]);
   const [error, setError] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
 
-  // Fetch users on mount
-  useEffect(() => {
-    const fetchUsers = async () => {
-      try {
-        const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/admin/users`, {
-          headers: { 'Authorization': `Bearer ${token}` }
-        });
-        if (!response.ok) {
-          const errData = await response.json();
-          throw new Error(errData.error || 'Failed to fetch users');
-        }
-        const data = await response.json();
-        setUsers(data);
-      } catch (err) {
-        setError(err.message);
+  // Fetch one page of users; pass the previous page's cursor to load the next one
+  const fetchUsers = async (cursor = null) => {
+    try {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/admin/users${query}`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      if (!response.ok) {
+        const errData = await response.json();
+        throw new Error(errData.error || 'Failed to fetch users');
       }
-    };
+      const data = await response.json();
+      setUsers((prev) => (cursor ? [...prev, ...data.users] : data.users));
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      setError(err.message);
+    }
+  };
 
+  // Fetch users on mount
+  useEffect(() => {
     fetchUsers();
   }, [token]);
 
@@ -60,6 +64,7 @@ const AdminPanel = ({ token }) => {
           </li>
         ))}
       </ul>
+      {nextCursor && <button onClick={() => fetchUsers(nextCursor)}>Load more</button>}
     </div>
   );
 };
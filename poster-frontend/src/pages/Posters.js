@@ -1,6 +1,10 @@
 // src/pages/Posters.js
 import React, { useState, useEffect } from 'react';
 
+// How often, and for how long, to poll a background upload job before giving up
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_POLL_TIMEOUT_MS = 2 * 60 * 1000;
+
 const Posters = ({ token }) => {
   const [posters, setPosters] = useState([]);
   const [newTitle, setNewTitle] = useState('');
@@ -9,34 +13,103 @@ const Posters = ({ token }) => {
   const [selectedFile, setSelectedFile] = useState(null);
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [processing, setProcessing] = useState(false);
 
-  // Fetch posters on mount
-  useEffect(() => {
-    const fetchPosters = async () => {
-      try {
-        setLoading(true);
-        const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/posters`);
-        if (!response.ok) {
-          const errData = await response.json();
-          throw new Error(errData.error || 'Failed to load posters');
-        }
-        const data = await response.json();
-        setPosters(data);
-      } catch (err) {
-        setError(err.message);
-      } finally {
-        setLoading(false);
+  const [nextCursor, setNextCursor] = useState(null);
+
+  // Fetch one page of posters; pass the cursor from the previous page to load older ones
+  const fetchPosters = async (cursor = null) => {
+    try {
+      setLoading(true);
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/posters${query}`);
+      if (!response.ok) {
+        const errData = await response.json();
+        throw new Error(errData.error || 'Failed to load posters');
       }
-    };
+      const data = await response.json();
+      setPosters((prev) => (cursor ? [...prev, ...data.posters] : data.posters));
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
 
+  // Fetch posters on mount
+  useEffect(() => {
     fetchPosters();
   }, []);
 
-  // Handler to create a new poster with optional photo
-  const handleCreatePoster = async (event) => {
-    event.preventDefault();
-    setError(null);
+  const waitForPosterJob = async (statusUrl) => {
+    const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}${statusUrl}`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      const job = await response.json();
+      if (!response.ok) {
+        throw new Error(job.error || 'Failed to check upload status');
+      }
+      if (job.status === 'succeeded') {
+        return job.poster;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Failed to create poster');
+      }
+    }
+    throw new Error('The upload is taking longer than expected. The poster will appear in the list once it has been processed.');
+  };
 
+  // Direct upload: sign a PUT URL, send the photo straight to the bucket, then finalize.
+  // Returns null if the backend cannot sign URLs so the caller can fall back.
+  const createPosterDirect = async () => {
+    const backend = process.env.REACT_APP_BACKEND_URL;
+    const authHeaders = { 'Authorization': `Bearer ${token}` };
+    const urlResponse = await fetch(`${backend}/posters/upload-url`, {
+      method: 'POST',
+      headers: { ...authHeaders, 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        title: newTitle,
+        description: newDescription,
+        artist: newArtist,
+        filename: selectedFile.name,
+        content_type: selectedFile.type,
+        size: selectedFile.size,
+      }),
+    });
+    if (urlResponse.status === 503) {
+      return null;
+    }
+    const pending = await urlResponse.json();
+    if (!urlResponse.ok) {
+      throw new Error(pending.error || 'Failed to create poster');
+    }
+
+    const putResponse = await fetch(pending.upload_url, {
+      method: pending.upload_method,
+      headers: pending.upload_headers,
+      body: selectedFile,
+    });
+    if (!putResponse.ok) {
+      throw new Error('Failed to upload photo');
+    }
+
+    const finalizeResponse = await fetch(`${backend}${pending.finalize_url}`, {
+      method: 'POST',
+      headers: authHeaders,
+    });
+    const poster = await finalizeResponse.json();
+    if (!finalizeResponse.ok) {
+      throw new Error(poster.error || 'Failed to create poster');
+    }
+    return poster;
+  };
+
+  // Multipart upload through the backend, processed as a background job
+  const createPosterMultipart = async () => {
     const formData = new FormData();
     formData.append("title", newTitle);
     formData.append("description", newDescription);
@@ -45,22 +118,43 @@ const Posters = ({ token }) => {
       formData.append("photo", selectedFile);
     }
 
+    const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/posters/upload`, {
+      method: 'POST',
+      headers: {
+        'Authorization': token ? `Bearer ${token}` : ''
+      },
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const errData = await response.json();
+      throw new Error(errData.error || 'Failed to create poster');
+    }
+
+    // The upload is processed in the background; poll the job until the poster exists
+    const { status_url: statusUrl } = await response.json();
+    setProcessing(true);
     try {
-      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/posters/upload`, {
-        method: 'POST',
-        headers: {
-          'Authorization': token ? `Bearer ${token}` : ''
-        },
-        body: formData,
-      });
+      return await waitForPosterJob(statusUrl);
+    } finally {
+      setProcessing(false);
+    }
+  };
 
-      if (!response.ok) {
-        const errData = await response.json();
-        throw new Error(errData.error || 'Failed to create poster');
-      }
+  // Handler to create a new poster with optional photo
+  const handleCreatePoster = async (event) => {
+    event.preventDefault();
+    setError(null);
 
-      const createdPoster = await response.json();
-      setPosters([...posters, createdPoster]);
+    try {
+      let createdPoster = null;
+      if (selectedFile) {
+        createdPoster = await createPosterDirect();
+      }
+      if (!createdPoster) {
+        createdPoster = await createPosterMultipart();
+      }
+      setPosters((prev) => [createdPoster, ...prev]);
       setNewTitle('');
       setNewDescription('');
       setNewArtist('');
@@ -74,6 +168,7 @@ const Posters = ({ token }) => {
     <div>
       <h2>Posters</h2>
       {loading && <p>Loading posters...</p>}
+      {processing && <p>Processing upload...</p>}
       {error && <p style={{ color: 'red' }}>Error: {error}</p>}
 
       <ul>
@@ -82,12 +177,22 @@ const Posters = ({ token }) => {
             <strong>{poster.title}</strong> by <em>{poster.artist}</em> - {poster.description}
             {poster.photo_url && (
               <div>
-                <img src={poster.photo_url} alt={poster.title} style={{ maxWidth: '200px' }} />
+                <picture>
+                  {poster.srcset && Object.entries(poster.srcset).map(([type, srcSet]) => (
+                    <source key={type} type={type} srcSet={srcSet} sizes="200px" />
+                  ))}
+                  <img src={poster.photo_url} alt={poster.title} loading="lazy" style={{ maxWidth: '200px' }} />
+                </picture>
               </div>
             )}
           </li>
         ))}
       </ul>
+      {nextCursor && (
+        <button onClick={() => fetchPosters(nextCursor)} disabled={loading}>
+          Load more
+        </button>
+      )}
 
       <h3>Create a New Poster</h3>
       <form onSubmit={handleCreatePoster}>